@@ -0,0 +1,2 @@
+# Print what is read from the map files as it is read.
+debug = False
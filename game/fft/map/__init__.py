@@ -200,6 +200,60 @@ class Background(object):
         return pack('6B', *(background.color1 + background.color2))
 
 
+class Texture_Animation(object):
+    # The layout of these instructions is not documented anywhere we
+    # know of. This reading of it is a best guess: six words giving the
+    # destination and source in VRAM (x in 16 bit units, so 4 texels, the
+    # texture's four pages side by side), then a mode, a frame count and
+    # a frame duration in game frames. Mode 3 is taken to cycle palettes
+    # instead, destination x being the palette and source x the first
+    # palette of the cycle.
+    TEXTURE_LOOP = 0x01
+    TEXTURE_PING_PONG = 0x02
+    PALETTE_LOOP = 0x03
+
+    def __init__(self):
+        self.mode = None
+        self.frames = None
+        self.duration = None
+        self.page = None
+        self.x = None
+        self.y = None
+        self.width = None
+        self.height = None
+        self.source_page = None
+        self.source_x = None
+        self.source_y = None
+        self.palette = None
+        self.source_palette = None
+
+    def from_data(self, data):
+        (x, y, width, height, source_x, source_y) = unpack('<6H', data[0:12])
+        (self.mode, self.frames, unknown, self.duration) = unpack('4B', data[14:18])
+        if self.mode == self.PALETTE_LOOP:
+            self.palette = x & 0xf
+            self.source_palette = source_x & 0xf
+        else:
+            self.page = (x / 64) % 4
+            self.x = (x % 64) * 4
+            self.y = y % 256
+            self.width = width * 4
+            self.height = height
+            self.source_page = (source_x / 64) % 4
+            self.source_x = (source_x % 64) * 4
+            self.source_y = source_y % 256
+
+    def is_palette(self):
+        return self.mode == self.PALETTE_LOOP
+
+    def is_valid(self):
+        if not self.frames or not self.duration:
+            return False
+        if self.is_palette():
+            return True
+        return self.width > 0 and self.height > 0 and self.mode in (self.TEXTURE_LOOP, self.TEXTURE_PING_PONG)
+
+
 class Tile(object):
     def __init__(self):
         self.unknown1 = None
@@ -421,6 +475,24 @@ class Map(object):
             polygon.from_data(point, visangle, unknown5=unknown)
             yield polygon
 
+    def get_texture_animations(self):
+        for data in self.resources.get_texture_anim():
+            animation = Texture_Animation()
+            animation.from_data(data)
+            if animation.is_valid():
+                yield animation
+
+    def get_animated_meshes(self):
+        # The animated meshes are stored like the primary mesh, one chunk
+        # each from 0x90 to 0xac.
+        for toc_index in range(0x90, 0xb0, 4):
+            if not self.resources.has_chunk(toc_index):
+                continue
+            yield (list(self.get_tex_3gon(toc_index))
+                    + list(self.get_tex_4gon(toc_index))
+                    + list(self.get_untex_3gon(toc_index))
+                    + list(self.get_untex_4gon(toc_index)))
+
     def get_color_palettes(self):
         palettes = self.resources.get_color_palettes()
         for palette_data in palettes:
@@ -466,6 +538,9 @@ class Map(object):
         texture_data = tex.to_data(texture)
         self.texture.write(texture_data)
 
+    def put_texture_data(self, texture_data):
+        self.texture.write(texture_data)
+
     def put_polygons(self, polygons):
         self.resources.put_polygons(polygons)
 
@@ -3,6 +3,8 @@ from struct import pack, unpack
 from math import ceil
 from datetime import datetime
 
+import fft
+
 
 class Resource(object):
     def __init__(self):
@@ -31,7 +33,8 @@ class Resource(object):
                     end = toc[j]
                     break
             self.chunks[i] = data[begin:end]
-            print i, self.file_path, begin, end
+            if fft.debug:
+                print i, self.file_path, begin, end
         self.toc = toc
 
     def write(self):
@@ -282,6 +285,24 @@ class Resources(object):
         offset = 0
         return data
 
+    def has_chunk(self, toc_offset):
+        resource = self.chunks[toc_offset / 4]
+        return resource is not None and bool(resource.chunks[toc_offset / 4])
+
+    def get_texture_anim(self, toc_offset=0x6c):
+        # 32 instructions of 20 bytes each
+        if not self.has_chunk(toc_offset):
+            return
+        resource = self.chunks[toc_offset / 4]
+        data = resource.chunks[toc_offset / 4]
+        offset = 0
+        for i in range(32):
+            record = data[offset:offset+20]
+            if len(record) < 20:
+                break
+            yield record
+            offset += 20
+
     def get_gray_palettes(self, toc_offset=0x7c):
         resource = self.chunks[toc_offset / 4]
         data = resource.chunks[toc_offset / 4]
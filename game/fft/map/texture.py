@@ -1,3 +1,6 @@
+import fft
+
+
 class Texture(object):
     def __init__(self):
         self.file_path = None
@@ -10,7 +13,8 @@ class Texture(object):
             self.file = open(self.file_path, 'rb')
             self.data = self.file.read()
             break
-        print 'tex', self.file_path
+        if fft.debug:
+            print 'tex', self.file_path
         self.file.close()
 
     def write(self, data):
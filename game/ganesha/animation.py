@@ -0,0 +1,219 @@
+# Plays the map's texture, palette and mesh animations in the viewer.
+#
+# Nothing is rebuilt while playing. Texture animations copy rows of their
+# source frames over the destination rows of every strip's RAM image,
+# palette animations point the polygons that use the animated palette at
+# another palette's strip, and mesh animations show one of a set of
+# polygon frames built once, when playback first starts.
+
+from ganesha import counters
+
+# The game runs its animations at 30 frames a second.
+GAME_FPS = 30
+# Game frames each mesh animation frame is shown for. The mesh chunks hold
+# no timing that we know of, so this is a guess.
+MESH_FRAME_DURATION = 4
+TEXTURE_HEIGHT = 1024
+PAGE_SIZE = 256
+# Bytes in one row of the texture file; two texels per byte
+ROW_BYTES = 128
+
+
+def frame_order(frames, ping_pong=False):
+	# Frame numbers in the order they are shown over one cycle.
+	order = range(frames)
+	if ping_pong and frames > 2:
+		order += range(frames - 2, 0, -1)
+	return order
+
+
+class Animator(object):
+	def __init__(self, world):
+		self.world = world
+		self.playing = False
+		self.start_time = None
+		self.game_frame = None
+		# Cycle position last shown by each animation
+		self.shown = {}
+		# (animation index, strip, frame) -> list of (offset, BGRA data)
+		# of the rows to write into the strip's RAM image. Frame None is
+		# the destination as it is in the texture.
+		self.rows = {}
+		# palette -> the polygons using it, for the animated palettes;
+		# found once when playback starts.
+		self.palette_polygons = {}
+		self.node_path = None
+
+	def start(self):
+		if self.playing:
+			return
+		world = self.world
+		if not (world.texture_anim or world.palette_anim or world.polygon_anim):
+			print 'This map has no animations.'
+			return
+		self.rows = {}
+		self.shown = {}
+		self.game_frame = None
+		self.find_palette_polygons()
+		self.build_meshes()
+		self.start_time = globalClock.getFrameTime()
+		self.playing = True
+		taskMgr.add(self.task, 'animation')
+
+	def stop(self):
+		if not self.playing:
+			return
+		taskMgr.remove('animation')
+		self.playing = False
+		world = self.world
+		texture = world.texture
+		for i in range(len(world.texture_anim)):
+			for strip in texture.strips.keys():
+				self.put_rows(i, strip, None)
+		for polygons in self.palette_polygons.values():
+			for polygon in polygons:
+				polygon.update_texture()
+		if self.node_path is not None:
+			self.node_path.hide()
+		self.rows = {}
+		self.palette_polygons = {}
+
+	def toggle(self):
+		if self.playing:
+			self.stop()
+		else:
+			self.start()
+
+	def clear(self):
+		# Forgets everything built for the map read before.
+		self.stop()
+		# The frame polygons remove their own node paths first.
+		self.world.animated_polygons = None
+		if self.node_path is not None:
+			self.node_path.remove()
+			self.node_path = None
+
+	def build_meshes(self):
+		# The polygons of each mesh frame, with no handle so they cannot be
+		# picked or edited, are built once under a node of their own.
+		world = self.world
+		if self.node_path is not None:
+			self.node_path.show()
+			return
+		from ganesha.world import Polygon
+		self.node_path = world.node_path_mesh.attachNewNode('animation')
+		world.animated_polygons = []
+		for frame_data in world.polygon_anim:
+			frame_node_path = self.node_path.attachNewNode('frame')
+			frame_node_path.hide()
+			polygons = []
+			for polygon_data in frame_data:
+				polygon = Polygon(world)
+				polygon.from_data(polygon_data)
+				polygon.node_path.reparentTo(frame_node_path)
+				polygons.append(polygon)
+			world.animated_polygons.append((frame_node_path, polygons))
+
+	def find_palette_polygons(self):
+		self.palette_polygons = {}
+		for animation in self.world.palette_anim:
+			self.palette_polygons[animation.palette] = []
+		for polygon in self.world.polygons:
+			if polygon.source.A.texcoord is not None and polygon.palette in self.palette_polygons:
+				self.palette_polygons[polygon.palette].append(polygon)
+
+	def task(self, task):
+		game_frame = int((globalClock.getFrameTime() - self.start_time) * GAME_FPS)
+		if game_frame == self.game_frame:
+			return task.cont
+		self.game_frame = game_frame
+		self.play_textures(game_frame)
+		self.play_palettes(game_frame)
+		self.play_meshes(game_frame)
+		return task.cont
+
+	def cycle_position(self, key, game_frame, duration, order):
+		# The frame to show now, or None when it is already shown.
+		frame = order[(game_frame / duration) % len(order)]
+		if self.shown.get(key) == frame:
+			return None
+		self.shown[key] = frame
+		return frame
+
+	def play_textures(self, game_frame):
+		world = self.world
+		for i, animation in enumerate(world.texture_anim):
+			order = frame_order(animation.frames, animation.mode == animation.TEXTURE_PING_PONG)
+			frame = self.cycle_position(('texture', i), game_frame, animation.duration, order)
+			if frame is None:
+				continue
+			for strip in world.texture.strips.keys():
+				self.put_rows(i, strip, frame)
+
+	def get_rows(self, i, strip, frame):
+		# Source frames are taken to follow each other down the source
+		# page, each as high as the destination.
+		key = (i, strip, frame)
+		try:
+			return self.rows[key]
+		except KeyError:
+			pass
+		animation = self.world.texture_anim[i]
+		texture = self.world.texture
+		pairs = texture.pairs[strip]
+		if frame is None:
+			(page, x, y) = (animation.page, animation.x, animation.y)
+		else:
+			(page, x, y) = (animation.source_page, animation.source_x, animation.source_y + frame * animation.height)
+		width = min(animation.width, PAGE_SIZE - x, PAGE_SIZE - animation.x)
+		rows = []
+		for row in range(animation.height):
+			source_y = page * PAGE_SIZE + y + row
+			dest_y = animation.page * PAGE_SIZE + animation.y + row
+			if source_y >= TEXTURE_HEIGHT or dest_y >= (animation.page + 1) * PAGE_SIZE:
+				break
+			begin = source_y * ROW_BYTES + x / 2
+			packed = texture.data[begin:begin+width/2]
+			data = ''.join(map(pairs.__getitem__, map(ord, packed)))
+			# The RAM image is BGRA with the bottom row first.
+			offset = ((TEXTURE_HEIGHT - 1 - dest_y) * PAGE_SIZE + animation.x) * 4
+			rows.append((offset, data))
+		self.rows[key] = rows
+		return rows
+
+	def put_rows(self, i, strip, frame):
+		if strip not in self.world.texture.pairs:
+			return
+		rows = self.get_rows(i, strip, frame)
+		ram_image = self.world.texture.strips[strip].modifyRamImage()
+		for (offset, data) in rows:
+			ram_image.setSubdata(offset, len(data), data)
+			counters.add('texture_upload_bytes', len(data))
+		counters.add('texture_uploads')
+
+	def play_palettes(self, game_frame):
+		world = self.world
+		texture = world.texture
+		for i, animation in enumerate(world.palette_anim):
+			frame = self.cycle_position(('palette', i), game_frame, animation.duration, frame_order(animation.frames))
+			if frame is None:
+				continue
+			strip = animation.source_palette + frame + 1
+			if strip >= len(texture.palettes):
+				continue
+			strip_texture = texture.get_strip(strip)
+			for polygon in self.palette_polygons[animation.palette]:
+				polygon.node_path.setTexture(strip_texture)
+
+	def play_meshes(self, game_frame):
+		frames = self.world.animated_polygons
+		if not frames:
+			return
+		frame = self.cycle_position('mesh', game_frame, MESH_FRAME_DURATION, frame_order(len(frames)))
+		if frame is None:
+			return
+		for i, (frame_node_path, polygons) in enumerate(frames):
+			if i == frame:
+				frame_node_path.show()
+			else:
+				frame_node_path.hide()
@@ -0,0 +1,71 @@
+# Work on many maps at once, without opening the editor.
+
+import os
+from glob import glob
+
+from fft.map import Map, GNS
+from ganesha.png import write_indexed, gray_colors, fft_colors
+from ganesha.texels import TexelUsage, polygon_uvs, PAGES
+
+
+def find_gns_files(paths):
+	# GNS files named on the command line, and those in named directories.
+	found = []
+	for path in paths:
+		if os.path.isdir(path):
+			names = glob(os.path.join(path, '*.GNS')) + glob(os.path.join(path, '*.gns'))
+			names.sort()
+			found.extend(names)
+		else:
+			found.append(path)
+	return found
+
+def export_textures(paths, out_dir):
+	# Writes every texture of every map once in gray and once with each of
+	# the palettes it is shown with, as indexed PNGs.
+	if not os.path.isdir(out_dir):
+		os.makedirs(out_dir)
+	written = {}
+	for gns_path in find_gns_files(paths):
+		gns_map = Map()
+		gns_map.gns = GNS()
+		gns_map.gns.read(gns_path)
+		for situation in range(len(gns_map.gns.situations)):
+			gns_map.set_situation(situation)
+			gns_map.read()
+			data = gns_map.texture.data
+			base_name = os.path.basename(gns_map.texture.file_path)
+			exports = [('', gray_colors())]
+			for i, palette in enumerate(gns_map.get_color_palettes()):
+				exports.append(('.palette_%u' % i, fft_colors(palette.colors)))
+			for suffix, colors in exports:
+				# Situations often share a texture and its palettes.
+				key = (gns_map.texture.file_path, tuple(colors))
+				if key in written:
+					continue
+				file_name = os.path.join(out_dir, '%s.%u%s.png' % (base_name, situation, suffix))
+				write_indexed(file_name, data, 256, 1024, colors)
+				written[key] = file_name
+				print 'Wrote', file_name
+	return len(written)
+
+def print_free_texels(paths, min_width=8, min_height=8):
+	# Lists the texture areas no polygon of each map situation uses.
+	for gns_path in find_gns_files(paths):
+		gns_map = Map()
+		gns_map.gns = GNS()
+		gns_map.gns.read(gns_path)
+		for situation in range(len(gns_map.gns.situations)):
+			gns_map.set_situation(situation)
+			gns_map.read()
+			items = {}
+			for i, polygon in enumerate(gns_map.get_polygons()):
+				uvs = polygon_uvs(polygon)
+				if uvs is not None:
+					items[i] = uvs
+			usage = TexelUsage()
+			usage.sync(items)
+			print '%s situation %u:' % (gns_path, situation)
+			for page in range(PAGES):
+				for (u, v, width, height) in usage.free_rectangles(page, min_width, min_height):
+					print '\tpage %u: %ux%u at (%u, %u)' % (page, width, height, u, v)
@@ -0,0 +1,83 @@
+# Finds texture blocks that hold the same texels as other blocks.
+#
+# The texture is cut into aligned size x size blocks. The bytes of each
+# block's rows, joined, are its key, so identical blocks land in the same
+# dict entry without comparing texels one by one. Polygons whose UVs lie
+# on copies can be moved onto the first copy, which leaves the other
+# copies unused.
+
+TEXTURE_WIDTH = 256
+TEXTURE_HEIGHT = 1024
+PAGE_SIZE = 256
+# Bytes in one row of the texture; two texels per byte
+ROW_BYTES = TEXTURE_WIDTH / 2
+DEFAULT_BLOCK_SIZE = 8
+
+
+def block_keys(data, size=DEFAULT_BLOCK_SIZE):
+	# Returns a dict of (x, y) of each block's top left texel -> key.
+	rows = [data[y*ROW_BYTES:(y+1)*ROW_BYTES] for y in range(TEXTURE_HEIGHT)]
+	step = size / 2
+	keys = {}
+	for y in range(0, TEXTURE_HEIGHT, size):
+		block_rows = rows[y:y+size]
+		for offset in range(0, ROW_BYTES, step):
+			keys[(offset * 2, y)] = ''.join([row[offset:offset+step] for row in block_rows])
+	return keys
+
+def find_duplicates(data, size=DEFAULT_BLOCK_SIZE):
+	# Returns (groups, reclaimable texels). Each group lists the blocks
+	# with the same texels, in texture order, as (x, y) with y counted
+	# over all four pages.
+	groups = {}
+	for position, key in block_keys(data, size).items():
+		groups.setdefault(key, []).append(position)
+	found = []
+	for positions in groups.values():
+		if len(positions) > 1:
+			positions.sort(key=lambda (x, y): (y, x))
+			found.append(positions)
+	found.sort()
+	reclaimable = sum([len(positions) - 1 for positions in found]) * size * size
+	return (found, reclaimable)
+
+def remap(polygons, data, size=DEFAULT_BLOCK_SIZE):
+	# polygons is a dict of key -> (page, list of (u, v)). Returns a dict of
+	# key -> (new page, new list of (u, v)) for the polygons that can move
+	# onto an earlier copy of every block they use.
+	keys = block_keys(data, size)
+	first = {}
+	for position in sorted(keys.keys(), key=lambda (x, y): (y, x)):
+		first.setdefault(keys[position], position)
+	moved = {}
+	for name, (page, uvs) in polygons.items():
+		us = [uv[0] for uv in uvs]
+		vs = [uv[1] + page * PAGE_SIZE for uv in uvs]
+		left = min(us) // size * size
+		top = min(vs) // size * size
+		right = max(us) // size * size
+		bottom = max(vs) // size * size
+		if left < 0 or top < 0 or right >= TEXTURE_WIDTH or bottom >= TEXTURE_HEIGHT:
+			continue
+		(x, y) = first[keys[(left, top)]]
+		(dx, dy) = (x - left, y - top)
+		if (dx, dy) == (0, 0):
+			continue
+		# All of the polygon has to fit on one page at the new place, and
+		# every block it uses has to be the same there.
+		if (top + dy) // PAGE_SIZE != (bottom + dy) // PAGE_SIZE or right + dx >= TEXTURE_WIDTH or bottom + dy >= TEXTURE_HEIGHT:
+			continue
+		same = True
+		for by in range(top, bottom + 1, size):
+			for bx in range(left, right + 1, size):
+				if keys[(bx, by)] != keys[(bx + dx, by + dy)]:
+					same = False
+					break
+			if not same:
+				break
+		if not same:
+			continue
+		new_page = (top + dy) // PAGE_SIZE
+		new_uvs = [(u + dx, v + page * PAGE_SIZE + dy - new_page * PAGE_SIZE) for (u, v) in uvs]
+		moved[name] = (new_page, new_uvs)
+	return moved
@@ -0,0 +1,16 @@
+# Counts of work done on the editor's hot paths, shown by the performance
+# HUD. Adding to a count is one dict update, so the world and UI code
+# count whether or not the HUD is shown.
+
+counts = {}
+
+
+def add(name, amount=1):
+	counts[name] = counts.get(name, 0) + amount
+
+def take():
+	# The counts since the last take; counting starts over.
+	global counts
+	taken = counts
+	counts = {}
+	return taken
@@ -0,0 +1,74 @@
+# Overlay in the Panda window with the frame time and the counts of
+# ganesha.counters, so the cost of an interaction shows while it happens.
+
+from ganesha import counters
+
+# Seconds between updates of the text
+UPDATE_INTERVAL = 0.5
+
+
+class PerformanceHUD(object):
+	def __init__(self):
+		self.text = None
+		self.shown = False
+		self.frames = 0
+		self.frame_time = 0.0
+		self.max_frame_time = 0.0
+		self.elapsed = 0.0
+
+	def toggle(self):
+		if self.shown:
+			self.hide()
+		else:
+			self.show()
+
+	def show(self):
+		if self.shown:
+			return
+		if self.text is None:
+			from direct.gui.OnscreenText import OnscreenText
+			from pandac.PandaModules import TextNode
+			self.text = OnscreenText(text='', pos=(-1.3, 0.9), scale=0.045, fg=(1, 1, 1, 1), bg=(0, 0, 0, 0.5), align=TextNode.ALeft, mayChange=True)
+		self.text.show()
+		self.shown = True
+		self.reset()
+		counters.take()
+		taskMgr.add(self.task, 'performance_hud', sort=60)
+
+	def hide(self):
+		if not self.shown:
+			return
+		taskMgr.remove('performance_hud')
+		self.text.hide()
+		self.shown = False
+
+	def reset(self):
+		self.frames = 0
+		self.frame_time = 0.0
+		self.max_frame_time = 0.0
+		self.elapsed = 0.0
+
+	def task(self, task):
+		dt = globalClock.getDt()
+		self.frames += 1
+		self.frame_time += dt
+		self.max_frame_time = max(self.max_frame_time, dt)
+		self.elapsed += dt
+		if self.elapsed >= UPDATE_INTERVAL:
+			self.update_text(counters.take())
+			self.reset()
+		return task.cont
+
+	def update_text(self, counts):
+		frames = float(self.frames)
+		seconds = self.elapsed
+		get = counts.get
+		lines = [
+			'Frame time   %6.2f ms avg  %6.2f ms max' % (self.frame_time / frames * 1000, self.max_frame_time * 1000),
+			'Picks        %6.2f /frame  %6.2f skipped /frame' % (get('picks', 0) / frames, get('picks_skipped', 0) / frames),
+			'Nodes        %6.1f made /s  %6.1f removed /s' % (get('nodes_created', 0) / seconds, get('nodes_destroyed', 0) / seconds),
+			'Scene nodes  %6u' % render.countNumDescendants(),
+			'wx events    %6.2f /frame' % (get('wx_events', 0) / frames),
+			'Uploads      %6.1f /s  %8.1f KB/s' % (get('texture_uploads', 0) / seconds, get('texture_upload_bytes', 0) / 1024.0 / seconds),
+		]
+		self.text.setText('\n'.join(lines))
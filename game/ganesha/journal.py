@@ -0,0 +1,157 @@
+# Undo and redo for map edits.
+#
+# Every edit is recorded as one or more deltas: a function that knows how
+# to write some part of the map, the keys it touched (polygon handles,
+# tile coordinates, palette numbers, texture rows...) and the old and new
+# values for just those keys. Undoing writes the old values back, redoing
+# writes the new ones, so both cost as much as the edit itself.
+
+# Rough byte count the journal may hold before it forgets the oldest edits.
+DEFAULT_MEMORY_LIMIT = 16 * 1024 * 1024
+
+
+class Delta(object):
+	def __init__(self, apply, keys, old_values, new_values, cost):
+		self.apply = apply
+		self.keys = keys
+		self.old_values = old_values
+		self.new_values = new_values
+		# Estimated bytes per value
+		self.cost = cost
+
+	def get_size(self):
+		return len(self.keys) * self.cost * 2
+	size = property(get_size)
+
+
+class Entry(object):
+	def __init__(self, name):
+		self.name = name
+		self.deltas = []
+
+	def get_size(self):
+		size = 0
+		for delta in self.deltas:
+			size += delta.size
+		return size
+	size = property(get_size)
+
+	def undo(self):
+		for i in range(len(self.deltas) - 1, -1, -1):
+			delta = self.deltas[i]
+			delta.apply(delta.keys, delta.old_values)
+
+	def redo(self):
+		for delta in self.deltas:
+			delta.apply(delta.keys, delta.new_values)
+
+
+class Journal(object):
+	def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT):
+		self.memory_limit = memory_limit
+		self.undo_entries = []
+		self.redo_entries = []
+		self.size = 0
+		self.group = None
+		self.group_depth = 0
+		# Set while undoing or redoing, so the edits those make are not
+		# recorded again.
+		self.replaying = False
+
+	def clear(self):
+		self.undo_entries = []
+		self.redo_entries = []
+		self.size = 0
+		self.group = None
+		self.group_depth = 0
+
+	def set_memory_limit(self, memory_limit):
+		self.memory_limit = memory_limit
+		self.trim()
+
+	# Everything recorded between begin and end is undone as one edit.
+	# Calls can nest; only the outermost pair counts.
+	def begin(self, name):
+		if self.group_depth == 0:
+			self.group = Entry(name)
+		self.group_depth += 1
+
+	def end(self):
+		self.group_depth -= 1
+		if self.group_depth == 0:
+			entry = self.group
+			self.group = None
+			if entry.deltas:
+				self.push(entry)
+
+	def record(self, name, apply, keys, old_values, new_values, cost=64, merge=False):
+		# apply(keys, values) must write values for keys back into the map.
+		# With merge, an edit of the same keys as the last one (a slider
+		# being dragged, say) extends it instead of adding a new step.
+		if self.replaying:
+			return
+		changed = [i for i in range(len(keys)) if old_values[i] != new_values[i]]
+		if not changed:
+			return
+		if len(changed) < len(keys):
+			keys = [keys[i] for i in changed]
+			old_values = [old_values[i] for i in changed]
+			new_values = [new_values[i] for i in changed]
+		if merge and self.group is None and not self.redo_entries and self.undo_entries:
+			last = self.undo_entries[-1]
+			if last.name == name and len(last.deltas) == 1:
+				delta = last.deltas[0]
+				if delta.apply == apply and delta.keys == keys:
+					delta.new_values = new_values
+					return
+		delta = Delta(apply, keys, old_values, new_values, cost)
+		if self.group is not None:
+			self.group.deltas.append(delta)
+		else:
+			entry = Entry(name)
+			entry.deltas.append(delta)
+			self.push(entry)
+
+	def push(self, entry):
+		for old_entry in self.redo_entries:
+			self.size -= old_entry.size
+		self.redo_entries = []
+		self.undo_entries.append(entry)
+		self.size += entry.size
+		self.trim()
+
+	def trim(self):
+		# The newest edit is always kept, however big it is.
+		while self.size > self.memory_limit and len(self.undo_entries) > 1:
+			entry = self.undo_entries.pop(0)
+			self.size -= entry.size
+
+	def can_undo(self):
+		return len(self.undo_entries) > 0
+
+	def can_redo(self):
+		return len(self.redo_entries) > 0
+
+	def undo(self):
+		if not self.undo_entries:
+			return None
+		entry = self.undo_entries.pop()
+		self.replaying = True
+		try:
+			entry.undo()
+		finally:
+			self.replaying = False
+		self.redo_entries.append(entry)
+		return entry.name
+
+	def redo(self):
+		if not self.redo_entries:
+			return None
+		entry = self.redo_entries.pop()
+		self.replaying = True
+		try:
+			entry.redo()
+		finally:
+			self.replaying = False
+		self.undo_entries.append(entry)
+		return entry.name
@@ -0,0 +1,100 @@
+# Finds room on the texture pages for UV rectangles.
+#
+# Each page is searched straight from its coverage: a row of flags per
+# texel row, set where the texel is used. For every row the search keeps
+# how many texels from each u on are free, and counts down the page how
+# many rows in a row have room for the width wanted; the first place
+# where that count reaches the height wanted is taken. Placed rectangles
+# are marked used, so later ones do not land on them.
+
+PAGE_SIZE = 256
+PAGES = 4
+
+
+def uv_rect(uvs):
+	# The texels a polygon's UVs span, as (x, y, width, height)
+	us = [uv[0] for uv in uvs]
+	vs = [uv[1] for uv in uvs]
+	return (min(us), min(vs), max(us) - min(us) + 1, max(vs) - min(vs) + 1)
+
+def fit_uvs(uvs, rect):
+	# Moves and scales the UVs so they span rect instead.
+	(old_x, old_y, old_width, old_height) = uv_rect(uvs)
+	(x, y, width, height) = rect
+	fitted = []
+	for (u, v) in uvs:
+		if old_width > 1:
+			u = x + int(round((u - old_x) * (width - 1) / float(old_width - 1)))
+		else:
+			u = x
+		if old_height > 1:
+			v = y + int(round((v - old_y) * (height - 1) / float(old_height - 1)))
+		else:
+			v = y
+		fitted.append((u, v))
+	return fitted
+
+def free_runs(row):
+	# For each u, how many texels from u on are free
+	runs = [0] * (PAGE_SIZE + 1)
+	for u in range(PAGE_SIZE - 1, -1, -1):
+		if not row[u]:
+			runs[u] = runs[u + 1] + 1
+	return runs[:PAGE_SIZE]
+
+
+class CoverageBin(object):
+	def __init__(self, used):
+		# used is the page's rows of flags, set on used texels.
+		self.used = [list(row) for row in used]
+		self.runs = [free_runs(row) for row in self.used]
+
+	def find(self, width, height):
+		# The topmost, then leftmost, place for a width x height rectangle,
+		# as (x, y), or None when it does not fit.
+		if width > PAGE_SIZE or height > PAGE_SIZE:
+			return None
+		# Rows in a row, down to the current one, with room at each u
+		counts = [0] * PAGE_SIZE
+		for v, runs in enumerate(self.runs):
+			counts = [(count + 1) * (run >= width) for (count, run) in zip(counts, runs)]
+			if max(counts) >= height:
+				for u, count in enumerate(counts):
+					if count >= height:
+						return (u, v - height + 1)
+		return None
+
+	def occupy(self, rect):
+		(x, y, width, height) = rect
+		for v in range(y, y + height):
+			row = self.used[v]
+			row[x:x+width] = [1] * width
+			self.runs[v] = free_runs(row)
+
+
+def pack(sizes, used):
+	# sizes is a dict of key -> (width, height) and used a dict of page ->
+	# rows of flags set on the texels already taken. Returns a dict of key
+	# -> (page, x, y) for every rectangle that fits; the biggest go first,
+	# each to the page where it lands nearest the top.
+	bins = []
+	for page in range(PAGES):
+		if page in used:
+			bins.append(CoverageBin(used[page]))
+		else:
+			bins.append(CoverageBin([[0] * PAGE_SIZE for v in range(PAGE_SIZE)]))
+	order = sizes.items()
+	order.sort(key=lambda (key, (width, height)): (width * height, max(width, height)), reverse=True)
+	placed = {}
+	for key, (width, height) in order:
+		best = None
+		for page, page_bin in enumerate(bins):
+			found = page_bin.find(width, height)
+			if found is not None and (best is None or found[1] < best[0][1]):
+				best = (found, page)
+		if best is None:
+			continue
+		((x, y), page) = best
+		bins[page].occupy((x, y, width, height))
+		placed[key] = (page, x, y)
+	return placed
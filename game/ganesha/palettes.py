@@ -0,0 +1,30 @@
+# Finds palettes of a map that are the same, or close enough, as an
+# earlier one.
+
+
+def palette_distance(a, b):
+	# The biggest difference of any channel of any color, or None when the
+	# palettes differ in which colors are transparent.
+	distance = 0
+	for (r1, g1, b1, a1), (r2, g2, b2, a2) in zip(a, b):
+		if a1 != a2:
+			return None
+		distance = max(distance, abs(r1 - r2), abs(g1 - g2), abs(b1 - b2))
+	return distance
+
+def merge_palettes(palettes, tolerance=0):
+	# palettes is a list of color lists, colors being 5 bit (r, g, b, a).
+	# Returns a dict of palette index -> index of the earlier palette it
+	# can be replaced with, no channel of any color being more than
+	# tolerance apart.
+	merged = {}
+	kept = []
+	for i, palette in enumerate(palettes):
+		for j in kept:
+			distance = palette_distance(palettes[j], palette)
+			if distance is not None and distance <= tolerance:
+				merged[i] = j
+				break
+		else:
+			kept.append(i)
+	return merged
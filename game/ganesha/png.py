@@ -0,0 +1,198 @@
+# Reads and writes the map texture as an indexed PNG.
+#
+# The texture file holds two 4 bit palette indexes per byte, the left pixel
+# in the low nibble. An indexed PNG with a bit depth of 4 holds the same
+# bytes with the nibbles swapped, so converting between the two is one
+# string translate plus a filter byte per row, and no pixel loops. Other
+# 8 bit images can be read as RGBA pixels to be quantized.
+
+import struct
+import zlib
+
+PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+# Colour types
+GRAY = 0
+RGB = 2
+INDEXED = 3
+GRAY_ALPHA = 4
+RGBA = 6
+# Bytes per pixel of each colour type at 8 bits per channel
+channels = {GRAY: 1, RGB: 3, INDEXED: 1, GRAY_ALPHA: 2, RGBA: 4}
+
+# Swaps the two nibbles of every byte.
+swap_nibbles = ''.join([chr(((i & 0xf) << 4) | (i >> 4)) for i in range(256)])
+
+
+class PNGError(Exception):
+	pass
+
+
+def gray_colors():
+	# The gray palette the editor shows textures with.
+	return [(i * 17, i * 17, i * 17) for i in range(16)]
+
+def fft_colors(colors):
+	# PNG colors for a map palette, whose channels are 5 bit.
+	return [(r * 255 // 31, g * 255 // 31, b * 255 // 31) for (r, g, b, a) in colors]
+
+def make_chunk(kind, data):
+	crc = zlib.crc32(kind + data) & 0xffffffff
+	return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', crc)
+
+def write_indexed(file_name, data, width, height, colors):
+	# data is 4 bit texture data, width * height / 2 bytes.
+	row_bytes = width // 2
+	data = data.translate(swap_nibbles)
+	rows = [data[y*row_bytes:(y+1)*row_bytes] for y in range(height)]
+	# Filter type 0 in front of every row
+	raw = '\x00' + '\x00'.join(rows)
+	palette = ''.join([struct.pack('3B', *color) for color in colors])
+	png = [
+		PNG_SIGNATURE,
+		make_chunk('IHDR', struct.pack('>IIBBBBB', width, height, 4, INDEXED, 0, 0, 0)),
+		make_chunk('PLTE', palette),
+		make_chunk('IDAT', zlib.compress(raw)),
+		make_chunk('IEND', ''),
+	]
+	f = open(file_name, 'wb')
+	f.write(''.join(png))
+	f.close()
+
+# Two one byte indexes -> one byte of texture data
+nibble_pairs = {}
+for low in range(16):
+	for high in range(16):
+		nibble_pairs[chr(low) + chr(high)] = chr(low | (high << 4))
+
+def pack_nibbles(raw):
+	# raw holds one palette index per byte. Packs each pair of them into one
+	# byte, the left one in the low nibble.
+	return ''.join([nibble_pairs[raw[i:i+2]] for i in xrange(0, len(raw), 2)])
+
+def read_chunks(png):
+	if png[:8] != PNG_SIGNATURE:
+		raise PNGError('Not a PNG file')
+	offset = 8
+	while offset + 8 <= len(png):
+		(length, kind) = struct.unpack('>I4s', png[offset:offset+8])
+		yield (kind, png[offset+8:offset+8+length])
+		offset += length + 12
+		if kind == 'IEND':
+			break
+
+def unfilter(raw, row_bytes, height, pixel_bytes):
+	# Undoes the PNG row filters. Rows with filter type 0, which is what
+	# write_indexed uses, are taken as they are.
+	rows = []
+	previous = [0] * row_bytes
+	stride = row_bytes + 1
+	for y in range(height):
+		kind = ord(raw[y*stride])
+		line = raw[y*stride+1:(y+1)*stride]
+		if kind == 0:
+			rows.append(line)
+			previous = None
+			continue
+		if previous is None:
+			previous = map(ord, rows[-1])
+		current = map(ord, line)
+		for x in range(row_bytes):
+			if x >= pixel_bytes:
+				left = current[x - pixel_bytes]
+			else:
+				left = 0
+			up = previous[x]
+			if kind == 1:
+				current[x] = (current[x] + left) & 0xff
+			elif kind == 2:
+				current[x] = (current[x] + up) & 0xff
+			elif kind == 3:
+				current[x] = (current[x] + ((left + up) >> 1)) & 0xff
+			elif kind == 4:
+				if x >= pixel_bytes:
+					corner = previous[x - pixel_bytes]
+				else:
+					corner = 0
+				p = left + up - corner
+				pa = abs(p - left)
+				pb = abs(p - up)
+				pc = abs(p - corner)
+				if pa <= pb and pa <= pc:
+					current[x] = (current[x] + left) & 0xff
+				elif pb <= pc:
+					current[x] = (current[x] + up) & 0xff
+				else:
+					current[x] = (current[x] + corner) & 0xff
+			else:
+				raise PNGError('Unknown filter type %u' % kind)
+		rows.append(''.join(map(chr, current)))
+		previous = current
+	return ''.join(rows)
+
+def read_file(file_name):
+	# Returns (width, height, bit depth, colour type, chunks), chunks being
+	# a dict of chunk type -> list of chunk data.
+	f = open(file_name, 'rb')
+	png = f.read()
+	f.close()
+	chunks = {'IDAT': []}
+	for kind, chunk in read_chunks(png):
+		chunks.setdefault(kind, []).append(chunk)
+	if 'IHDR' not in chunks:
+		raise PNGError('No IHDR chunk')
+	(width, height, depth, color_type, compression, filter_method, interlace) = struct.unpack('>IIBBBBB', chunks['IHDR'][0])
+	if interlace:
+		raise PNGError('Interlaced images are not supported')
+	return (width, height, depth, color_type, chunks)
+
+def read_indexed(file_name):
+	# Returns (width, height, data) with data as 4 bit texture data. Reads
+	# indexed images with 4 or 8 bits per pixel and gray images with 4 or
+	# 8 bits, taking gray levels as the indexes of the gray palette.
+	# Anything else raises PNGError.
+	(width, height, depth, color_type, chunks) = read_file(file_name)
+	if color_type not in (GRAY, INDEXED) or depth not in (4, 8):
+		raise PNGError('Not a 4 or 8 bit indexed or gray image')
+	if width % 2:
+		raise PNGError('Width must be even')
+	row_bytes = (width * depth + 7) // 8
+	raw = unfilter(zlib.decompress(''.join(chunks['IDAT'])), row_bytes, height, 1)
+	if depth == 4:
+		# Indexes, or gray levels that are the gray palette's indexes.
+		return (width, height, raw.translate(swap_nibbles))
+	if color_type == GRAY:
+		# Gray levels 0 to 255 to indexes 0 to 15
+		levels = ''.join([chr(i * 15 // 255) for i in range(256)])
+	else:
+		levels = ''.join([chr(i & 0xf) for i in range(256)])
+	return (width, height, pack_nibbles(raw.translate(levels)))
+
+def read_rgba(file_name):
+	# Returns (width, height, pixels) with pixels as a list of (r, g, b, a)
+	# tuples, row by row. Reads every 8 bit colour type.
+	(width, height, depth, color_type, chunks) = read_file(file_name)
+	if depth != 8:
+		raise PNGError('Only 8 bit images are supported')
+	pixel_bytes = channels[color_type]
+	raw = unfilter(zlib.decompress(''.join(chunks['IDAT'])), width * pixel_bytes, height, pixel_bytes)
+	if color_type == INDEXED:
+		palette = map(ord, chunks['PLTE'][0])
+		alphas = map(ord, ''.join(chunks.get('tRNS', [])))
+		colors = []
+		for i in range(len(palette) // 3):
+			if i < len(alphas):
+				a = alphas[i]
+			else:
+				a = 255
+			colors.append((palette[i*3], palette[i*3+1], palette[i*3+2], a))
+		colors.extend([(0, 0, 0, 255)] * (256 - len(colors)))
+		return (width, height, map(colors.__getitem__, map(ord, raw)))
+	# Each channel is every pixel_bytes-th byte; zip puts them together.
+	planes = [map(ord, raw[i::pixel_bytes]) for i in range(pixel_bytes)]
+	if color_type == GRAY:
+		planes = planes * 3 + [[255] * len(planes[0])]
+	elif color_type == GRAY_ALPHA:
+		planes = [planes[0]] * 3 + [planes[1]]
+	elif color_type == RGB:
+		planes.append([255] * len(planes[0]))
+	return (width, height, zip(*planes))
@@ -0,0 +1,115 @@
+# Times the phases of opening and saving a map.
+#
+# Nothing here runs unless enable is called: it wraps the methods listed
+# in PHASES so that each call is timed, and writes the calls out as
+# Chrome trace events (chrome://tracing, or any viewer of that format)
+# when the program exits. Optionally each outermost phase is also run
+# under cProfile and its stats dumped to a file of its own.
+
+import os
+import time
+import atexit
+from types import GeneratorType
+
+# (module, class, method, phase name). Editor phases need Panda, so they
+# are only timed in the editor.
+MAP_PHASES = [
+	('fft.map.gns', 'GNS', 'read', 'GNS.read'),
+	('fft.map.texture', 'Texture', 'read', 'Texture_File.read'),
+	('fft.map.resource', 'Resources', 'read', 'Resources.read'),
+	('fft.map', 'Map', 'get_polygons', 'Polygon decode'),
+	('fft.map.resource', 'Resources', 'put_polygons', 'Resources.put_polygons'),
+	('fft.map.resource', 'Resources', 'put_palettes', 'Resources.put_palettes'),
+	('fft.map.resource', 'Resources', 'put_dir_lights', 'Resources.put_dir_lights'),
+	('fft.map.resource', 'Resources', 'put_terrain', 'Resources.put_terrain'),
+	('fft.map.resource', 'Resources', 'put_visible_angles', 'Resources.put_visible_angles'),
+	('fft.map.resource', 'Resource', 'write', 'Resource.write'),
+]
+EDITOR_PHASES = [
+	('ganesha.world', 'World', 'read', 'World.read'),
+	('ganesha.world', 'World', 'write', 'World.write'),
+	('ganesha.world', 'Texture', 'from_data', 'Texture.from_data'),
+	('ganesha.world', 'Texture', 'update', 'Texture.update'),
+	('ganesha.world', 'World', 'get_polygons', 'World.get_polygons'),
+	('ganesha.world', 'Terrain', 'init_node_path', 'Terrain.init_node_path'),
+]
+
+
+def json_string(text):
+	return '"%s"' % text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Profiler(object):
+	def __init__(self, trace_path, stats_dir=None):
+		self.trace_path = trace_path
+		self.stats_dir = stats_dir
+		self.start_time = time.time()
+		# (name, start, duration) of every finished phase, in microseconds
+		self.events = []
+		self.depth = 0
+		self.stats_count = 0
+
+	def instrument(self, phases):
+		for (module_name, class_name, method_name, name) in phases:
+			module = __import__(module_name, globals(), locals(), [class_name])
+			cls = getattr(module, class_name)
+			setattr(cls, method_name, self.wrap(getattr(cls, method_name), name))
+
+	def wrap(self, method, name):
+		profiler = self
+		def timed(*args, **kwargs):
+			return profiler.call(name, method, args, kwargs)
+		timed.__name__ = method.__name__
+		timed.__doc__ = method.__doc__
+		return timed
+
+	def call(self, name, method, args, kwargs):
+		profile = None
+		if self.stats_dir is not None and self.depth == 0:
+			# cProfile cannot nest, so only outermost phases get their own.
+			import cProfile
+			profile = cProfile.Profile()
+		self.depth += 1
+		start = time.time()
+		try:
+			if profile is not None:
+				result = profile.runcall(method, *args, **kwargs)
+			else:
+				result = method(*args, **kwargs)
+			# A generator's work is done as it is iterated, so it is
+			# iterated here, inside the phase.
+			if isinstance(result, GeneratorType):
+				result = list(result)
+		finally:
+			end = time.time()
+			self.depth -= 1
+			self.events.append((name, (start - self.start_time) * 1e6, (end - start) * 1e6))
+			if profile is not None:
+				self.stats_count += 1
+				file_name = '%03u-%s.prof' % (self.stats_count, name.replace('.', '_').replace(' ', '_'))
+				profile.dump_stats(os.path.join(self.stats_dir, file_name))
+		return result
+
+	def write(self):
+		lines = []
+		for (name, start, duration) in self.events:
+			lines.append('{"name": %s, "cat": "phase", "ph": "X", "ts": %.0f, "dur": %.0f, "pid": %u, "tid": 0}'
+				% (json_string(name), start, duration, os.getpid()))
+		trace_file = open(self.trace_path, 'w')
+		trace_file.write('{"traceEvents": [\n')
+		trace_file.write(',\n'.join(lines))
+		trace_file.write('\n], "displayTimeUnit": "ms"}\n')
+		trace_file.close()
+		print 'Wrote %u phases to %s' % (len(self.events), self.trace_path)
+
+
+def enable(trace_path, stats_dir=None, editor=True):
+	# Starts timing the phases, to be written to trace_path on exit.
+	if stats_dir is not None and not os.path.isdir(stats_dir):
+		os.makedirs(stats_dir)
+	profiler = Profiler(trace_path, stats_dir)
+	profiler.instrument(MAP_PHASES)
+	if editor:
+		profiler.instrument(EDITOR_PHASES)
+	atexit.register(profiler.write)
+	return profiler
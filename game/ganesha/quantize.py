@@ -0,0 +1,110 @@
+# Reduces a true color image to one 16 color palette of the map.
+#
+# Pixels are first cut down to the palette's 5 bits per channel, which
+# leaves at most 32768 distinct colors however big the image is. The
+# palette is found by median cut over the histogram of those colors, and
+# every distinct color is matched to its nearest palette color once.
+
+# Pixels less opaque than this become the transparent color.
+ALPHA_THRESHOLD = 128
+# Palette color of transparent pixels: black with the alpha bit clear.
+TRANSPARENT = (0, 0, 0, 0)
+
+
+def histogram(pixels):
+	# Returns (a dict of 5 bit (r, g, b) -> pixel count, whether there are
+	# transparent pixels), and the 5 bit color of every pixel, None for
+	# transparent ones.
+	counts = {}
+	colors = []
+	transparent = False
+	cache = {}
+	for pixel in pixels:
+		try:
+			color = cache[pixel]
+		except KeyError:
+			(r, g, b, a) = pixel
+			if a < ALPHA_THRESHOLD:
+				color = None
+			else:
+				color = (r >> 3, g >> 3, b >> 3)
+			cache[pixel] = color
+		colors.append(color)
+		if color is None:
+			transparent = True
+		else:
+			counts[color] = counts.get(color, 0) + 1
+	return (counts, transparent, colors)
+
+def median_cut(counts, count):
+	# Splits the colors into at most count boxes, always splitting the box
+	# with the most pixels times its longest side at its weighted median.
+	# Returns the pixel weighted average color of each box.
+	boxes = [counts.keys()]
+	while len(boxes) < count:
+		best = None
+		for i, box in enumerate(boxes):
+			if len(box) < 2:
+				continue
+			sides = []
+			for channel in range(3):
+				values = [color[channel] for color in box]
+				sides.append((max(values) - min(values), channel))
+			(side, channel) = max(sides)
+			weight = sum([counts[color] for color in box])
+			if best is None or side * weight > best[0]:
+				best = (side * weight, i, channel, weight)
+		if best is None:
+			break
+		(score, i, channel, weight) = best
+		box = boxes[i]
+		box.sort(key=lambda color: color[channel])
+		total = 0
+		for split in range(1, len(box)):
+			total += counts[box[split - 1]]
+			if total * 2 >= weight:
+				break
+		boxes[i:i+1] = [box[:split], box[split:]]
+	palette = []
+	for box in boxes:
+		weight = sum([counts[color] for color in box])
+		average = [sum([color[channel] * counts[color] for color in box]) / float(weight) for channel in range(3)]
+		palette.append(tuple([int(round(c)) for c in average]))
+	return palette
+
+def nearest(palette, color):
+	best = None
+	for i, candidate in enumerate(palette):
+		distance = ((candidate[0] - color[0]) ** 2
+			+ (candidate[1] - color[1]) ** 2
+			+ (candidate[2] - color[2]) ** 2)
+		if best is None or distance < best[0]:
+			best = (distance, i)
+	return best[1]
+
+def quantize(pixels, count=16):
+	# pixels is a list of 8 bit (r, g, b, a) tuples. Returns (palette,
+	# indexes): palette is count map colors, 5 bit (r, g, b, a) with the
+	# alpha bit set on every opaque color, and indexes has the palette
+	# index of each pixel. Transparent pixels use index 0.
+	(counts, transparent, colors) = histogram(pixels)
+	offset = 0
+	if transparent:
+		offset = 1
+	if len(counts) <= count - offset:
+		opaque = counts.keys()
+		opaque.sort()
+	else:
+		opaque = median_cut(counts, count - offset)
+	palette = []
+	if transparent:
+		palette.append(TRANSPARENT)
+	for (r, g, b) in opaque:
+		palette.append((r, g, b, 1))
+	lookup = {None: 0}
+	for color in counts:
+		lookup[color] = nearest(opaque, color) + offset
+	indexes = map(lookup.__getitem__, colors)
+	while len(palette) < count:
+		palette.append(TRANSPARENT)
+	return (palette, indexes)
@@ -0,0 +1,131 @@
+# Works out the terrain tiles from the polygon mesh.
+#
+# Every textured polygon that faces up is laid over the 28x28 tile grid.
+# Each tile is sampled near its four corners and in its center, keeping
+# the height of every surface found there. The lowest surface is level 0
+# and a clearly higher one is level 1. The corner heights of each level
+# are then matched to the nearest of the slope shapes.
+
+from ganesha.visibility import face_vector, triangles
+
+TILE_SIZE = 28
+HEIGHT_STEP = 12.0
+# How far in from the tile's corners the corner heights are sampled
+INSET = 2
+# A surface this many height steps above the lowest counts as level 1.
+LEVEL_CLEARANCE = 3
+# Polygons steeper than this (the cosine of the angle between their face
+# and straight up) are walls, not floors.
+MIN_UPNESS = 0.5
+
+corners = ['ne', 'se', 'sw', 'nw']
+# (x, z) of each corner sample within a tile, and the center.
+sample_offsets = [
+	(TILE_SIZE - INSET, TILE_SIZE - INSET),
+	(TILE_SIZE - INSET, INSET),
+	(INSET, INSET),
+	(INSET, TILE_SIZE - INSET),
+	(TILE_SIZE / 2, TILE_SIZE / 2),
+]
+
+
+def rotate_shape(shape, rotation):
+	# The corner heights of a slope shape after the tile is turned by
+	# rotation degrees, the way Tile.init_node_path turns it.
+	shape = dict(shape)
+	for i in range(int(rotation) // 90 % 4):
+		shape = {'nw': shape['ne'], 'sw': shape['nw'], 'se': shape['sw'], 'ne': shape['se']}
+	return shape
+
+def fit_slope(heights, slope_types):
+	# heights are the ne, se, sw and nw corner heights in height steps.
+	# Returns (base height, slope_type, slope_height) for the closest
+	# shape, flat when nothing sloped fits better.
+	base = int(round(min(heights)))
+	best = (sum([(h - base) ** 2 for h in heights]), base, 0x00, 0)
+	for slope_type, (shape, rotation) in slope_types.items():
+		pattern = [rotate_shape(shape, rotation)[corner] for corner in corners]
+		low = [h for h, p in zip(heights, pattern) if not p]
+		high = [h for h, p in zip(heights, pattern) if p]
+		if not low or not high:
+			continue
+		shape_base = int(round(sum(low) / len(low)))
+		slope_height = int(round(sum(high) / len(high))) - shape_base
+		if slope_height <= 0:
+			continue
+		error = sum([(h - shape_base - slope_height * p) ** 2 for h, p in zip(heights, pattern)])
+		if error < best[0]:
+			best = (error, shape_base, slope_type, slope_height)
+	return best[1:]
+
+def height_at(triangle, x, z):
+	# Map height (Y) of the triangle above point (x, z), or None when the
+	# point is outside it.
+	((x0, y0, z0), (x1, y1, z1), (x2, y2, z2)) = triangle
+	area = float((x1 - x0) * (z2 - z0) - (x2 - x0) * (z1 - z0))
+	if area == 0:
+		return None
+	w1 = ((x - x0) * (z2 - z0) - (x2 - x0) * (z - z0)) / area
+	w2 = ((x1 - x0) * (z - z0) - (x - x0) * (z1 - z0)) / area
+	if w1 < 0 or w2 < 0 or w1 + w2 > 1:
+		return None
+	return y0 + w1 * (y1 - y0) + w2 * (y2 - y0)
+
+def derive(polygons, width, depth, slope_types):
+	# polygons is a list of point lists. Returns a dict of
+	# (x, z, level) -> (base height, slope_type, slope_height) for the
+	# tiles that have a surface, and a dict of polygon index ->
+	# (x, z, level) for the polygons that lie on one.
+	samples = {}
+	centers = {}
+	for i, points in enumerate(polygons):
+		floor = False
+		for triangle in triangles(points):
+			(fx, fy, fz) = face_vector(*triangle)
+			length = (fx * fx + fy * fy + fz * fz) ** 0.5
+			# Up is -Y.
+			if length == 0 or -fy / length < MIN_UPNESS:
+				continue
+			floor = True
+			xs = [p[0] for p in triangle]
+			zs = [p[2] for p in triangle]
+			for tz in range(max(0, int(min(zs)) // TILE_SIZE), min(depth, int(max(zs)) // TILE_SIZE + 1)):
+				for tx in range(max(0, int(min(xs)) // TILE_SIZE), min(width, int(max(xs)) // TILE_SIZE + 1)):
+					for j, (ox, oz) in enumerate(sample_offsets):
+						y = height_at(triangle, tx * TILE_SIZE + ox, tz * TILE_SIZE + oz)
+						if y is not None:
+							samples.setdefault((tx, tz, j), []).append(-y / HEIGHT_STEP)
+		if floor:
+			# Where the polygon lies, by the middle of its points
+			cx = sum([p[0] for p in points]) / float(len(points))
+			cy = sum([p[1] for p in points]) / float(len(points))
+			cz = sum([p[2] for p in points]) / float(len(points))
+			centers[i] = (int(cx) // TILE_SIZE, -cy / HEIGHT_STEP, int(cz) // TILE_SIZE)
+	# Split the surfaces at each sample into the two levels.
+	levels = {}
+	for (tx, tz, j), heights in samples.items():
+		low = min(heights)
+		high = max(heights)
+		levels.setdefault((tx, tz, 0), {})[j] = low
+		if high - low >= LEVEL_CLEARANCE:
+			levels.setdefault((tx, tz, 1), {})[j] = high
+	tiles = {}
+	for key, found in levels.items():
+		# Corners with no surface of their own take the tile's average.
+		average = sum(found.values()) / len(found)
+		heights = [found.get(j, average) for j in range(4)]
+		tiles[key] = fit_slope(heights, slope_types)
+	polygon_coords = {}
+	for i, (tx, h, tz) in centers.items():
+		if tx < 0 or tz < 0 or tx >= width or tz >= depth:
+			continue
+		level = 0
+		upper = levels.get((tx, tz, 1))
+		if upper is not None:
+			lower = levels[(tx, tz, 0)]
+			upper_height = sum(upper.values()) / len(upper)
+			lower_height = sum(lower.values()) / len(lower)
+			if abs(h - upper_height) < abs(h - lower_height):
+				level = 1
+		polygon_coords[i] = (tx, tz, level)
+	return (tiles, polygon_coords)
@@ -0,0 +1,157 @@
+# Which texels of the four 256x256 texture pages the polygons use.
+#
+# Every textured polygon's UV triangles are filled row by row into a count
+# per texel of its page. Each polygon's rows are kept, so when its UVs
+# change only that polygon is taken out and filled in again.
+
+from ganesha.visibility import triangles
+
+PAGE_SIZE = 256
+PAGES = 4
+
+
+def polygon_uvs(polygon):
+	# (page, list of (u, v)) of a map polygon, or None when untextured.
+	if polygon.A.texcoord is None:
+		return None
+	return (polygon.texture_page, [vertex.texcoord.coords for vertex in polygon.vertices()])
+
+def triangle_spans(triangle):
+	# The texels inside the triangle, as a list of (v, first u, last u).
+	# A texel is inside when its corner at (u, v) is inside or on an edge,
+	# so polygons that are only a line or a point still use their texels.
+	min_v = max(0, int(min([p[1] for p in triangle])))
+	max_v = min(PAGE_SIZE - 1, int(max([p[1] for p in triangle])))
+	edges = [(triangle[0], triangle[1]), (triangle[1], triangle[2]), (triangle[2], triangle[0])]
+	spans = []
+	for v in range(min_v, max_v + 1):
+		us = []
+		for ((u0, v0), (u1, v1)) in edges:
+			if v0 == v1:
+				if v0 == v:
+					us.extend([u0, u1])
+			elif min(v0, v1) <= v <= max(v0, v1):
+				us.append(u0 + (u1 - u0) * float(v - v0) / (v1 - v0))
+		if not us:
+			continue
+		first = max(0, -int(-min(us)))
+		last = min(PAGE_SIZE - 1, int(max(us)))
+		if first <= last:
+			spans.append((v, first, last))
+	return spans
+
+def polygon_spans(uvs):
+	spans = []
+	for triangle in triangles(uvs):
+		spans.extend(triangle_spans(triangle))
+	return spans
+
+
+class TexelUsage(object):
+	def __init__(self):
+		# counts[page][v][u] is how many polygons use texel (u, v).
+		self.counts = [[[0] * PAGE_SIZE for v in range(PAGE_SIZE)] for page in range(PAGES)]
+		# key -> ((page, uvs), spans) of each polygon filled in
+		self.polygons = {}
+		# Pages changed since the last call to take_changed_pages
+		self.changed_pages = set()
+
+	def add(self, key, page, uvs):
+		spans = polygon_spans(uvs)
+		self.fill(page, spans, 1)
+		self.polygons[key] = ((page, uvs), spans)
+
+	def remove(self, key):
+		((page, uvs), spans) = self.polygons.pop(key)
+		self.fill(page, spans, -1)
+
+	def fill(self, page, spans, step):
+		rows = self.counts[page]
+		for (v, first, last) in spans:
+			row = rows[v]
+			row[first:last+1] = [count + step for count in row[first:last+1]]
+		if spans:
+			self.changed_pages.add(page)
+
+	def sync(self, items):
+		# items is a dict of key -> (page, list of (u, v)). Only polygons
+		# that are new, gone or whose UVs changed are filled again.
+		for key in self.polygons.keys():
+			if key not in items:
+				self.remove(key)
+		for key, (page, uvs) in items.items():
+			uvs = [tuple(uv) for uv in uvs]
+			old = self.polygons.get(key)
+			if old is not None:
+				if old[0] == (page, uvs):
+					continue
+				self.remove(key)
+			self.add(key, page, uvs)
+
+	def take_changed_pages(self):
+		pages = self.changed_pages
+		self.changed_pages = set()
+		return pages
+
+	def coverage(self, page):
+		# Rows of 0 and 1 for unused and used texels
+		return [[int(count > 0) for count in row] for row in self.counts[page]]
+
+	def used_rows(self, page, exclude=()):
+		# Rows of 0 and 1 for unused and used texels of the page, not
+		# counting the polygons whose keys are in exclude.
+		rows = [list(row) for row in self.counts[page]]
+		for key in exclude:
+			((polygon_page, uvs), spans) = self.polygons[key]
+			if polygon_page != page:
+				continue
+			for (v, first, last) in spans:
+				row = rows[v]
+				row[first:last+1] = [count - 1 for count in row[first:last+1]]
+		return [[int(count > 0) for count in row] for row in rows]
+
+	def free_rectangles(self, page, min_width=8, min_height=8, limit=None):
+		# Unused areas of the page as (u, v, width, height), biggest first.
+		# Takes the biggest empty rectangle out again and again, so the
+		# rectangles do not overlap.
+		used = self.coverage(page)
+		found = []
+		while limit is None or len(found) < limit:
+			best = largest_empty_rectangle(used, min_width, min_height)
+			if best is None:
+				break
+			found.append(best)
+			(u, v, width, height) = best
+			for row in used[v:v+height]:
+				row[u:u+width] = [1] * width
+		return found
+
+
+def largest_empty_rectangle(used, min_width, min_height):
+	# Largest rectangle of zeros in the rows of used, at least
+	# min_width x min_height, found with a stack over the height of the run
+	# of zeros above every texel of each row.
+	best = None
+	best_area = 0
+	heights = [0] * PAGE_SIZE
+	for v, row in enumerate(used):
+		for u in range(PAGE_SIZE):
+			if row[u]:
+				heights[u] = 0
+			else:
+				heights[u] += 1
+		stack = []
+		for u in range(PAGE_SIZE + 1):
+			if u < PAGE_SIZE:
+				height = heights[u]
+			else:
+				height = 0
+			start = u
+			while stack and stack[-1][1] >= height:
+				(start, top) = stack.pop()
+				width = u - start
+				if top >= min_height and width >= min_width and width * top > best_area:
+					best_area = width * top
+					best = (start, v - top + 1, width, top)
+			stack.append((start, height))
+	return best
@@ -1,17 +1,21 @@
 # Initialize window:
 from pandac.PandaModules import WindowProperties
-from direct.showbase.ShowBase import ShowBase
 # Normal imports:
 from pandac.PandaModules import CullFaceAttrib
 from direct.showbase.DirectObject import DirectObject
 from direct.fsm.FSM import FSM
 import wx
 import math
+import time
 from world import World, Polygon, Tile
 from ganesha import *
+from ganesha import counters
+from ganesha.hud import PerformanceHUD
 
 POLYGON_INPUT_ID = 1000
 POLYGON_MOVE_ID = 1500
+POLYGON_ROTATE_ID = 1600
+POLYGON_TRANSFORM_ID = 1700
 TERRAIN_INPUT_ID = 2000
 VISIBILITY_INPUT_ID = 3000
 PALETTE_INPUT_ID = 4000
@@ -206,14 +210,20 @@ class Mouse(DirectObject):
 			self.camera_drag()
 		elif self.altButton2:
 			self.camera_pan()
+		# Nothing is hovered while the camera moves, so there is no need to
+		# pick.
+		if self.button2 or self.altButton2:
+			counters.add('picks_skipped')
+			return task.cont
+		counters.add('picks')
 		hovered_node_path = self.find_object()
 		if hovered_node_path:
 			polygon = hovered_node_path.findNetTag('polygon_i')
 			if not polygon.isEmpty():
 				tag = polygon.getTag('polygon_i')
-				i = int(tag)
-				self.hovered_object = self.app.world.polygons[i]
-				self.hovered_object.hover()
+				self.hovered_object = self.app.world.get_polygon(int(tag))
+				if self.hovered_object:
+					self.hovered_object.hover()
 			tile = hovered_node_path.findNetTag('terrain_xyz')
 			if not tile.isEmpty():
 				tag = tile.getTag('terrain_xyz')
@@ -373,6 +383,18 @@ class PolygonAddWindow(wx.Frame):
 		self.MakeModal(False)
 		self.Show(False)
 
+class PolygonListCtrl(wx.ListCtrl):
+	# Lists the map's polygons without storing any labels; wx asks for
+	# the few it draws.
+	def __init__(self, parent, size):
+		wx.ListCtrl.__init__(self, parent, wx.ID_ANY, size=size,
+				style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL | wx.LC_NO_HEADER)
+		self.InsertColumn(0, 'Polygon', width=size.GetWidth() - 20)
+
+	def OnGetItemText(self, item, column):
+		return 'Polygon_' + str(item)
+
+
 class PolygonEditWindow(wx.Frame):
 	def __init__(self, parent, ID, title):
 		self.app = parent
@@ -384,7 +406,8 @@ class PolygonEditWindow(wx.Frame):
 		# Vertex point, normal, and UV coordinates
 		sizer_point_table = wx.FlexGridSizer(rows=13, cols=9)
 		self.inputs = {}
-		self.polygon_list = []
+		# Position of the polygon being edited in file order
+		self.polygon_index = None
 		
 		# Dimensions Table
 		for i, point in enumerate(['', '', '', 'A', 'B', 'C', 'D', '', '']):
@@ -645,24 +668,24 @@ class PolygonEditWindow(wx.Frame):
 		button_label = wx.StaticText(panel, wx.ID_ANY, "(X, Z)", size=wx.Size(30, -1))
 		sizer_rotate_colbuttons.Add(button_label)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate A 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 0, 'Rotate A 90\xb0')
 		button.SetForegroundColour('red')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonAOnXZ)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_colbuttons.Add(button)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate B 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 1, 'Rotate B 90\xb0')
 		button.SetForegroundColour('green')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonBOnXZ)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_colbuttons.Add(button)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate C 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 2, 'Rotate C 90\xb0')
 		button.SetForegroundColour('blue')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonCOnXZ)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_colbuttons.Add(button)
 
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate D 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 3, 'Rotate D 90\xb0')
 		button.SetForegroundColour(wx.Colour(175, 175, 0))
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonDOnXZ)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_colbuttons.Add(button)
 		
 		#add horizontal box to whole list
@@ -675,24 +698,24 @@ class PolygonEditWindow(wx.Frame):
 		button_label = wx.StaticText(panel, wx.ID_ANY, "(X, Y)", size=wx.Size(30, -1))
 		sizer_rotate_xybuttons.Add(button_label)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate A 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 4, 'Rotate A 90\xb0')
 		button.SetForegroundColour('red')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonAOnXY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_xybuttons.Add(button)
 
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate B 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 5, 'Rotate B 90\xb0')
 		button.SetForegroundColour('green')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonBOnXY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_xybuttons.Add(button)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate C 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 6, 'Rotate C 90\xb0')
 		button.SetForegroundColour('blue')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonCOnXY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_xybuttons.Add(button)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate D 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 7, 'Rotate D 90\xb0')
 		button.SetForegroundColour(wx.Colour(175, 175, 0))
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonDOnXY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_xybuttons.Add(button)
 		
 		#add horizontal box to whole list
@@ -705,28 +728,35 @@ class PolygonEditWindow(wx.Frame):
 		button_label = wx.StaticText(panel, wx.ID_ANY, "(Z, Y)", size=wx.Size(30, -1))
 		sizer_rotate_zybuttons.Add(button_label)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate A 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 8, 'Rotate A 90\xb0')
 		button.SetForegroundColour('red')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonAOnZY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_zybuttons.Add(button)
 
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate B 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 9, 'Rotate B 90\xb0')
 		button.SetForegroundColour('green')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonBOnZY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_zybuttons.Add(button)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate C 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 10, 'Rotate C 90\xb0')
 		button.SetForegroundColour('blue')
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonCOnZY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_zybuttons.Add(button)
 		
-		button = wx.Button(panel, wx.ID_ANY, 'Rotate D 90\xb0')
+		button = wx.Button(panel, POLYGON_ROTATE_ID + 11, 'Rotate D 90\xb0')
 		button.SetForegroundColour(wx.Colour(175, 175, 0))
-		button.Bind(wx.EVT_BUTTON, self.rotatePolygonDOnZY)
+		button.Bind(wx.EVT_BUTTON, self.on_rotate)
 		sizer_rotate_zybuttons.Add(button)
 		
 		#add horizontal box to whole list
 		sizer_sections.Add(sizer_rotate_zybuttons, flag=wx.LEFT | wx.BOTTOM | wx.RIGHT, border=10)
+
+		sizer_transform_buttons = wx.BoxSizer(wx.HORIZONTAL)
+		for i, label in enumerate(['Mirror X', 'Mirror Y', 'Mirror Z', 'Snap to Grid', 'Flat Normals', 'Smooth Normals']):
+			button = wx.Button(panel, POLYGON_TRANSFORM_ID + i, label)
+			button.Bind(wx.EVT_BUTTON, self.on_transform)
+			sizer_transform_buttons.Add(button)
+		sizer_sections.Add(sizer_transform_buttons, flag=wx.LEFT | wx.BOTTOM | wx.RIGHT, border=10)
 		
 		
 		sizer_mid_buttons = wx.BoxSizer(wx.HORIZONTAL)
@@ -802,6 +832,9 @@ class PolygonEditWindow(wx.Frame):
 			static_text = wx.StaticText(panel, wx.ID_ANY, label)
 			sizer_angles.Add(static_text)
 		sizer_sections.Add(sizer_angles, flag=wx.LEFT | wx.BOTTOM | wx.RIGHT, border=10)
+		button = wx.Button(panel, wx.ID_ANY, 'Compute Visibility')
+		button.Bind(wx.EVT_BUTTON, self.on_compute_visibility)
+		sizer_sections.Add(button, flag=wx.LEFT | wx.BOTTOM | wx.RIGHT, border=10)
 		#self.inputs['unknown1'] = wx.TextCtrl(panel, wx.ID_ANY)
 		#sizer_sections.Add(self.inputs['unknown1'], flag=wx.ALL, border=10)
 		#self.inputs['unknown2'] = wx.TextCtrl(panel, wx.ID_ANY)
@@ -829,10 +862,10 @@ class PolygonEditWindow(wx.Frame):
 		self.inputs['previous_polygon_button'] = button
 		sizer_buttons.Add(button)
 				
-		combobox = wx.Choice(panel, id=wx.ID_ANY, size=wx.Size(100, -1), choices=[])
-		combobox.Bind(wx.EVT_CHOICE, self.on_change_poly_selection)
-		self.inputs['polygon_selector_box'] = combobox
-		sizer_buttons.Add(combobox)
+		polygon_list = PolygonListCtrl(panel, wx.Size(120, 80))
+		polygon_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_change_poly_selection)
+		self.inputs['polygon_selector_box'] = polygon_list
+		sizer_buttons.Add(polygon_list)
 		
 		button = wx.Button(panel, wx.ID_ANY, 'Next >', size=wx.Size(50, -1))
 		self.inputs['next_polygon_button'] = button
@@ -844,6 +877,17 @@ class PolygonEditWindow(wx.Frame):
 		panel.SetSizer(sizer_sections)
 		sizer_sections.SetSizeHints(panel)
 		sizer_sections.SetSizeHints(self)
+		# Inputs edited since the polygon was last read or written
+		self.changed_inputs = set()
+		self.input_keys = {}
+		for key, input_ in self.inputs.items():
+			if isinstance(input_, wx.TextCtrl):
+				input_.Bind(wx.EVT_TEXT, self.on_input_changed)
+			elif isinstance(input_, wx.CheckBox):
+				input_.Bind(wx.EVT_CHECKBOX, self.on_input_changed)
+			else:
+				continue
+			self.input_keys[input_.GetId()] = key
 
 	def on_copy_vertex(self, event):
 		command = event.GetId()
@@ -1189,434 +1233,67 @@ class PolygonEditWindow(wx.Frame):
 		self.to_data(None)
 		
 
-	def rotatePolygonAOnXZ(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('X', 'A')].GetValue())
-		vector[1] = int(self.inputs[('Z', 'A')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['A', 'B', 'D', 'C']:
-			x = int(self.inputs[('X', pts)].GetValue())
-			z = int(self.inputs[('Z', pts)].GetValue())
-			coordinates.append([x, z])
-		
-		for xNum in range(0,4):
-			for zNum in range(0,2):
-				coordinates[xNum][zNum] -= vector[zNum]
-	
-			tempvar = coordinates[xNum][0]
-			coordinates[xNum][0] = coordinates[xNum][1]
-			coordinates[xNum][1] = tempvar * -1
-
-			coordinates[xNum][0] += vector[0]
-			coordinates[xNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['A', 'B', 'D', 'C']:
-			self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Z', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
-		self.to_data(None)
-		
-	def rotatePolygonBOnXZ(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('X', 'B')].GetValue())
-		vector[1] = int(self.inputs[('Z', 'B')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['B', 'D', 'C', 'A']:
-			x = int(self.inputs[('X', pts)].GetValue())
-			z = int(self.inputs[('Z', pts)].GetValue())
-			coordinates.append([x, z])
-		
-		for xNum in range(0,4):
-			for zNum in range(0,2):
-				coordinates[xNum][zNum] -= vector[zNum]
-	
-			tempvar = coordinates[xNum][0]
-			coordinates[xNum][0] = coordinates[xNum][1]
-			coordinates[xNum][1] = tempvar * -1
-
-			coordinates[xNum][0] += vector[0]
-			coordinates[xNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['B', 'D', 'C', 'A']:
-			self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Z', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
-		self.to_data(None)
-	
-	
-	def rotatePolygonCOnXZ(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('X', 'C')].GetValue())
-		vector[1] = int(self.inputs[('Z', 'C')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['C', 'A', 'B', 'D']:
-			x = int(self.inputs[('X', pts)].GetValue())
-			z = int(self.inputs[('Z', pts)].GetValue())
-			coordinates.append([x, z])
-		
-		for xNum in range(0,4):
-			for zNum in range(0,2):
-				coordinates[xNum][zNum] -= vector[zNum]
-	
-			tempvar = coordinates[xNum][0]
-			coordinates[xNum][0] = coordinates[xNum][1]
-			coordinates[xNum][1] = tempvar * -1
-
-			coordinates[xNum][0] += vector[0]
-			coordinates[xNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['C', 'A', 'B', 'D']:
-			self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Z', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
-		self.to_data(None)
-
-		
-	def rotatePolygonDOnXZ(self, event):
-	
-		if hasattr(self.app.selected_object.source, 'D'):
-			vector = [0,0]
-			vector[0] = int(self.inputs[('X', 'D')].GetValue())
-			vector[1] = int(self.inputs[('Z', 'D')].GetValue())
-			
-			coordinates = [];
-
-			#copy to new list
-			for pts in ['D', 'C', 'A', 'B']:
-				x = int(self.inputs[('X', pts)].GetValue())
-				z = int(self.inputs[('Z', pts)].GetValue())
-				coordinates.append([x, z])
-			
-			for xNum in range(0,4):
-				for zNum in range(0,2):
-					coordinates[xNum][zNum] -= vector[zNum]
-		
-				tempvar = coordinates[xNum][0]
-				coordinates[xNum][0] = coordinates[xNum][1]
-				coordinates[xNum][1] = tempvar * -1
-
-				coordinates[xNum][0] += vector[0]
-				coordinates[xNum][1] += vector[1]
-			
-			count = 0
-			
-			for pts in ['D', 'C', 'A', 'B']:
-				self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-				self.inputs['Z', pts].SetValue(str(coordinates[count][1]))
-			
-				count += 1
-			self.to_data(None)	
-
-	def rotatePolygonAOnXY(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('X', 'A')].GetValue())
-		vector[1] = int(self.inputs[('Y', 'A')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['A', 'B', 'D', 'C']:
-			x = int(self.inputs[('X', pts)].GetValue())
-			y = int(self.inputs[('Y', pts)].GetValue())
-			coordinates.append([x, y])
-		
-		for xNum in range(0,4):
-			for yNum in range(0,2):
-				coordinates[xNum][yNum] -= vector[yNum]
-	
-			tempvar = coordinates[xNum][0]
-			coordinates[xNum][0] = coordinates[xNum][1]
-			coordinates[xNum][1] = tempvar * -1
-
-			coordinates[xNum][0] += vector[0]
-			coordinates[xNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['A', 'B', 'D', 'C']:
-			self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
-		self.to_data(None)	
-
-	def rotatePolygonBOnXY(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('X', 'B')].GetValue())
-		vector[1] = int(self.inputs[('Y', 'B')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['B', 'D', 'C', 'A']:
-			x = int(self.inputs[('X', pts)].GetValue())
-			y = int(self.inputs[('Y', pts)].GetValue())
-			coordinates.append([x, y])
-		
-		for xNum in range(0,4):
-			for yNum in range(0,2):
-				coordinates[xNum][yNum] -= vector[yNum]
-	
-			tempvar = coordinates[xNum][0]
-			coordinates[xNum][0] = coordinates[xNum][1]
-			coordinates[xNum][1] = tempvar * -1
-
-			coordinates[xNum][0] += vector[0]
-			coordinates[xNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['B', 'D', 'C', 'A']:
-			self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
-		self.to_data(None)
-
-	def rotatePolygonCOnXY(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('X', 'C')].GetValue())
-		vector[1] = int(self.inputs[('Y', 'C')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['C', 'A', 'B', 'D']:
-			x = int(self.inputs[('X', pts)].GetValue())
-			y = int(self.inputs[('Y', pts)].GetValue())
-			coordinates.append([x, y])
-		
-		for xNum in range(0,4):
-			for yNum in range(0,2):
-				coordinates[xNum][yNum] -= vector[yNum]
-	
-			tempvar = coordinates[xNum][0]
-			coordinates[xNum][0] = coordinates[xNum][1]
-			coordinates[xNum][1] = tempvar * -1
-
-			coordinates[xNum][0] += vector[0]
-			coordinates[xNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['C', 'A', 'B', 'D']:
-			self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
+	def transform_targets(self):
+		# The buttons act on the whole selection when the polygon being
+		# edited is part of it.
+		polygon = self.app.selected_object
+		selection = self.app.world.selection
+		if selection.kind is Polygon and polygon in selection:
+			return list(selection)
+		return [polygon]
+
+	def on_rotate(self, event):
+		# Rotates 90 degrees around point A, B, C or D of this polygon.
+		button_id = event.GetId() - POLYGON_ROTATE_ID
+		plane = ['XZ', 'XY', 'ZY'][button_id // 4]
+		point = ['A', 'B', 'C', 'D'][button_id % 4]
+		polygon = self.app.selected_object
+		if not hasattr(polygon.source, point):
+			return
 		self.to_data(None)
+		pivot = getattr(polygon.source, point).point.coords
+		# The Y boxes show -Y, so the same turn on screen is the other way
+		# around in map coordinates.
+		angle = 90
+		if 'Y' in plane:
+			angle = -90
+		self.app.world.rotate_polygons(self.transform_targets(), plane, angle, pivot)
+		self.from_data(polygon)
+		self.app.uv_edit_window.from_data()
 
-		
-	def rotatePolygonDOnXY(self, event):
-	
-		if hasattr(self.app.selected_object.source, 'D'):
-			vector = [0,0]
-			vector[0] = int(self.inputs[('X', 'D')].GetValue())
-			vector[1] = int(self.inputs[('Y', 'D')].GetValue())
-			
-			coordinates = [];
-
-			#copy to new list
-			for pts in ['D', 'C', 'A', 'B']:
-				x = int(self.inputs[('X', pts)].GetValue())
-				y = int(self.inputs[('Y', pts)].GetValue())
-				coordinates.append([x, y])
-			
-			for xNum in range(0,4):
-				for yNum in range(0,2):
-					coordinates[xNum][yNum] -= vector[yNum]
-		
-				tempvar = coordinates[xNum][0]
-				coordinates[xNum][0] = coordinates[xNum][1]
-				coordinates[xNum][1] = tempvar * -1
-
-				coordinates[xNum][0] += vector[0]
-				coordinates[xNum][1] += vector[1]
-			
-			count = 0
-			
-			for pts in ['D', 'C', 'A', 'B']:
-				self.inputs['X', pts].SetValue(str(coordinates[count][0]))
-				self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-			
-				count += 1
-			self.to_data(None)
-
-	def rotatePolygonAOnZY(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('Z', 'A')].GetValue())
-		vector[1] = int(self.inputs[('Y', 'A')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['A', 'B', 'D', 'C']:
-			z = int(self.inputs[('Z', pts)].GetValue())
-			y = int(self.inputs[('Y', pts)].GetValue())
-			coordinates.append([z, y])
-		
-		for zNum in range(0,4):
-			for yNum in range(0,2):
-				coordinates[zNum][yNum] -= vector[yNum]
-	
-			tempvar = coordinates[zNum][0]
-			coordinates[zNum][0] = coordinates[zNum][1]
-			coordinates[zNum][1] = tempvar * -1
-
-			coordinates[zNum][0] += vector[0]
-			coordinates[zNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['A', 'B', 'D', 'C']:
-			self.inputs['Z', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
-		self.to_data(None)	
-
-	def rotatePolygonBOnZY(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('Z', 'B')].GetValue())
-		vector[1] = int(self.inputs[('Y', 'B')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['B', 'D', 'C', 'A']:
-			z = int(self.inputs[('Z', pts)].GetValue())
-			y = int(self.inputs[('Y', pts)].GetValue())
-			coordinates.append([z, y])
-		
-		for zNum in range(0,4):
-			for yNum in range(0,2):
-				coordinates[zNum][yNum] -= vector[yNum]
-	
-			tempvar = coordinates[zNum][0]
-			coordinates[zNum][0] = coordinates[zNum][1]
-			coordinates[zNum][1] = tempvar * -1
-
-			coordinates[zNum][0] += vector[0]
-			coordinates[zNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['B', 'D', 'C', 'A']:
-			self.inputs['Z', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
+	def on_compute_visibility(self, event):
 		self.to_data(None)
+		self.app.world.compute_visible_angles(self.transform_targets())
+		self.from_data(self.app.selected_object)
 
-	def rotatePolygonCOnZY(self, event):
-	
-		vector = [0,0]
-		vector[0] = int(self.inputs[('Z', 'C')].GetValue())
-		vector[1] = int(self.inputs[('Y', 'C')].GetValue())
-		
-		coordinates = [];
-
-		#copy to new list
-		for pts in ['C', 'A', 'B', 'D']:
-			z = int(self.inputs[('Z', pts)].GetValue())
-			y = int(self.inputs[('Y', pts)].GetValue())
-			coordinates.append([z, y])
-		
-		for zNum in range(0,4):
-			for yNum in range(0,2):
-				coordinates[zNum][yNum] -= vector[yNum]
-	
-			tempvar = coordinates[zNum][0]
-			coordinates[zNum][0] = coordinates[zNum][1]
-			coordinates[zNum][1] = tempvar * -1
-
-			coordinates[zNum][0] += vector[0]
-			coordinates[zNum][1] += vector[1]
-		
-		count = 0
-		
-		for pts in ['C', 'A', 'B', 'D']:
-			self.inputs['Z', pts].SetValue(str(coordinates[count][0]))
-			self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-		
-			count += 1
+	def on_transform(self, event):
+		button_id = event.GetId() - POLYGON_TRANSFORM_ID
 		self.to_data(None)
-
-		
-	def rotatePolygonDOnZY(self, event):
-	
-		if hasattr(self.app.selected_object.source, 'D'):
-			vector = [0,0]
-			vector[0] = int(self.inputs[('Z', 'D')].GetValue())
-			vector[1] = int(self.inputs[('Y', 'D')].GetValue())
-			
-			coordinates = [];
-
-			#copy to new list
-			for pts in ['D', 'C', 'A', 'B']:
-				z = int(self.inputs[('Z', pts)].GetValue())
-				y = int(self.inputs[('Y', pts)].GetValue())
-				coordinates.append([z, y])
-			
-			for zNum in range(0,4):
-				for yNum in range(0,2):
-					coordinates[zNum][yNum] -= vector[yNum]
-		
-				tempvar = coordinates[zNum][0]
-				coordinates[zNum][0] = coordinates[zNum][1]
-				coordinates[zNum][1] = tempvar * -1
-
-				coordinates[zNum][0] += vector[0]
-				coordinates[zNum][1] += vector[1]
-			
-			count = 0
-			
-			for pts in ['D', 'C', 'A', 'B']:
-				self.inputs['Z', pts].SetValue(str(coordinates[count][0]))
-				self.inputs['Y', pts].SetValue(str(coordinates[count][1]))
-			
-				count += 1
-			self.to_data(None)
+		polygons = self.transform_targets()
+		if button_id in [0, 1, 2]:
+			axis = ['X', 'Y', 'Z'][button_id]
+			self.app.world.mirror_polygons(polygons, axis, self.app.world.polygons_center(polygons))
+		elif button_id == 3:
+			self.app.world.snap_polygons(polygons)
+		elif button_id in [4, 5]:
+			self.app.world.recompute_normals(polygons, button_id == 5)
+		self.from_data(self.app.selected_object)
+		self.app.uv_edit_window.from_data()
 
 	def on_change_poly_selection(self, event):
-		selected_poly_index = event.GetSelection();
+		selected_poly_index = event.GetIndex()
+		# Selecting the row from from_data sends this event too.
+		if selected_poly_index == self.polygon_index:
+			return
 		selected_polygon = self.app.world.polygons[selected_poly_index]
 		self.app.select(selected_polygon)
 	
 	def on_change_poly_previous(self, event):
-		selected_poly_index = self.inputs['polygon_selector_box'].GetSelection()
-		selected_polygon = self.app.world.polygons[selected_poly_index - 1]
+		selected_polygon = self.app.world.polygons[self.polygon_index - 1]
 		self.app.select(selected_polygon)
 		
 	def on_change_poly_next(self, event):
-		selected_poly_index = self.inputs['polygon_selector_box'].GetSelection()
-		selected_polygon = self.app.world.polygons[selected_poly_index + 1]
+		selected_polygon = self.app.world.polygons[self.polygon_index + 1]
 		self.app.select(selected_polygon)
 		
 	def from_data(self, polygon):			
@@ -1706,101 +1383,111 @@ class PolygonEditWindow(wx.Frame):
 		self.app.uv_edit_window.from_data()
 		
 		# Setting Polygon Selector Items
-		new_list = []
-		for index, poly in enumerate(self.app.world.polygons):
-			new_list.append('Polygon_' + str(index))
-			
-		if len(new_list) != len(self.polygon_list):
-			poly_difference = abs(len(new_list) - len(self.polygon_list))
-			if poly_difference < 100:
-				if len(new_list) > len(self.polygon_list):
-					for index in range(poly_difference):
-						self.inputs['polygon_selector_box'].Append('Polygon_' + str(len(self.polygon_list) + index))
-				else:
-					for index in range(poly_difference):
-						self.inputs['polygon_selector_box'].Delete(len(new_list))
-						
-				self.polygon_list = new_list
-			else:
-				self.polygon_list = new_list
-				self.inputs['polygon_selector_box'].Clear()
-				self.inputs['polygon_selector_box'].AppendItems(self.polygon_list)
-			
-		selected_poly_index = self.app.world.polygons.index(polygon)
-		self.inputs['polygon_selector_box'].SetSelection(selected_poly_index)
+		polygon_count = len(self.app.world.polygons)
+		polygon_list = self.inputs['polygon_selector_box']
+		if polygon_list.GetItemCount() != polygon_count:
+			polygon_list.SetItemCount(polygon_count)
+		selected_poly_index = self.app.world.get_polygon_index(polygon)
+		self.polygon_index = selected_poly_index
+		polygon_list.Select(selected_poly_index)
+		polygon_list.EnsureVisible(selected_poly_index)
 		
 		if selected_poly_index == 0:
 			self.inputs['previous_polygon_button'].Disable()
 		else: 
 			self.inputs['previous_polygon_button'].Enable()
 			
-		if selected_poly_index == len(self.polygon_list) - 1:
+		if selected_poly_index == polygon_count - 1:
 			self.inputs['next_polygon_button'].Disable()
 		else: 
 			self.inputs['next_polygon_button'].Enable()
+		# Filling in the inputs above counts as editing them.
+		self.changed_inputs = set()
 			
+	def on_input_changed(self, event):
+		self.changed_inputs.add(self.input_keys[event.GetId()])
+		event.Skip()
+
 	def to_data(self, foo):
-		for dim in ['X', 'Y', 'Z']:
-			for pt in ['A', 'B', 'C', 'D']:
-				if hasattr(self.app.selected_object.source, pt):
-					point = getattr(self.app.selected_object.source, pt).point
-					if dim == 'Y':
-						setattr(point, dim, 0 - int(self.inputs[(dim, pt)].GetValue()))
-					else:
-						setattr(point, dim, int(self.inputs[(dim, pt)].GetValue()))
-					setattr(point, 'coords', (point.X, point.Y, point.Z))
+		# Only the inputs edited since the last from_data or to_data are
+		# read. The scene is updated at the next frame.
+		changed = self.changed_inputs
+		self.changed_inputs = set()
+		if not changed:
+			return
+		world = self.app.world
+		polygon = self.app.selected_object
+		source = polygon.source
+		old_state = world.polygon_state(polygon)
 		for pt in ['A', 'B', 'C', 'D']:
-			if not hasattr(self.app.selected_object.source, pt):
-				continue
-			normal = getattr(self.app.selected_object.source, pt).normal
-			if normal is None:
+			if not hasattr(source, pt):
 				continue
-			elevation = 90 - float(self.inputs[('nE', pt)].GetValue())
-			azimuth = float(self.inputs[('nA', pt)].GetValue())
-			(nX, nY, nZ) = sphere_to_vector(elevation, azimuth)
-			normal.X = nX
-			normal.Y = nY
-			normal.Z = nZ
-			normal.coords = (normal.X, normal.Y, normal.Z)
-		for dim in ['U', 'V']:
-			for pt in ['A', 'B', 'C', 'D']:
-				if not hasattr(self.app.selected_object.source, pt):
-					continue
-				texcoord = getattr(self.app.selected_object.source, pt).texcoord
-				if not hasattr(texcoord, dim):
-					continue
-				newVal = int(self.inputs[(dim, pt)].GetValue())
-				if newVal < 0:
-					newVal = 0
-					print("UV Warning: UV values cannot be below 0 (ubyte)")
-				elif newVal > 255:
-					newVal = 255
-					print("UV Warning: UV values cannot be above 255 (ubyte)")
-				setattr(texcoord, dim, newVal)
-				setattr(texcoord, 'coords', (texcoord.U, texcoord.V))
-		if self.app.selected_object.source.texture_page is not None:
-			self.app.selected_object.source.texture_page = int(self.inputs['page'].GetValue())
-		if self.app.selected_object.source.texture_palette is not None:
-			self.app.selected_object.source.texture_palette = int(self.inputs['palette'].GetValue())
-		if self.app.selected_object.source.terrain_coords is not None:
+			vertex = getattr(source, pt)
+			if ('X', pt) in changed or ('Y', pt) in changed or ('Z', pt) in changed:
+				x = int(self.inputs[('X', pt)].GetValue())
+				y = 0 - int(self.inputs[('Y', pt)].GetValue())
+				z = int(self.inputs[('Z', pt)].GetValue())
+				vertex.point.set_coords(x, y, z)
+			if vertex.normal is not None and (('nE', pt) in changed or ('nA', pt) in changed):
+				elevation = 90 - float(self.inputs[('nE', pt)].GetValue())
+				azimuth = float(self.inputs[('nA', pt)].GetValue())
+				vertex.normal.set_coords(*sphere_to_vector(elevation, azimuth))
+			if vertex.texcoord is not None and (('U', pt) in changed or ('V', pt) in changed):
+				uv = []
+				for dim in ['U', 'V']:
+					newVal = int(self.inputs[(dim, pt)].GetValue())
+					if newVal < 0:
+						newVal = 0
+						print("UV Warning: UV values cannot be below 0 (ubyte)")
+					elif newVal > 255:
+						newVal = 255
+						print("UV Warning: UV values cannot be above 255 (ubyte)")
+					uv.append(newVal)
+				vertex.texcoord.set_coords(*uv)
+		if source.texture_page is not None and 'page' in changed:
+			source.texture_page = int(self.inputs['page'].GetValue())
+		if source.texture_palette is not None and 'palette' in changed:
+			newVal = int(self.inputs['palette'].GetValue())
+			if newVal < 0:
+				newVal = 0
+				print("Palette Warning: Palette cannot be below 0")
+			elif newVal > 15:
+				newVal = 15
+				print("Palette Warning: Palette cannot be above 15")
+			source.texture_palette = newVal
+			world.post_change((polygon, 'texture'), world.update_polygon_texture, polygon)
+		if source.terrain_coords is not None and ('tX' in changed or 'tZ' in changed or 'tlvl' in changed):
 			if self.inputs['tX'].GetValue() == '' or self.inputs['tZ'].GetValue() == '':
 				terrain_coords = (255, 127, 0)
 			else:
 				terrain_coords = (int(self.inputs['tX'].GetValue()), int(self.inputs['tZ'].GetValue()), int(self.inputs['tlvl'].GetValue()))
-			self.app.selected_object.source.terrain_coords = terrain_coords
+			world.set_polygon_terrain_coords(polygon, terrain_coords)
+		angles = list(source.visible_angles)
 		for bit, label in visibility_bits:
-			if bit is not None:
-				self.app.selected_object.source.visible_angles[bit] = 1 if self.inputs[('visibility', bit)].GetValue() else 0
-		#self.app.selected_object.source.unknown1 = int(self.inputs['unknown1'].GetValue())
-		#self.app.selected_object.source.unknown2 = int(self.inputs['unknown2'].GetValue())
-		#self.app.selected_object.source.unknown3 = int(self.inputs['unknown3'].GetValue())
-		#self.app.selected_object.source.unknown4 = int(self.inputs['unknown4'].GetValue())
-		# TODO: Should probably go somewhere else
-		tag = self.app.selected_object.node_path.getTag('polygon_i')
-		self.app.selected_object.init_node_path()
-		self.app.selected_object.node_path.setTag('polygon_i', tag)
-		self.app.selected_object.select()
-		self.app.uv_edit_window.from_data()
+			if bit is not None and ('visibility', bit) in changed:
+				angles[bit] = 1 if self.inputs[('visibility', bit)].GetValue() else 0
+		source.visible_angles = angles
+		#source.unknown1 = int(self.inputs['unknown1'].GetValue())
+		#source.unknown2 = int(self.inputs['unknown2'].GetValue())
+		#source.unknown3 = int(self.inputs['unknown3'].GetValue())
+		#source.unknown4 = int(self.inputs['unknown4'].GetValue())
+		world.record_polygons('Edit polygon', [polygon], [old_state])
+		world.post_change((polygon, 'vertices'), world.update_polygon, polygon)
+		world.post_change('uv_edit_window', self.app.uv_edit_window.from_data)
+
+
+def uv_to_window(page, u, v):
+	# Position in the UV window of texel (u, v) of the page. The pages are
+	# laid out two by two.
+	if page < 2:
+		x = -256
+	else:
+		x = 0
+	if page % 2 == 0:
+		y = 256
+	else:
+		y = 0
+	return (x + u, y - v, 1)
 
 
 class UVEditWindow(DirectObject):
@@ -1809,11 +1496,17 @@ class UVEditWindow(DirectObject):
 		self.uv_window = None
 		self.node_path_texture = None
 		self.node_path_uv_polygon = None
+		self.node_path_usage = None
+		self.node_path_outlines = None
+		self.usage_texture = None
 		self.mwn = None
 		self.zoom_level = 1
 		self.render_uv = None
 		self.selected_object = None
 		self.mouse_old_pos = None
+		# Page and point -> [u, v] of the polygon being edited
+		self.page = 0
+		self.uvs = {}
 
 	def init_collide(self):
 		from pandac.PandaModules import CollisionTraverser, CollisionNode, GeomNode
@@ -1852,25 +1545,20 @@ class UVEditWindow(DirectObject):
 		self.uv_window = base.graphicsEngine.makeOutput(base.pipe, 'UV Coordinates', 2, fp, wp, GraphicsPipe.BFRequireWindow)
 		self.uv_window.setCloseRequestEvent('uv_edit_window_closed')
 		self.dr = self.uv_window.makeDisplayRegion()
-		from pandac.PandaModules import NodePath, Camera, OrthographicLens
-		self.render_uv = NodePath('render_uv')
-		self.camera = self.render_uv.attachNewNode(Camera('camera_uv'))
+		# The scene is built the first time and kept for later opens.
+		if self.render_uv is None:
+			self.init_scene()
 		self.dr.setCamera(self.camera)
 		self.camera.setPos(0, 0, 1)
-		self.camera.lookAt(0,0,0)
-		lens = OrthographicLens()
-		lens.setAspectRatio(1.0)
-		lens.setNear(-10)
-		lens.setFar(10)
-		lens.setFilmSize(512)
-		self.camera.node().setLens(lens)
+		self.camera.node().getLens().setFilmSize(512)
 		self.zoom_level = 1
 		wp = self.make_properties()
 		wp.setOpen(True)
 		self.uv_window.requestProperties(wp)
-		self.init_collide()
-		self.draw_texture()
-		self.draw_uv_polygon()
+		# The map may have changed since the window was last open.
+		self.node_path_texture.setTexture(self.app.world.texture.texture2)
+		self.app.world.texel_usage.changed_pages.update(range(4))
+		self.from_data()
 		# Set up mouse
 		dev_kbd_mouse = self.uv_window.getInputDeviceNames().index('keyboard_mouse')
 		self.mak = MouseAndKeyboard(self.uv_window, dev_kbd_mouse, 'keyboard_mouse')
@@ -1879,6 +1567,25 @@ class UVEditWindow(DirectObject):
 		self.mwn = self.mw.node()
 		self.bt = self.mw.attachNewNode(ButtonThrower('keyboard_mouse'))
 
+	def init_scene(self):
+		from pandac.PandaModules import NodePath, Camera, OrthographicLens
+		self.render_uv = NodePath('render_uv')
+		self.render_uv.setAttrib(CullFaceAttrib.make(CullFaceAttrib.MCullNone))
+		self.camera = self.render_uv.attachNewNode(Camera('camera_uv'))
+		self.camera.setPos(0, 0, 1)
+		self.camera.lookAt(0,0,0)
+		lens = OrthographicLens()
+		lens.setAspectRatio(1.0)
+		lens.setNear(-10)
+		lens.setFar(10)
+		lens.setFilmSize(512)
+		self.camera.node().setLens(lens)
+		self.init_collide()
+		self.node_path_texture = self.draw_pages('node_path_texture', 0)
+		self.draw_usage()
+		self.init_uv_polygon()
+		self.node_path_outlines = self.render_uv.attachNewNode('node_path_outlines')
+
 	def close(self):
 		if self.uv_window:
 			base.graphicsEngine.removeWindow(self.uv_window)
@@ -1895,8 +1602,8 @@ class UVEditWindow(DirectObject):
 			polygon = found.getTag('whole_polygon')
 			if page:
 				self.app.polygon_edit_window.inputs['page'].SetValue(str(page))
-				self.draw_uv_polygon()
-				pass
+				self.page = int(page)
+				self.place_uv_polygon()
 			elif point or polygon:
 				self.selected_object = found
 
@@ -1938,41 +1645,41 @@ class UVEditWindow(DirectObject):
 			v -= y
 			return (u, v)
 		if self.zoom_level == 2:
+			# The edit window's inputs are kept in step so Apply writes the
+			# dragged UVs; they are not read back.
 			inputs = self.app.polygon_edit_window.inputs
-			page = int(inputs['page'].GetValue())
 			pos = self.mwn.getMouse()
 			x = min(max(pos.getX(), -1.0), 1.0)
 			y = min(max(pos.getY(), -1.0), 1.0)
-			(x, y) = mouse_to_window(page, x, y)
-			(u, v) = window_to_uv(page, x, y)
+			(x, y) = mouse_to_window(self.page, x, y)
+			(u, v) = window_to_uv(self.page, x, y)
 			if not self.mouse_old_pos:
 				self.mouse_old_pos = (u, v)
 			point = self.selected_object.getTag('point')
 			polygon = self.selected_object.getTag('whole_polygon')
 			if point:
+				self.uvs[point] = [u, v]
 				inputs[('U', point)].SetValue(str(u))
 				inputs[('V', point)].SetValue(str(v))
 			elif polygon:
 				dU = u - self.mouse_old_pos[0]
 				dV = v - self.mouse_old_pos[1]
-				for point in ['A', 'B', 'C', 'D']:
-					if not hasattr(self.app.selected_object.source, point):
-						continue
-					old_u = int(inputs[('U', point)].GetValue())
-					old_v = int(inputs[('V', point)].GetValue())
-					inputs[('U', point)].SetValue(str(old_u + dU))
-					inputs[('V', point)].SetValue(str(old_v + dV))
+				for point, uv in self.uvs.items():
+					uv[0] += dU
+					uv[1] += dV
+					inputs[('U', point)].SetValue(str(uv[0]))
+					inputs[('V', point)].SetValue(str(uv[1]))
 				self.mouse_old_pos = (u, v)
-			self.draw_uv_polygon()
+			self.place_uv_polygon()
 
 	def on_close(self):
 		self.close()
 
-	def draw_texture(self):
+	def draw_pages(self, name, z):
+		# A quad for each texture page, laid out two by two, showing the
+		# page's quarter of a 256x1024 texture.
 		from pandac.PandaModules import Geom, GeomVertexFormat, GeomVertexData, GeomVertexWriter, GeomTristrips, GeomNode
-		if self.node_path_uv_polygon is not None:
-			self.node_path_uv_polygon.removeNode()
-		self.node_path_texture = self.render_uv.attachNewNode('node_path_texture')
+		node_path_pages = self.render_uv.attachNewNode(name)
 		for page in range(4):
 			if page < 2:
 				x = -256
@@ -1988,10 +1695,10 @@ class UVEditWindow(DirectObject):
 			texcoord = GeomVertexWriter(vdata, 'texcoord')
 			geom = Geom(vdata)
 			primitive = GeomTristrips(Geom.UHStatic)
-			vertex.addData3f(x, y, 0)
-			vertex.addData3f(x+256, y, 0)
-			vertex.addData3f(x, y-256, 0)
-			vertex.addData3f(x+256, y-256, 0)
+			vertex.addData3f(x, y, z)
+			vertex.addData3f(x+256, y, z)
+			vertex.addData3f(x, y-256, z)
+			vertex.addData3f(x+256, y-256, z)
 			color.addData4f(1.0, 1.0, 1.0, 1.0)
 			color.addData4f(1.0, 1.0, 1.0, 1.0)
 			color.addData4f(1.0, 1.0, 1.0, 1.0)
@@ -2005,107 +1712,70 @@ class UVEditWindow(DirectObject):
 			geom.addPrimitive(primitive)
 			node = GeomNode('gnode_%u' % page)
 			node.addGeom(geom)
-			node_path = self.node_path_texture.attachNewNode(node)
+			node_path = node_path_pages.attachNewNode(node)
 			node_path.setTag('texture_page', str(page))
-
-		self.node_path_texture.setTexture(self.app.world.texture.texture2)
-
-	def draw_uv_polygon(self):
-		def uv_to_window(page, u, v):
-			if page < 2:
-				x = -256
-			else:
-				x = 0
-			if page % 2 == 0:
-				y = 256
-			else:
-				y = 0
-			x = x + u
-			y = y - v
-			return (x, y, 1)
-		from pandac.PandaModules import NodePath, Geom, GeomVertexFormat, GeomVertexData, GeomVertexWriter, GeomLinestrips, GeomNode, GeomTristrips, TransparencyAttrib
-		if self.node_path_uv_polygon is not None:
-			self.node_path_uv_polygon.removeNode()
+		return node_path_pages
+
+	def draw_usage(self):
+		# Shades the texels the other polygons use over the texture: green
+		# for texels one polygon uses, yellow for texels several share.
+		from pandac.PandaModules import Texture as P3DTexture, TransparencyAttrib
+		self.usage_texture = P3DTexture('texel_usage')
+		self.usage_texture.setup2dTexture(256, 1024, P3DTexture.TUnsignedByte, P3DTexture.FRgba)
+		self.usage_texture.setMagfilter(P3DTexture.FTNearest)
+		self.usage_texture.setMinfilter(P3DTexture.FTNearest)
+		self.node_path_usage = self.draw_pages('node_path_usage', 0.5)
+		self.node_path_usage.setTexture(self.usage_texture)
+		self.node_path_usage.setTransparency(TransparencyAttrib.MAlpha)
+
+	def update_usage(self):
+		# Rewrites the rows of the pages whose usage changed. The polygon
+		# being edited is left out; place_uv_polygon shows it.
+		usage = self.app.world.get_texel_usage(self.app.selected_object)
+		# BGRA for a count of 0, 1 and 2 or more
+		texels = ['\x00\x00\x00\x00', '\x00\xff\x00\x60', '\x00\xff\xff\x80']
+		ram_image = self.usage_texture.modifyRamImage()
+		for page in usage.take_changed_pages():
+			rows = []
+			for row in usage.counts[page]:
+				rows.append(''.join([texels[min(count, 2)] for count in row]))
+			# Panda wants the bottom row first.
+			rows.reverse()
+			image = ''.join(rows)
+			ram_image.setSubdata((3 - page) * len(image), len(image), image)
+			counters.add('texture_uploads')
+			counters.add('texture_upload_bytes', len(image))
+
+	def init_uv_polygon(self):
+		# The outline, translucent fill and corner markers of the polygon
+		# being edited. They are made once; place_uv_polygon moves their
+		# vertices. Triangles repeat a vertex to fill the fifth slot.
+		from pandac.PandaModules import Geom, GeomVertexFormat, GeomVertexData, GeomVertexWriter, GeomLinestrips, GeomNode, GeomTristrips, TransparencyAttrib
 		self.node_path_uv_polygon = self.render_uv.attachNewNode('node_path_uv_polygon')
-		polygon = self.app.selected_object.source
-		if polygon.A.texcoord is None:
-			return False
-		# Draw wireframe polygon
-		vdata = GeomVertexData('name_me', GeomVertexFormat.getV3c4(), Geom.UHStatic)
-		vertex = GeomVertexWriter(vdata, 'vertex')
-		color = GeomVertexWriter(vdata, 'color')
-		primitive = GeomLinestrips(Geom.UHStatic)
-		inputs = self.app.polygon_edit_window.inputs
-		page = int(inputs['page'].GetValue())
-		A = [int(inputs[('U', 'A')].GetValue()), int(inputs[('V', 'A')].GetValue())]
-		B = [int(inputs[('U', 'B')].GetValue()), int(inputs[('V', 'B')].GetValue())]
-		C = [int(inputs[('U', 'C')].GetValue()), int(inputs[('V', 'C')].GetValue())]
-		if hasattr(polygon, 'D'):
-			D = [int(inputs[('U', 'D')].GetValue()), int(inputs[('V', 'D')].GetValue())]
-		vertex.addData3f(*uv_to_window(page, A[0], A[1]))
-		vertex.addData3f(*uv_to_window(page, B[0], B[1]))
-		if hasattr(polygon, 'D'):
-			vertex.addData3f(*uv_to_window(page, D[0], D[1]))
-		vertex.addData3f(*uv_to_window(page, C[0], C[1]))
-		vertex.addData3f(*uv_to_window(page, A[0], A[1]))
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		if hasattr(polygon, 'D'):
-			color.addData4f(1.0, 0.0, 1.0, 1.0)
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		if hasattr(polygon, 'D'):
-			primitive.addNextVertices(5)
-		else:
-			primitive.addNextVertices(4)
-		primitive.closePrimitive()
-		geom = Geom(vdata)
-		geom.addPrimitive(primitive)
-		node = GeomNode('gnode')
-		node.addGeom(geom)
-		self.node_path_uv_polygon.attachNewNode(node)
-		# Draw solid, partially-transparent polygon
-		vdata = GeomVertexData('name_me', GeomVertexFormat.getV3c4(), Geom.UHStatic)
-		vertex = GeomVertexWriter(vdata, 'vertex')
-		color = GeomVertexWriter(vdata, 'color')
-		primitive = GeomTristrips(Geom.UHStatic)
-		inputs = self.app.polygon_edit_window.inputs
-		page = int(inputs['page'].GetValue())
-		A = [int(inputs[('U', 'A')].GetValue()), int(inputs[('V', 'A')].GetValue())]
-		B = [int(inputs[('U', 'B')].GetValue()), int(inputs[('V', 'B')].GetValue())]
-		C = [int(inputs[('U', 'C')].GetValue()), int(inputs[('V', 'C')].GetValue())]
-		if hasattr(polygon, 'D'):
-			D = [int(inputs[('U', 'D')].GetValue()), int(inputs[('V', 'D')].GetValue())]
-		vertex.addData3f(*uv_to_window(page, A[0], A[1]))
-		vertex.addData3f(*uv_to_window(page, B[0], B[1]))
-		if hasattr(polygon, 'D'):
-			vertex.addData3f(*uv_to_window(page, D[0], D[1]))
-		vertex.addData3f(*uv_to_window(page, C[0], C[1]))
-		vertex.addData3f(*uv_to_window(page, A[0], A[1]))
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		if hasattr(polygon, 'D'):
-			color.addData4f(1.0, 0.0, 1.0, 1.0)
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		color.addData4f(1.0, 0.0, 1.0, 1.0)
-		if hasattr(polygon, 'D'):
+		self.uv_geom_nodes = []
+		for primitive_type, name in [(GeomLinestrips, 'gnode'), (GeomTristrips, 'gnode_poly')]:
+			vdata = GeomVertexData('name_me', GeomVertexFormat.getV3c4(), Geom.UHDynamic)
+			vertex = GeomVertexWriter(vdata, 'vertex')
+			color = GeomVertexWriter(vdata, 'color')
+			for i in range(5):
+				vertex.addData3f(0, 0, 1)
+				color.addData4f(1.0, 0.0, 1.0, 1.0)
+			primitive = primitive_type(Geom.UHStatic)
 			primitive.addNextVertices(5)
-		else:
-			primitive.addNextVertices(4)
-		primitive.closePrimitive()
-		geom = Geom(vdata)
-		geom.addPrimitive(primitive)
-		node = GeomNode('gnode_poly')
-		node.addGeom(geom)
-		trans_poly = self.node_path_uv_polygon.attachNewNode(node)
+			primitive.closePrimitive()
+			geom = Geom(vdata)
+			geom.addPrimitive(primitive)
+			node = GeomNode(name)
+			node.addGeom(geom)
+			self.uv_geom_nodes.append(node)
+			node_path = self.node_path_uv_polygon.attachNewNode(node)
+		trans_poly = node_path
 		trans_poly.setTransparency(TransparencyAttrib.MAlpha)
 		trans_poly.setAlphaScale(0.1)
 		trans_poly.setTag('whole_polygon', 'whole_polygon')
-		# Draw points
-		self.render_uv.setAttrib(CullFaceAttrib.make(CullFaceAttrib.MCullNone))
+		# Points
+		self.uv_markers = {}
 		for point in ['A', 'B', 'C', 'D']:
-			if not hasattr(polygon, point):
-				continue
 			vdata = GeomVertexData('name_me', GeomVertexFormat.getV3c4(), Geom.UHStatic)
 			vertex = GeomVertexWriter(vdata, 'vertex')
 			color = GeomVertexWriter(vdata, 'color')
@@ -2136,16 +1806,80 @@ class UVEditWindow(DirectObject):
 			node.addGeom(geom)
 			node_path = self.node_path_uv_polygon.attachNewNode(node)
 			node_path.setP(180)
-			node_path.setPos(*uv_to_window(page, *locals()[point]))
 			node_path.setTag('point', point)
+			self.uv_markers[point] = node_path
+
+	def place_uv_polygon(self):
+		from pandac.PandaModules import GeomVertexWriter
+		if not self.uvs:
+			self.node_path_uv_polygon.hide()
+			return
+		self.node_path_uv_polygon.show()
+		if 'D' in self.uvs:
+			orders = ['ABDCA', 'ABCDD']
+		else:
+			orders = ['ABCAA', 'ABCCC']
+		for node, order in zip(self.uv_geom_nodes, orders):
+			vertex = GeomVertexWriter(node.modifyGeom(0).modifyVertexData(), 'vertex')
+			for point in order:
+				vertex.setData3f(*uv_to_window(self.page, *self.uvs[point]))
+		for point, marker in self.uv_markers.items():
+			if point in self.uvs:
+				marker.setPos(*uv_to_window(self.page, *self.uvs[point]))
+				marker.show()
+			else:
+				marker.hide()
+
+	def load_uv_polygon(self):
+		# Takes the UVs from the polygon itself, not the edit window.
+		polygon = self.app.selected_object
+		self.uvs = {}
+		if isinstance(polygon, Polygon) and polygon.source.A.texcoord is not None:
+			self.page = polygon.source.texture_page
+			for vertex, point in zip(polygon.source.vertices(), 'ABCD'):
+				self.uvs[point] = list(vertex.texcoord.coords)
+		self.place_uv_polygon()
+
+	def draw_outlines(self):
+		# The UV outlines of every other selected polygon, as one geom.
+		from pandac.PandaModules import Geom, GeomVertexFormat, GeomVertexData, GeomVertexWriter, GeomLines, GeomNode
+		self.node_path_outlines.getChildren().detach()
+		polygons = [polygon for polygon in self.app.world.selection
+			if isinstance(polygon, Polygon) and polygon is not self.app.selected_object
+			and polygon.source.A.texcoord is not None]
+		if not polygons:
+			return
+		vdata = GeomVertexData('outlines', GeomVertexFormat.getV3c4(), Geom.UHStatic)
+		vertex = GeomVertexWriter(vdata, 'vertex')
+		color = GeomVertexWriter(vdata, 'color')
+		primitive = GeomLines(Geom.UHStatic)
+		for polygon in polygons:
+			corners = [uv_to_window(polygon.source.texture_page, *vertex_data.texcoord.coords) for vertex_data in polygon.source.vertices()]
+			if len(corners) == 4:
+				# Around the quad is A, B, D, C.
+				corners = [corners[0], corners[1], corners[3], corners[2]]
+			for i in range(len(corners)):
+				vertex.addData3f(*corners[i])
+				vertex.addData3f(*corners[(i + 1) % len(corners)])
+				color.addData4f(0.0, 1.0, 1.0, 1.0)
+				color.addData4f(0.0, 1.0, 1.0, 1.0)
+			primitive.addNextVertices(2 * len(corners))
+		primitive.closePrimitive()
+		geom = Geom(vdata)
+		geom.addPrimitive(primitive)
+		node = GeomNode('gnode_outlines')
+		node.addGeom(geom)
+		self.node_path_outlines.attachNewNode(node)
 
 	def from_data(self):
 		if self.uv_window:
-			self.draw_uv_polygon()
+			self.update_usage()
+			self.load_uv_polygon()
+			self.draw_outlines()
 
 	def zoom_in(self):
 		if self.zoom_level == 1:
-			page = int(self.app.polygon_edit_window.inputs['page'].GetValue())
+			page = self.page
 			if page < 2:
 				x = -128
 			else:
@@ -2179,10 +1913,20 @@ class SettingsWindow(wx.Frame):
 		"n: Next map\t\tt: Next terrain mode\n\n" +
 		"s: Save\t\t\to: Output texture\n\n" +
 		"i: Import Texture\tp: Edit palette\n\n" +
+		"Shift + I: Import a color image into one palette and texture page\n\n" +
 		"l: Edit lighting\t\t+: Add polygon\n\n" +
 		"d: Edit terrain dimensions\n\n" +
 		"f: Copy selected polygons\n\n" +
 		"u: Move all polygons\n\n" +
+		"CTRL + Z: Undo\t\tCTRL + Y: Redo\n\n" +
+		"g: Smooth normals\tShift + G: Flat normals\n(selected polygons, or all when none are selected)\n\n" +
+		"v: Compute visible angles (selected polygons, or all)\n\n" +
+		"r: Rebuild terrain heights and slopes from the textured floor polygons\n\n" +
+		"b: Find duplicated texture blocks and move UVs onto one copy\n\n" +
+		"k: Move the UVs of the selected polygons into free texture space\n\n" +
+		"Shift + P: Merge palettes that are the same within a tolerance\n\n" +
+		"a: Play or stop the map's texture, palette and mesh animations\n\n" +
+		"h: Show or hide the performance overlay\n\n" +
 		"Alt-Right Click / Mouse-Wheel Click + Drag: Pan Camera\n\n" +
 		"Tab: While multiple terrain tiles are selected, open multi-tile editing window\n\n" +
 		"CTRL + A: Select all Polygons / Tiles depending on view.\nCTRL + A repeatedly: In terrain view, cycle through multiple levels.\n\n" +
@@ -2433,12 +2177,15 @@ class TerrainEditWindow(wx.Frame):
 		# Find polygon and select it
 		label = wx.StaticText(panel, wx.ID_ANY, '')
 		sizer_main_table.Add(label)
-		button = wx.Button(panel, wx.ID_ANY, 'Find Polygon')
+		self.find_polygon_buttons = []
+		button = wx.Button(panel, wx.ID_ANY, 'Find Polygon (0)')
 		button.Bind(wx.EVT_BUTTON, self.on_find_polygon0)
 		sizer_main_table.Add(button)
-		button = wx.Button(panel, wx.ID_ANY, 'Find Polygon')
+		self.find_polygon_buttons.append(button)
+		button = wx.Button(panel, wx.ID_ANY, 'Find Polygon (0)')
 		button.Bind(wx.EVT_BUTTON, self.on_find_polygon1)
 		sizer_main_table.Add(button)
+		self.find_polygon_buttons.append(button)
 		sizer_sections.Add(sizer_main_table, flag=wx.ALL, border=10)
 		# Buttons
 		apply_button = wx.Button(panel, wx.ID_APPLY)
@@ -2487,6 +2234,9 @@ class TerrainEditWindow(wx.Frame):
 			self.inputs[(i, 'surface_type')].SetSelection(tile.surface_type)
 			self.inputs[(i, 'cant_walk')].SetValue(bool(tile.cant_walk))
 			self.inputs[(i, 'cant_cursor')].SetValue(bool(tile.cant_cursor))
+			count = len(self.app.world.polygons_for_tile(x, z, i))
+			self.find_polygon_buttons[i].SetLabel('Find Polygon (%u)' % count)
+			self.find_polygon_buttons[i].Enable(count > 0)
 
 	def to_data(self, foo):
 		selected_tile = self.app.selected_object
@@ -2494,42 +2244,19 @@ class TerrainEditWindow(wx.Frame):
 		tiles = []
 		tiles.append(self.app.world.terrain.tiles[0][z][x])
 		tiles.append(self.app.world.terrain.tiles[1][z][x])
+		self.app.world.journal.begin('Edit terrain')
 		for i, tile in enumerate(tiles):
-			tile.height = int(self.inputs[(i, 'height')].GetValue())
-			if(tile.height < 0):
-				tile.height = 0
-				print("Terrain Warning: Height can't be less than 0.")
-
-			#Info from Xifanie, max height is 63.5?
-			elif(tile.height > 63):
-				tile.height = 63
-				print("Terrain Warning: Height can't be greater than 63.")
-			tile.depth = int(self.inputs[(i, 'depth')].GetValue())
-			if(tile.depth < 0):
-				tile.depth = 0
-				print("Terrain Warning: Depth can't be less than 0.")
-			#Current max depth game allows is unknown, but ubyte max is 255
-			elif(tile.depth > 255):
-				tile.depth = 255
-				print("Terrain Warning: Depth can't be greater than 255.")
-			tile.slope_height = int(self.inputs[(i, 'slope_height')].GetValue())
-			if(tile.slope_height < 0):
-				tile.slope_height = 0
-				print("Terrain Warning: Slope Height can't be less than 0.")
-			#Current max slope game allows is unknown, but ubyte max is 255
-			elif(tile.slope_height > 255):
-				tile.slope_height = 255
-				print("Terrain Warning: Slope Height can't be greater than 255.")
-			tile.slope_type = slope_types[self.inputs[(i, 'slope_type')].GetCurrentSelection()][0]
-			tile.surface_type = self.inputs[(i, 'surface_type')].GetCurrentSelection()
-			tile.cant_walk = 1 if self.inputs[(i, 'cant_walk')].GetValue() else 0
-			tile.cant_cursor = 1 if self.inputs[(i, 'cant_cursor')].GetValue() else 0
-			# TODO: Should probably go somewhere else
-			tag = tile.node_path.getTag('tile_xyz')
-			tile.init_node_path()
-			tile.node_path.setTag('tile_xyz', tag)
-			if tile.is_selected:
-				tile.select()
+			values = {
+				'height': int(self.inputs[(i, 'height')].GetValue()),
+				'depth': int(self.inputs[(i, 'depth')].GetValue()),
+				'slope_height': int(self.inputs[(i, 'slope_height')].GetValue()),
+				'slope_type': slope_types[self.inputs[(i, 'slope_type')].GetCurrentSelection()][0],
+				'surface_type': self.inputs[(i, 'surface_type')].GetCurrentSelection(),
+				'cant_walk': 1 if self.inputs[(i, 'cant_walk')].GetValue() else 0,
+				'cant_cursor': 1 if self.inputs[(i, 'cant_cursor')].GetValue() else 0,
+			}
+			self.app.world.edit_tiles([tile], values)
+		self.app.world.journal.end()
 
 class MultiTerrainEditWindow(wx.Frame):
 	def __init__(self, parent, ID, title):
@@ -2605,47 +2332,19 @@ class MultiTerrainEditWindow(wx.Frame):
 		pass
 
 	def to_data(self, foo):
-		for tile in self.app.selected_objects:
-			if self.inputs[(0, 'height')].GetValue():
-				tile.height = int(self.inputs[(0, 'height')].GetValue())
-				if(tile.height < 0):
-					tile.height = 0
-					print("Terrain Warning: Height can't be less than 0.")
-				#Info from Xifanie, max height is 63.5?
-				elif(tile.height > 63):
-					tile.height = 63
-					print("Terrain Warning: Height can't be greater than 63.")
-			if self.inputs[(0, 'depth')].GetValue():
-				tile.depth = int(self.inputs[(0, 'depth')].GetValue())
-				if(tile.depth < 0):
-					tile.depth = 0
-					print("Terrain Warning: Depth can't be less than 0.")
-				#Current max depth game allows is unknown, but ubyte max is 255
-				elif(tile.depth > 255):
-					tile.depth = 255
-					print("Terrain Warning: Depth can't be greater than 255.")
-			if self.inputs[(0, 'slope_height')].GetValue():
-				tile.slope_height = int(self.inputs[(0, 'slope_height')].GetValue())
-				if(tile.slope_height < 0):
-					tile.slope_height = 0
-					print("Terrain Warning: Depth can't be less than 0.")
-				#Current max slope_height game allows is unknown, but ubyte max is 255
-				elif(tile.slope_height > 255):
-					tile.slope_height = 255
-					print("Terrain Warning: Depth can't be greater than 255.")
-			if self.inputs[(0, 'slope_type')].GetCurrentSelection() != -1:
-				tile.slope_type = slope_types[self.inputs[(0, 'slope_type')].GetCurrentSelection()][0]
-			if self.inputs[(0, 'surface_type')].GetCurrentSelection() != -1:
-				tile.surface_type = self.inputs[(0, 'surface_type')].GetCurrentSelection()
-
-			tile.cant_walk = 1 if self.inputs[(0, 'cant_walk')].GetValue() else 0
-			tile.cant_cursor = 1 if self.inputs[(0, 'cant_cursor')].GetValue() else 0
-				
-			tag = tile.node_path.getTag('tile_xyz')
-			tile.init_node_path()
-			tile.node_path.setTag('tile_xyz', tag)
-			if tile.is_selected:
-				tile.select()
+		# Empty inputs leave that field of the tiles as it is. The check
+		# boxes always apply.
+		values = {}
+		for field in ['height', 'depth', 'slope_height']:
+			if self.inputs[(0, field)].GetValue():
+				values[field] = int(self.inputs[(0, field)].GetValue())
+		if self.inputs[(0, 'slope_type')].GetCurrentSelection() != -1:
+			values['slope_type'] = slope_types[self.inputs[(0, 'slope_type')].GetCurrentSelection()][0]
+		if self.inputs[(0, 'surface_type')].GetCurrentSelection() != -1:
+			values['surface_type'] = self.inputs[(0, 'surface_type')].GetCurrentSelection()
+		values['cant_walk'] = 1 if self.inputs[(0, 'cant_walk')].GetValue() else 0
+		values['cant_cursor'] = 1 if self.inputs[(0, 'cant_cursor')].GetValue() else 0
+		self.app.world.edit_tiles(list(self.app.world.selection), values)
 
 
 class PaletteEditWindow(wx.Frame):
@@ -2980,9 +2679,12 @@ class PaletteEditWindow(wx.Frame):
 			self.palettes.append(selfpalette)
 
 	def to_data(self, foo):
+		palettes = range(len(self.palettes))
+		old_states = [self.app.world.palette_state(y) for y in palettes]
 		for y, palette in enumerate(self.palettes):
 			for x, color in enumerate(palette):
 				self.app.world.color_palettes[y].colors.colors[x] = color
+		self.app.world.record_palettes('Edit palettes', palettes, old_states)
 
 class LightsEditWindow(wx.Frame):
 	def __init__(self, parent, ID, title):
@@ -3290,33 +2992,68 @@ class LightsEditWindow(wx.Frame):
 		self.to_data()
 
 	def to_data(self):
+		# Sliders call this for every step they move; the lights are only
+		# rebuilt once a frame.
+		world = self.app.world
+		old_state = world.light_state()
 		for i in range(3):
-			self.app.world.dir_lights[i].color = self.colors[i]
+			world.dir_lights[i].color = self.colors[i]
 			elevation = 90 - self.elevation_sliders[i].GetValue()
 			azimuth = self.azimuth_sliders[i].GetValue()
 			(x, y, z) = sphere_to_vector(elevation, azimuth)
-			self.app.world.dir_lights[i].direction.X = x
-			self.app.world.dir_lights[i].direction.Y = y
-			self.app.world.dir_lights[i].direction.Z = z
-			self.app.world.dir_lights[i].direction.coords = (x, y, z)
-			self.app.world.dir_lights[i].init_node_path()
-			self.app.world.dir_lights[i].init_node_path_line(i)
-			self.app.world.dir_lights[i].show_line(True)
-		self.app.world.amb_light.color = self.colors[3]
-		self.app.world.amb_light.init_node_path()
-		self.app.world.background.color1 = self.colors[4]
-		self.app.world.background.color2 = self.colors[5]
-		self.app.world.background.init_node_path()
+			world.dir_lights[i].direction.set_coords(x, y, z)
+		world.amb_light.color = self.colors[3]
+		world.background.color1 = self.colors[4]
+		world.background.color2 = self.colors[5]
+		world.post_change('lights', world.update_lights)
+		world.record_lights('Edit lights', old_state)
 
 
 		
 # This defines what the mouse clicks do		
+def lazy_window(name, make):
+	# A Map_Viewer property that builds the window the first time it is
+	# used. Most sessions never open most of the edit windows, and building
+	# them all held up the first frame.
+	def get_window(self):
+		try:
+			return self.windows[name]
+		except KeyError:
+			pass
+		start_time = time.time()
+		window = make(self)
+		self.windows[name] = window
+		if self.startup_times is not None:
+			print 'Built %s in %.3f s' % (name, time.time() - start_time)
+		return window
+	return property(get_window)
+
 class Map_Viewer(DirectObject):
-	def __init__(self, *args, **kwargs):
+	polygon_add_window = lazy_window('polygon_add_window', lambda app: PolygonAddWindow(app, -1, 'Add Polygon'))
+	polygon_edit_window = lazy_window('polygon_edit_window', lambda app: PolygonEditWindow(app, -1, 'Edit Polygon'))
+	terrain_edit_window = lazy_window('terrain_edit_window', lambda app: TerrainEditWindow(app, -1, 'Edit Terrain'))
+	multi_terrain_edit_window = lazy_window('multi_terrain_edit_window', lambda app: MultiTerrainEditWindow(app, -1, 'Edit Multiple Terrains'))
+	terrain_dimensions_edit_window = lazy_window('terrain_dimensions_edit_window', lambda app: TerrainDimensionsEditWindow(app, -1, 'Edit Terrain Dimensions'))
+	move_all_polygons_edit_window = lazy_window('move_all_polygons_edit_window', lambda app: MoveAllPolygonsEditWindow(app, -1, 'Move All Polygons'))
+	palette_edit_window = lazy_window('palette_edit_window', lambda app: PaletteEditWindow(app, -1, 'Edit Palettes'))
+	lights_edit_window = lazy_window('lights_edit_window', lambda app: LightsEditWindow(app, -1, 'Edit Lights and Background'))
+	settings_window = lazy_window('settings_window', lambda app: SettingsWindow(app, -1, 'Settings Window'))
+
+	def __init__(self, startup_time=None):
+		# startup_time, when given, is when the editor started loading, and
+		# how long each step up to the first frame took is printed.
+		self.startup_times = None
+		if startup_time is not None:
+			self.startup_times = [('Start', startup_time)]
+			self.mark_startup('Import modules')
+		# wx windows built so far, see lazy_window
+		self.windows = {}
+		from direct.showbase.ShowBase import ShowBase
 		self.showbase = ShowBase()
 		wp = WindowProperties()
 		wp.setTitle('Ganesha')
 		self.showbase.win.requestProperties(wp)
+		self.mark_startup('Open Panda window')
 		self.state = ViewerState(self, 'viewer_state')
 		self.mouse = ViewerMouse(self)
 		self.world = World(self)
@@ -3333,6 +3070,7 @@ class Map_Viewer(DirectObject):
 		self.accept('s', self.world.write)
 		self.accept('o', self.output_texture)
 		self.accept('i', self.import_texture)
+		self.accept('shift-i', self.import_image)
 		self.accept('p', self.edit_palettes)
 		self.accept('l', self.edit_lights)
 		self.accept('+', self.add_polygon)
@@ -3343,7 +3081,6 @@ class Map_Viewer(DirectObject):
 
 		base.disableMouse()
 		self.state.request('Spin')
-		self.selected_objects = []
 		self.multiSelect = False
 		self.accept('control', self.multi_select)
 		self.accept('control-up', self.end_multi_select)
@@ -3358,7 +3095,42 @@ class Map_Viewer(DirectObject):
 		self.accept('control-a', self.select_all)
 		self.select_all_mode = 0
 		self.accept('tab', self.open_multi_terrain_editor)
+		self.accept('g', self.smooth_normals)
+		self.accept('shift-g', self.flat_normals)
+		self.accept('v', self.compute_visible_angles)
+		self.accept('r', self.derive_terrain)
+		self.accept('b', self.deduplicate_texture)
+		self.accept('k', self.pack_uvs)
+		self.accept('shift-p', self.merge_palettes)
+		self.accept('a', self.toggle_animation)
+		self.hud = PerformanceHUD()
+		self.accept('h', self.hud.toggle)
+		self.accept('control-z', self.undo)
+		self.accept('control-y', self.redo)
 		#base.messenger.toggleVerbose()
+		self.mark_startup('Set up viewer')
+
+	def mark_startup(self, name):
+		if self.startup_times is not None:
+			self.startup_times.append((name, time.time()))
+
+	def report_startup(self, task):
+		self.mark_startup('First frame')
+		print 'Startup timing:'
+		times = self.startup_times
+		for i in range(1, len(times)):
+			print '%-20s %7.3f s' % (times[i][0], times[i][1] - times[i - 1][1])
+		print '%-20s %7.3f s' % ('Total', times[-1][1] - times[0][1])
+		return task.done
+
+	def window_shown(self, name):
+		# Whether the window is open, without building it.
+		return name in self.windows and self.windows[name].IsShown()
+
+	def hide_window(self, name):
+		if name in self.windows:
+			self.windows[name].clear_inputs()
+			self.windows[name].Show(False)
 
 	# TODO: move these functions somewhere after start (organize)
 
@@ -3369,13 +3141,9 @@ class Map_Viewer(DirectObject):
 		self.multiSelect = False
 
 	def select_all(self):
-		#Needs special version of unselect to avoid crashes
-		for obj in self.selected_objects:
-			obj.unselect()
-			self.selected_objects = []
-		if self.selected_object:
-			self.selected_object.unselect()
-			self.selected_object = None
+		selection = self.world.selection
+		selection.clear()
+		self.selected_object = None
 		
 		if self.terrain_mode == MOSTLY_TERRAIN or self.terrain_mode == TERRAIN_ONLY:
 			if self.select_all_mode == 2:
@@ -3383,102 +3151,63 @@ class Map_Viewer(DirectObject):
 			else:
 				self.select_all_mode += 1
 			if self.select_all_mode == 2:
-				for i in range(len(self.world.terrain.tiles)):
-					for j in range(len(self.world.terrain.tiles[i])):
-						for p in range(len(self.world.terrain.tiles[i][j])):
-							self.world.terrain.tiles[i][j][p].select()
-							self.selected_objects.append(self.world.terrain.tiles[i][j][p])
+				for level in range(len(self.world.terrain.tiles)):
+					selection.invert(level)
 			else:
-				for j in range(len(self.world.terrain.tiles[self.select_all_mode])):
-					for p in range(len(self.world.terrain.tiles[self.select_all_mode][j])):
-						self.world.terrain.tiles[self.select_all_mode][j][p].select()
-						self.selected_objects.append(self.world.terrain.tiles[self.select_all_mode][j][p])
+				selection.invert(self.select_all_mode)
 		else:
-			for obj in self.world.polygons:
-				obj.select()
-				self.selected_objects.append(obj)
+			selection.invert(None)
 		
 	def copy_polygon(self):
-		texture = True
-		if isinstance(self.selected_object, Polygon) or (len(self.selected_objects) > 0 and isinstance(self.selected_objects[0], Polygon)):
-			if not len(self.selected_objects) == 0:
-				for poly in self.selected_objects:
-					texture = True
-					if(poly.source.unknown5 is not None):
-						texture = False
-					if poly is not None:
-						self.world.copy_polygon_to_XOffset(poly, 0 * 28, texture)
-			elif self.selected_object:
-				if(self.selected_object.source.unknown5 is not None):
+		if self.world.selection.kind is Polygon:
+			self.world.journal.begin('Copy polygons')
+			for poly in list(self.world.selection):
+				texture = True
+				if(poly.source.unknown5 is not None):
 					texture = False
-				self.world.copy_polygon_to_XOffset(self.selected_object, 0 * 28, texture)
+				self.world.copy_polygon_to_XOffset(poly, 0 * 28, texture)
+			self.world.journal.end()
 
 	def increase_Y(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				self.world.move_selected_poly('Y', 12, 1, self.selected_objects)
-			else: #It is a tile
-				self.world.move_selected_tile(1, self.selected_objects)
-		elif isinstance(self.selected_object, Polygon):
-			self.world.move_selected_poly('Y', 12, 1, [self.selected_object])
-		else: #It is a tile
-			if self.selected_object:
-				self.world.move_selected_tile(1, [self.selected_object])
+		selection = self.world.selection
+		if selection.kind is Polygon:
+			self.world.move_selected_poly('Y', 12, 1, list(selection))
+		elif selection.kind is Tile:
+			self.world.move_selected_tile(1, list(selection))
 
 	def decrease_Y(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				self.world.move_selected_poly('Y', 12, -1, self.selected_objects)
-			else: #It is a tile
-				self.world.move_selected_tile(-1, self.selected_objects)
-		elif isinstance(self.selected_object, Polygon):
-			self.world.move_selected_poly('Y', 12, -1, [self.selected_object])
-		else: #It is a tile
-			if self.selected_object:
-				self.world.move_selected_tile(-1, [self.selected_object])
+		selection = self.world.selection
+		if selection.kind is Polygon:
+			self.world.move_selected_poly('Y', 12, -1, list(selection))
+		elif selection.kind is Tile:
+			self.world.move_selected_tile(-1, list(selection))
 
 	def increase_X(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				self.world.move_selected_poly('X', 28, 1, self.selected_objects)
-		elif isinstance(self.selected_object, Polygon):
-			self.world.move_selected_poly('X', 28, 1, [self.selected_object])
+		if self.world.selection.kind is Polygon:
+			self.world.move_selected_poly('X', 28, 1, list(self.world.selection))
 
 	def decrease_X(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				self.world.move_selected_poly('X', 28, -1, self.selected_objects)
-		elif isinstance(self.selected_object, Polygon):
-			self.world.move_selected_poly('X', 28, -1, [self.selected_object])
+		if self.world.selection.kind is Polygon:
+			self.world.move_selected_poly('X', 28, -1, list(self.world.selection))
 		
 	def increase_Z(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				self.world.move_selected_poly('Z', 28, 1, self.selected_objects)
-		elif isinstance(self.selected_object, Polygon):
-			self.world.move_selected_poly('Z', 28, 1, [self.selected_object])
+		if self.world.selection.kind is Polygon:
+			self.world.move_selected_poly('Z', 28, 1, list(self.world.selection))
 
 	def decrease_Z(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				self.world.move_selected_poly('Z', 28, -1, self.selected_objects)
-		elif isinstance(self.selected_object, Polygon):
-			self.world.move_selected_poly('Z', 28, -1, [self.selected_object])
+		if self.world.selection.kind is Polygon:
+			self.world.move_selected_poly('Z', 28, -1, list(self.world.selection))
 
 	def delete_selected(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Polygon):
-				for obj in self.selected_objects:
-					self.world.delete_polygon(obj)
-					self.unselect()
-					self.polygon_edit_window.clear_inputs()
-					self.polygon_edit_window.Show(False)
-					self.uv_edit_window.close()
-		elif isinstance(self.selected_object, Polygon):
-			self.world.delete_polygon(self.selected_object)
-			self.unselect()
-			self.polygon_edit_window.clear_inputs()
-			self.polygon_edit_window.Show(False)
+		if self.world.selection.kind is Polygon:
+			polygons = list(self.world.selection)
+			self.world.selection.clear()
+			self.selected_object = None
+			self.world.journal.begin('Delete polygons')
+			for obj in polygons:
+				self.world.delete_polygon(obj)
+			self.world.journal.end()
+			self.hide_window('polygon_edit_window')
 			self.uv_edit_window.close()
 	
 		
@@ -3487,28 +3216,29 @@ class Map_Viewer(DirectObject):
 		self.wx_win = wx.Frame(None, -1, 'Ganesha wxWindow', wx.DefaultPosition)
 		self.wx_event_loop = wx.EventLoop()
 		wx.EventLoop.SetActive(self.wx_event_loop)
-		self.polygon_add_window = PolygonAddWindow(self, -1, 'Add Polygon')
-		self.polygon_edit_window = PolygonEditWindow(self, -1, 'Edit Polygon')
+		# The UV window only opens its Panda window when asked to. The wx
+		# windows are built when first used.
 		self.uv_edit_window = UVEditWindow(self)
 		self.accept('uv_edit_window_closed', self.uv_edit_window.on_close)
-		self.terrain_edit_window = TerrainEditWindow(self, -1, 'Edit Terrain')
-		self.multi_terrain_edit_window = MultiTerrainEditWindow(self, -1, 'Edit Multiple Terrains')
-		self.terrain_dimensions_edit_window = TerrainDimensionsEditWindow(self, -1, 'Edit Terrain Dimensions')
-		self.move_all_polygons_edit_window = MoveAllPolygonsEditWindow(self, -1, 'Move All Polygons')
-		self.palette_edit_window = PaletteEditWindow(self, -1, 'Edit Palettes')
-		self.lights_edit_window = LightsEditWindow(self, -1, 'Edit Lights and Background')
 		taskMgr.add(self.handle_wx_events, 'handle_wx_events')
 		render.setAttrib(CullFaceAttrib.make(CullFaceAttrib.MCullCounterClockwise))
+		self.mark_startup('Start wx')
 		self.world.read_gns(gns_path)
 		self.world.read()
 		self.world.set_terrain_alpha(self.terrain_mode)
 		self.set_full_light(self.full_light_enabled)
-		self.settings_window = SettingsWindow(self, -1, 'Settings Window')
+		self.mark_startup('Read map')
+		if self.startup_times is not None:
+			# The frame is drawn by igLoop, which runs at sort 50.
+			taskMgr.add(self.report_startup, 'report_startup', sort=60)
 		run()
 
 	def handle_wx_events(self, task):
+		events = 0
 		while self.wx_event_loop.Pending():
 			self.wx_event_loop.Dispatch()
+			events += 1
+		counters.add('wx_events', events)
 		self.wx_app.ProcessIdle()
 		return task.cont
 
@@ -3545,46 +3275,186 @@ class Map_Viewer(DirectObject):
 			path = dlg.GetPath()
 			if path[-4:].lower() != '.png':
 				path += '.png'
-			self.world.texture.export(path, self.world.map.get_texture())
+			self.world.texture.export(path)
 		dlg.Destroy()
 		return None
 		
 	def import_texture(self):
 		dlg = wx.FileDialog(self.wx_win, "Import Texture from PNG", wildcard = 'PNG Files (*.PNG)|*.PNG;*.png')
 		if dlg.ShowModal() == wx.ID_OK:
-			self.world.texture.import_(dlg.GetPath(), self.world.color_palettes)
+			self.world.import_texture(dlg.GetPath())
 		dlg.Destroy()
 		return None
 
+	def import_image(self):
+		# Quantizes a true color PNG into one palette and one page of the
+		# texture, or the whole texture.
+		dlg = wx.FileDialog(self.wx_win, "Import Image from PNG", wildcard = 'PNG Files (*.PNG)|*.PNG;*.png')
+		if dlg.ShowModal() != wx.ID_OK:
+			dlg.Destroy()
+			return None
+		path = dlg.GetPath()
+		dlg.Destroy()
+		regions = [(0, page * 256, 256, 256) for page in range(4)] + [(0, 0, 256, 1024)]
+		choices = ['Page %u (rows %u to %u)' % (page, page * 256, page * 256 + 255) for page in range(4)] + ['Whole texture']
+		dlg = wx.SingleChoiceDialog(self.wx_win, 'Texture area to import into', 'Import Image', choices)
+		if dlg.ShowModal() != wx.ID_OK:
+			dlg.Destroy()
+			return None
+		region = regions[dlg.GetSelection()]
+		dlg.Destroy()
+		choices = ['Palette %u' % i for i in range(len(self.world.color_palettes))]
+		dlg = wx.SingleChoiceDialog(self.wx_win, 'Palette to replace with the image colors', 'Import Image', choices)
+		if dlg.ShowModal() != wx.ID_OK:
+			dlg.Destroy()
+			return None
+		palette = dlg.GetSelection()
+		dlg.Destroy()
+		if self.world.import_image(path, palette, region):
+			self.refresh_windows()
+		return None
+
 	def set_full_light(self, light_on):
 		self.full_light_enabled = light_on
 		self.world.set_full_light(light_on)
 
+	def smooth_normals(self):
+		self.recompute_normals(True)
+
+	def flat_normals(self):
+		self.recompute_normals(False)
+
+	def recompute_normals(self, smooth):
+		# Works on the selected polygons, or the whole map when no
+		# polygons are selected.
+		if self.world.selection.kind is Polygon:
+			polygons = list(self.world.selection)
+		else:
+			polygons = self.world.polygons
+		self.world.recompute_normals(polygons, smooth)
+		if isinstance(self.selected_object, Polygon) and self.window_shown('polygon_edit_window'):
+			self.polygon_edit_window.from_data(self.selected_object)
+
+	def compute_visible_angles(self):
+		# Like the normals, for the selected polygons or the whole map.
+		if self.world.selection.kind is Polygon:
+			polygons = list(self.world.selection)
+		else:
+			polygons = self.world.polygons
+		self.world.compute_visible_angles(polygons)
+		if isinstance(self.selected_object, Polygon) and self.window_shown('polygon_edit_window'):
+			self.polygon_edit_window.from_data(self.selected_object)
+
+	def derive_terrain(self):
+		self.world.derive_terrain()
+		if isinstance(self.selected_object, Tile) and self.window_shown('terrain_edit_window'):
+			self.terrain_edit_window.from_data(self.selected_object)
+		elif isinstance(self.selected_object, Polygon) and self.window_shown('polygon_edit_window'):
+			self.polygon_edit_window.from_data(self.selected_object)
+
+	def pack_uvs(self):
+		# Finds free texture space for the UVs of the selected polygons.
+		if self.world.selection.kind is not Polygon:
+			print 'Select the polygons whose UVs should be packed.'
+			return
+		left_over = self.world.pack_uvs(list(self.world.selection))
+		if left_over:
+			print 'No free texture space for %u polygons.' % len(left_over)
+		self.refresh_windows()
+
+	def toggle_animation(self):
+		world = self.world
+		world.animator.toggle()
+		if world.animator.playing:
+			print 'Playing %u texture animations, %u palette animations and %u mesh frames.' % (len(world.texture_anim), len(world.palette_anim), len(world.polygon_anim))
+
+	def merge_palettes(self):
+		tolerance = wx.GetNumberFromUser('Palettes whose colors all differ by no more than this\nin each 5 bit channel are merged.', 'Tolerance', 'Merge Palettes', 0, 0, 31, self.wx_win)
+		if tolerance < 0:
+			return
+		freed = self.world.merge_palettes(tolerance)
+		if freed:
+			print 'Palettes no longer used:', ', '.join([str(palette) for palette in freed])
+		else:
+			print 'No palettes merged.'
+		self.refresh_windows()
+
+	def deduplicate_texture(self):
+		(groups, reclaimable) = self.world.find_texture_duplicates()
+		print '%u groups of identical 8x8 texture blocks, %u texels reclaimable.' % (len(groups), reclaimable)
+		if not groups:
+			return
+		dlg = wx.MessageDialog(self.wx_win, 'Move polygon UVs off %u texels of duplicated texture blocks?' % reclaimable, 'Deduplicate Texture', wx.YES_NO)
+		if dlg.ShowModal() == wx.ID_YES:
+			moved = self.world.deduplicate_texture()
+			print 'Moved the UVs of %u polygons.' % moved
+			self.refresh_windows()
+		dlg.Destroy()
+
+	def undo(self):
+		name = self.world.undo()
+		if name is None:
+			print 'Nothing to undo.'
+			return
+		print 'Undo:', name
+		self.refresh_windows()
+
+	def redo(self):
+		name = self.world.redo()
+		if name is None:
+			print 'Nothing to redo.'
+			return
+		print 'Redo:', name
+		self.refresh_windows()
+
+	def refresh_windows(self):
+		# After an undo or redo the edit windows show the objects as they
+		# were; the selected object may even be gone.
+		obj = self.selected_object
+		if isinstance(obj, Polygon):
+			if self.world.get_polygon(obj.handle) is not obj:
+				self.selected_object = None
+				self.hide_window('polygon_edit_window')
+				self.uv_edit_window.close()
+			elif self.window_shown('polygon_edit_window'):
+				self.polygon_edit_window.from_data(obj)
+				self.uv_edit_window.from_data()
+		elif isinstance(obj, Tile):
+			try:
+				found = self.world.terrain.tiles[obj.y][obj.z][obj.x] is obj
+			except IndexError:
+				found = False
+			if not found:
+				self.selected_object = None
+				self.hide_window('terrain_edit_window')
+			elif self.window_shown('terrain_edit_window'):
+				self.terrain_edit_window.from_data(obj)
+		if self.window_shown('palette_edit_window'):
+			self.palette_edit_window.from_data(self.world.color_palettes)
+		if self.window_shown('lights_edit_window'):
+			self.lights_edit_window.from_data(self.world.dir_lights, self.world.amb_light, self.world.background)
+
 	def find_polygon(self, level):
 		tile = self.selected_object
-		found = False
-		for polygon in self.world.polygons:
-			if polygon.terrain_coords == (tile.x, tile.z, level):
-				self.terrain_mode = MOSTLY_MESH
-				self.world.set_terrain_alpha(self.terrain_mode)
-				self.select(polygon)
-				found = True
-				break
-		if not found:
+		polygons = self.world.polygons_for_tile(tile.x, tile.z, level)
+		if polygons:
+			self.terrain_mode = MOSTLY_MESH
+			self.world.set_terrain_alpha(self.terrain_mode)
+			self.select(polygons[0])
+		else:
 			print 'No polygon found for the selected tile.'
 
 	def find_tile(self):
-		polygon = self.selected_object
-		(x, z, level) = polygon.source.terrain_coords
-		tile = None
-		try:
-			tile = self.world.terrain.tiles[level][z][x]
-		except IndexError:
+		#Selects the tiles of every selected polygon, the first one is shown in the terrain editor
+		tiles = self.world.tiles_for_polygons(self.world.selection)
+		if not tiles:
 			print 'No tile found for the selected polygon.'
-		if tile is not None:
-			self.terrain_mode = MOSTLY_TERRAIN
-			self.world.set_terrain_alpha(self.terrain_mode)
-			self.select(tile)
+			return
+		self.terrain_mode = MOSTLY_TERRAIN
+		self.world.set_terrain_alpha(self.terrain_mode)
+		self.select(tiles[0])
+		for tile in tiles[1:]:
+			self.world.selection.add(tile)
 
 	def add_polygon(self):
 		if self.terrain_mode in [MESH_ONLY, MOSTLY_MESH]:
@@ -3599,12 +3469,7 @@ class Map_Viewer(DirectObject):
 		self.settings_window.Show(True)	
 
 	def open_multi_terrain_editor(self):
-		if len(self.selected_objects) > 0:
-			if isinstance(self.selected_objects[0], Tile):
-				self.multi_terrain_edit_window.clear_inputs()
-				self.multi_terrain_edit_window.Show(True)
-				self.multi_terrain_edit_window.Raise()
-		elif isinstance(self.selected_object, Tile):
+		if self.world.selection.kind is Tile:
 			self.multi_terrain_edit_window.clear_inputs()
 			self.multi_terrain_edit_window.Show(True)
 			self.multi_terrain_edit_window.Raise()
@@ -3619,8 +3484,7 @@ class Map_Viewer(DirectObject):
 	def delete_polygon(self):
 		self.world.delete_polygon(self.selected_object)
 		self.unselect()
-		self.polygon_edit_window.clear_inputs()
-		self.polygon_edit_window.Show(False)
+		self.hide_window('polygon_edit_window')
 		self.uv_edit_window.close()
 
 	def edit_lights(self):
@@ -3638,99 +3502,73 @@ class Map_Viewer(DirectObject):
 		self.unselect()
 		if hovered_object:
 			if self.multiSelect:
-				#If the object is not already selected
-				if not hovered_object in self.selected_objects:
-					#If the list is empty, or if the types in the list match the type selected (so we don't mix Tile / Poly)
-					if len(self.selected_objects) == 0 or type(self.selected_objects[0]) == type(hovered_object):
-						self.selected_objects.append(hovered_object)
-						hovered_object.select()
-					#If the user tries to multi-select polygons and tiles together, don't
-					else:
-						pass
-				#If the object is already selected
-				else:
-					self.selected_objects.remove(hovered_object)
-					hovered_object.unselect()
+				#Toggles the object, unless the user tries to multi-select polygons and tiles together
+				self.world.selection.toggle(hovered_object)
 			else:
-				self.multi_terrain_edit_window.clear_inputs()
-				self.multi_terrain_edit_window.Show(False)
+				self.hide_window('multi_terrain_edit_window')
 				self.selected_object = hovered_object
-				self.selected_object.select()
+				self.world.selection.add(self.selected_object)
 
 			if isinstance(self.selected_object, Polygon):
-				self.multi_terrain_edit_window.clear_inputs()
-				self.multi_terrain_edit_window.Show(False)
-				self.terrain_edit_window.clear_inputs()
-				self.terrain_edit_window.Show(False)
+				self.hide_window('multi_terrain_edit_window')
+				self.hide_window('terrain_edit_window')
 				self.polygon_edit_window.from_data(self.selected_object)
 				self.polygon_edit_window.Show(True)
 				self.polygon_edit_window.Raise()
 			elif isinstance(self.selected_object, Tile):
-				self.polygon_edit_window.clear_inputs()
-				self.polygon_edit_window.Show(False)
+				self.hide_window('polygon_edit_window')
 				self.uv_edit_window.close()
 				self.terrain_edit_window.from_data(self.selected_object)
 				self.terrain_edit_window.Show(True)
 				self.terrain_edit_window.Raise()
 		else:
-			self.polygon_edit_window.clear_inputs()
-			self.polygon_edit_window.Show(False)
+			self.hide_window('polygon_edit_window')
 			self.uv_edit_window.close()
-			self.terrain_edit_window.clear_inputs()
-			self.terrain_edit_window.Show(False)
-			self.multi_terrain_edit_window.clear_inputs()
-			self.multi_terrain_edit_window.Show(False)
+			self.hide_window('terrain_edit_window')
+			self.hide_window('multi_terrain_edit_window')
 
 	def unselect(self):
 		if not self.multiSelect:
-			for obj in self.selected_objects:
-				obj.unselect()
-			self.selected_objects = []
+			self.world.selection.clear()
 		if self.selected_object:
-			self.selected_object.unselect()
+			self.world.selection.remove(self.selected_object)
 			self.selected_object = None
 
 	def next_situation(self):
 		self.unselect()
-		self.polygon_edit_window.clear_inputs()
-		self.polygon_edit_window.Show(False)
-		self.terrain_edit_window.clear_inputs()
-		self.terrain_edit_window.Show(False)
+		self.hide_window('polygon_edit_window')
+		self.hide_window('terrain_edit_window')
 		self.uv_edit_window.close()
 		self.world.next_situation()
-		if self.palette_edit_window.IsShown():
+		if self.window_shown('palette_edit_window'):
 			self.palette_edit_window.from_data(self.world.color_palettes)
-		if self.lights_edit_window.IsShown():
+		if self.window_shown('lights_edit_window'):
 			self.lights_edit_window.from_data(self.world.dir_lights, self.world.amb_light, self.world.background)
 		self.world.set_terrain_alpha(self.terrain_mode)
 		self.set_full_light(self.full_light_enabled)
 
 	def prev_situation(self):
 		self.unselect()
-		self.polygon_edit_window.clear_inputs()
-		self.polygon_edit_window.Show(False)
-		self.terrain_edit_window.clear_inputs()
-		self.terrain_edit_window.Show(False)
+		self.hide_window('polygon_edit_window')
+		self.hide_window('terrain_edit_window')
 		self.uv_edit_window.close()
 		self.world.prev_situation()
-		if self.palette_edit_window.IsShown():
+		if self.window_shown('palette_edit_window'):
 			self.palette_edit_window.from_data(self.world.color_palettes)
-		if self.lights_edit_window.IsShown():
+		if self.window_shown('lights_edit_window'):
 			self.lights_edit_window.from_data(self.world.dir_lights, self.world.amb_light, self.world.background)
 		self.world.set_terrain_alpha(self.terrain_mode)
 		self.set_full_light(self.full_light_enabled)
 
 	def next_gns(self):
 		self.unselect()
-		self.polygon_edit_window.clear_inputs()
-		self.polygon_edit_window.Show(False)
-		self.terrain_edit_window.clear_inputs()
-		self.terrain_edit_window.Show(False)
+		self.hide_window('polygon_edit_window')
+		self.hide_window('terrain_edit_window')
 		self.uv_edit_window.close()
 		self.world.next_gns()
-		if self.palette_edit_window.IsShown():
+		if self.window_shown('palette_edit_window'):
 			self.palette_edit_window.from_data(self.world.color_palettes)
-		if self.lights_edit_window.IsShown():
+		if self.window_shown('lights_edit_window'):
 			self.lights_edit_window.from_data(self.world.dir_lights, self.world.amb_light, self.world.background)
 		self.world.set_terrain_alpha(self.terrain_mode)
 		self.set_full_light(self.full_light_enabled)
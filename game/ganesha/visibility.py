@@ -0,0 +1,145 @@
+# Works out which of the game's camera angles each polygon can be seen
+# from, for the visible_angles bits of the polygons. A set bit hides the
+# polygon from that angle.
+#
+# Each angle is solved on its own: the map is drawn from that direction
+# with an orthographic projection into a grid of sample points, keeping
+# the nearest polygon at each sample, each sample being at the middle of
+# its grid cell. A polygon is visible when it faces the camera and is the
+# nearest one at some sample. A front facing polygon too small or thin to
+# cover any sample cannot be told apart from a hidden one, so it counts
+# as visible; only polygons that covered samples and lost at every one of
+# them are hidden.
+
+from math import sin, cos, pi
+
+# Camera angle for each visible_angles bit, as the compass bearing of the
+# camera in degrees and its elevation in degrees. North is +Z, east is +X
+# and up is -Y. The corner views look down from higher up than the views
+# beside them. These are estimates; the game's exact camera angles are
+# not known. Bits 0, 1, 14 and 15 are not camera angles and are left alone.
+camera_angles = {
+	3: (315.0, 45.0),	# NW
+	9: (337.5, 26.0),	# NNW
+	10: (22.5, 26.0),	# NNE
+	4: (45.0, 45.0),	# NE
+	8: (292.5, 26.0),	# WNW
+	11: (67.5, 26.0),	# ENE
+	7: (247.5, 26.0),	# WSW
+	12: (112.5, 26.0),	# ESE
+	2: (225.0, 45.0),	# SW
+	6: (202.5, 26.0),	# SSW
+	13: (157.5, 26.0),	# SSE
+	5: (135.0, 45.0),	# SE
+}
+
+# Distance between sample points, in map units (a tile is 28 across).
+DEFAULT_SPACING = 4.0
+
+
+def camera_basis(azimuth, elevation):
+	# Unit vectors for the screen's right and up and the direction
+	# towards the camera.
+	a = azimuth * pi / 180
+	e = elevation * pi / 180
+	toward = (sin(a) * cos(e), -sin(e), cos(a) * cos(e))
+	right = (cos(a), 0.0, -sin(a))
+	# up = toward x right
+	up = (toward[1] * right[2] - toward[2] * right[1],
+		toward[2] * right[0] - toward[0] * right[2],
+		toward[0] * right[1] - toward[1] * right[0])
+	return (right, up, toward)
+
+def face_vector(a, b, c):
+	# (c - a) x (b - a), which points out of the front of triangle abc.
+	(ux, uy, uz) = (c[0] - a[0], c[1] - a[1], c[2] - a[2])
+	(vx, vy, vz) = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+	return (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+
+def triangles(points):
+	# The triangles of a polygon as drawn: a quad is the strip ABC, CBD.
+	if len(points) == 3:
+		return [points]
+	(a, b, c, d) = points
+	return [(a, b, c), (c, b, d)]
+
+def visible_polygons(polygons, azimuth, elevation, spacing=DEFAULT_SPACING):
+	# polygons is a list of point lists. Returns the set of indexes of the
+	# polygons seen from the given camera angle.
+	(right, up, toward) = camera_basis(azimuth, elevation)
+	def project(p):
+		return (p[0] * right[0] + p[1] * right[1] + p[2] * right[2],
+			p[0] * up[0] + p[1] * up[1] + p[2] * up[2],
+			p[0] * toward[0] + p[1] * toward[1] + p[2] * toward[2])
+	# Project every front facing triangle once. Triangles with no area
+	# face no way; they are counted as front facing and cover no samples.
+	projected = []
+	front = set()
+	for i, points in enumerate(polygons):
+		for triangle in triangles(points):
+			face = face_vector(*triangle)
+			if face == (0, 0, 0):
+				front.add(i)
+				continue
+			if face[0] * toward[0] + face[1] * toward[1] + face[2] * toward[2] <= 0:
+				continue
+			front.add(i)
+			projected.append((i, [project(p) for p in triangle]))
+	if not projected:
+		return front
+	min_s = min([p[0] for i, triangle in projected for p in triangle])
+	min_t = min([p[1] for i, triangle in projected for p in triangle])
+	max_s = max([p[0] for i, triangle in projected for p in triangle])
+	max_t = max([p[1] for i, triangle in projected for p in triangle])
+	width = int((max_s - min_s) / spacing) + 2
+	height = int((max_t - min_t) / spacing) + 2
+	depths = [None] * (width * height)
+	owners = [None] * (width * height)
+	# Polygons that covered at least one sample
+	sampled = set()
+	for i, ((s0, t0, d0), (s1, t1, d1), (s2, t2, d2)) in projected:
+		# Triangle in grid units
+		(x0, y0) = ((s0 - min_s) / spacing, (t0 - min_t) / spacing)
+		(x1, y1) = ((s1 - min_s) / spacing, (t1 - min_t) / spacing)
+		(x2, y2) = ((s2 - min_s) / spacing, (t2 - min_t) / spacing)
+		area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+		if area == 0:
+			continue
+		left = max(0, int(min(x0, x1, x2)) - 1)
+		right_edge = min(width - 1, int(max(x0, x1, x2)) + 1)
+		bottom = max(0, int(min(y0, y1, y2)) - 1)
+		top = min(height - 1, int(max(y0, y1, y2)) + 1)
+		for y in range(bottom, top + 1):
+			row = y * width
+			# The sample is at the middle of the cell.
+			sy = y + 0.5
+			for x in range(left, right_edge + 1):
+				sx = x + 0.5
+				# Barycentric weights of the sample point
+				w1 = ((sx - x0) * (y2 - y0) - (x2 - x0) * (sy - y0)) / area
+				if w1 < 0 or w1 > 1:
+					continue
+				w2 = ((x1 - x0) * (sy - y0) - (sx - x0) * (y1 - y0)) / area
+				if w2 < 0 or w1 + w2 > 1:
+					continue
+				sampled.add(i)
+				depth = d0 + w1 * (d1 - d0) + w2 * (d2 - d0)
+				old_depth = depths[row + x]
+				if old_depth is None or depth > old_depth:
+					depths[row + x] = depth
+					owners[row + x] = i
+	visible = set(owners)
+	visible.discard(None)
+	# Front facing polygons no sample landed on
+	visible.update(front - sampled)
+	return visible
+
+def solve(polygons, angles=None, spacing=DEFAULT_SPACING):
+	# Returns {bit: set of visible polygon indexes} for each camera angle.
+	# The angles do not depend on each other and could be solved apart.
+	if angles is None:
+		angles = camera_angles
+	result = {}
+	for bit, (azimuth, elevation) in angles.items():
+		result[bit] = visible_polygons(polygons, azimuth, elevation, spacing)
+	return result
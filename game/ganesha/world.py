@@ -1,33 +1,47 @@
-from pandac.PandaModules import GeomVertexFormat, GeomVertexData, GeomVertexWriter, Geom, GeomTristrips, GeomLines, GeomNode, VBase4, TransparencyAttrib
+from pandac.PandaModules import GeomVertexFormat, GeomVertexData, GeomVertexWriter, Geom, GeomTristrips, GeomLines, GeomNode, NodePath, VBase4, TransparencyAttrib
 from fft.map import Map, GNS
 from ganesha import *
+from ganesha.journal import Journal
+from ganesha.png import read_indexed, read_rgba, write_indexed, pack_nibbles, gray_colors, fft_colors, PNGError
+from ganesha.quantize import quantize
+from ganesha.texels import TexelUsage, polygon_uvs, PAGES
+from ganesha.blocks import find_duplicates, DEFAULT_BLOCK_SIZE
+from ganesha.blocks import remap as remap_blocks
+from ganesha.packing import pack, uv_rect, fit_uvs
+from ganesha.palettes import merge_palettes
+from ganesha.animation import Animator
+from ganesha import counters
+from ganesha.visibility import face_vector
 
 def coords_to_panda(x, y, z):
 	return (x, z, -y)
 
+def clamp_coord(value):
+	# Points are stored as signed 16-bit integers.
+	return max(-32768, min(32767, int(round(value))))
+
+def transform_normal(matrix, normal):
+	(x, y, z) = normal
+	(nx, ny, nz) = [row[0] * x + row[1] * y + row[2] * z for row in matrix]
+	length = (nx * nx + ny * ny + nz * nz) ** 0.5
+	if length == 0:
+		return normal
+	return (nx / length, ny / length, nz / length)
+
+def quantize_normal(normal):
+	# Unit length, in the 1/4096 steps normals are stored in.
+	(x, y, z) = normal
+	length = (x * x + y * y + z * z) ** 0.5
+	if length == 0:
+		return (0.0, -1.0, 0.0)
+	return tuple([round(c / length * 4096) / 4096.0 for c in (x, y, z)])
+
 def uv_to_panda(polygon, u, v):
 	page = polygon.texture_page
 	u = u / 256.0 
 	v = 1.0 - (page + v / 256.0) / 4.0
 	return (u, v)
 
-	
-def uv_to_panda2(polygon, pal, u, v):
-	page = polygon.texture_page
-	u = (u + pal) / (256.0 * 17) 
-	v = 1.0 - (page + v / 256.0) / 4.0
-	return (u, v)	
-	
-global_polygon_id = 0
-def reset_polygon_id():
-	global global_polygon_id
-	global_polygon_id = 0
-def next_polygon_id():
-	global global_polygon_id
-	current_id = global_polygon_id
-	global_polygon_id += 1
-	return current_id
-
 # Basic terrain slope types
 flat = { 'ne': 0, 'se': 0, 'sw': 0, 'nw': 0 }
 slant = { 'ne': 1, 'se': 0, 'sw': 0, 'nw': 1 }
@@ -51,6 +65,24 @@ slope_types = {
 	0x66: (concave, 270),
 }
 
+# Rough size in bytes of one value of each kind kept by the undo journal
+POLYGON_STATE_SIZE = 400
+TILE_STATE_SIZE = 120
+PALETTE_STATE_SIZE = 400
+TEXTURE_ROW_SIZE = 160
+LIGHT_STATE_SIZE = 200
+
+# Allowed range of the numeric tile fields. The game's height is said to
+# go up to 63.5; depth and slope height are bytes.
+tile_limits = {
+	'height': (0, 63, 'Height'),
+	'depth': (0, 255, 'Depth'),
+	'slope_height': (0, 255, 'Slope Height'),
+}
+
+# Bytes in one row of the packed 4bpp texture
+TEXTURE_ROW_BYTES = 128
+
 
 class Axes(object):
 	def __init__(self, parent):
@@ -90,13 +122,24 @@ class Axes(object):
 		self.node_path = self.parent.node_path_ui.attachNewNode(node)
 
 
-class Vertex(object):
-	def __init__(self, parent, point, coords):
+# Marker colors for each polygon corner
+point_colors = {
+	'A': (1.0, 0.0, 0.0),
+	'B': (0.0, 1.0, 0.0),
+	'C': (0.0, 0.0, 1.0),
+	'D': (1.0, 1.0, 0.0),
+}
+
+
+class Gizmos(object):
+	def __init__(self, parent):
 		self.parent = parent
 		self.format = GeomVertexFormat.getV3c4()
-		self.point = point
-		self.coords = coords
 		self.node_path = None
+		self.node_path_lines = None
+		self.marker = None
+		self.markers = {}
+		self.lines_dirty = False
 		self.init_node_path()
 
 	def __del__(self):
@@ -105,6 +148,13 @@ class Vertex(object):
 	def init_node_path(self):
 		if self.node_path:
 			self.node_path.remove()
+		self.node_path = self.parent.node_path_ui.attachNewNode('gizmos')
+		self.node_path_lines = None
+		self.markers = {}
+		self.marker = self.make_marker()
+
+	def make_marker(self):
+		# Every corner marker is an instance of this one geom.
 		vdata = GeomVertexData('name_me', self.format, Geom.UHStatic)
 		vertex = GeomVertexWriter(vdata, 'vertex')
 		color = GeomVertexWriter(vdata, 'color')
@@ -118,97 +168,112 @@ class Vertex(object):
 		vertex.addData3f(2.0, -2.0, -2.0)
 		vertex.addData3f(0, 0, 2.0)
 		vertex.addData3f(0, 2.0, -2.0)
-		color_tuple = (1.0, 1.0, 1.0)
-		if self.point == 'A':
-			color_tuple = (1.0, 0.0, 0.0)
-		elif self.point == 'B':
-			color_tuple = (0.0, 1.0, 0.0)
-		elif self.point == 'C':
-			color_tuple = (0.0, 0.0, 1.0)
-		elif self.point == 'D':
-			color_tuple = (1.0, 1.0, 0.0)
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
-		color.addData4f(*color_tuple + (1.0,))
+		for i in range(9):
+			color.addData4f(1.0, 1.0, 1.0, 1.0)
 		primitive.addNextVertices(9)
 		primitive.closePrimitive()
 		geom = Geom(vdata)
 		geom.addPrimitive(primitive)
-		node = GeomNode('gnode')
+		node = GeomNode('marker')
 		node.addGeom(geom)
-		self.node_path = self.parent.parent.node_path_ui.attachNewNode(node)
-		self.node_path.setP(180)
-		self.node_path.setPos(*coords_to_panda(*self.coords))
-
-
-class Vector(object):
-	def __init__(self, parent, vector, coords):
-		self.parent = parent
-		self.format = GeomVertexFormat.getV3c4()
-		self.vector = vector
-		self.coords = coords
-		self.node_path = None
-		self.init_node_path()
-
-	def __del__(self):
-		self.node_path.remove()
-
-	def init_node_path(self):
-		if self.node_path:
-			self.node_path.remove()
+		marker = NodePath(node)
+		marker.setP(180)
+		return marker
+
+	def add(self, polygon):
+		self.remove(polygon)
+		markers = []
+		for point in ['A', 'B', 'C', 'D']:
+			if not hasattr(polygon.source, point):
+				continue
+			coords = getattr(polygon.source, point).point.coords
+			node_path = self.node_path.attachNewNode('vertex')
+			node_path.setPos(*coords_to_panda(*coords))
+			node_path.setColor(*point_colors[point] + (1.0,))
+			self.marker.instanceTo(node_path)
+			markers.append(node_path)
+		self.markers[polygon] = markers
+		self.schedule_lines()
+
+	def update(self, polygon):
+		markers = self.markers.get(polygon)
+		if markers is None:
+			return
+		points = [point for point in ['A', 'B', 'C', 'D'] if hasattr(polygon.source, point)]
+		for node_path, point in zip(markers, points):
+			node_path.setPos(*coords_to_panda(*getattr(polygon.source, point).point.coords))
+		self.schedule_lines()
+
+	def remove(self, polygon):
+		markers = self.markers.pop(polygon, None)
+		if markers is None:
+			return
+		for node_path in markers:
+			node_path.remove()
+		self.schedule_lines()
+
+	def schedule_lines(self):
+		# Normal lines for the whole selection are rebuilt at most once a frame.
+		if not self.lines_dirty:
+			self.lines_dirty = True
+			taskMgr.add(self.update_lines_task, 'update_gizmo_lines')
+
+	def update_lines_task(self, task):
+		self.update_lines()
+		return task.done
+
+	def update_lines(self):
+		self.lines_dirty = False
+		if self.node_path_lines:
+			self.node_path_lines.remove()
+			self.node_path_lines = None
 		vdata = GeomVertexData('name_me', self.format, Geom.UHStatic)
 		vertex = GeomVertexWriter(vdata, 'vertex')
 		color = GeomVertexWriter(vdata, 'color')
 		primitive = GeomLines(Geom.UHStatic)
-		vertex.addData3f(*coords_to_panda(*self.vector))
-		vertex.addData3f(*coords_to_panda(*[-x for x in self.vector]))
-		color.addData4f((1.0, 0.0, 0.0, 1.0,))
-		color.addData4f((0.0, 0.0, 1.0, 1.0,))
-		primitive.addNextVertices(2)
+		count = 0
+		for polygon in self.markers:
+			if not polygon.source.A.normal:
+				continue
+			for point in ['A', 'B', 'C', 'D']:
+				if not hasattr(polygon.source, point):
+					continue
+				(x, y, z) = getattr(polygon.source, point).point.coords
+				(nx, ny, nz) = [n * 20 for n in getattr(polygon.source, point).normal.coords]
+				vertex.addData3f(*coords_to_panda(x + nx, y + ny, z + nz))
+				vertex.addData3f(*coords_to_panda(x - nx, y - ny, z - nz))
+				color.addData4f(1.0, 0.0, 0.0, 1.0)
+				color.addData4f(0.0, 0.0, 1.0, 1.0)
+				count += 2
+		if count == 0:
+			return
+		primitive.addNextVertices(count)
 		primitive.closePrimitive()
 		geom = Geom(vdata)
 		geom.addPrimitive(primitive)
-		node = GeomNode('gnode')
+		node = GeomNode('normals')
 		node.addGeom(geom)
-		self.node_path = self.parent.parent.node_path_ui.attachNewNode(node)
-		self.node_path.setScale(20)
-		self.node_path.setPos(*coords_to_panda(*self.coords))
+		self.node_path_lines = self.node_path.attachNewNode(node)
 
 
 class Polygon(object):
 	def __init__(self, parent):
 		self.parent = parent
+		self.handle = None
 		self.source = None
 		self.terrain_coords = None
 		self.format = GeomVertexFormat.getV3n3c4t2()
 		self.node_path = None
 		self.old_color = None
 		self.is_hovered = False
-		self.is_selected = False
 		self.palette = None
-		self.vA = None
-		self.vB = None
-		self.vC = None
-		self.vD = None
-		self.nA = None
-		self.nB = None
-		self.nC = None
-		self.nD = None
 
 	def __del__(self):
 		self.node_path.remove()
+		counters.add('nodes_destroyed')
 
 	def from_data(self, polygon):
 		self.source = polygon
-		if polygon.terrain_coords:
-			tcoords = polygon.terrain_coords
-			self.terrain_coords = tcoords
 		if polygon.A.texcoord:
 			self.palette = polygon.texture_palette
 		self.init_node_path()
@@ -216,6 +281,8 @@ class Polygon(object):
 	def init_node_path(self):
 		if self.node_path:
 			self.node_path.remove()
+			counters.add('nodes_destroyed')
+		counters.add('nodes_created')
 		polygon = self.source
 		vdata = GeomVertexData('name_me', self.format, Geom.UHStatic)
 		vertex = GeomVertexWriter(vdata, 'vertex')
@@ -247,16 +314,14 @@ class Polygon(object):
 		if hasattr(polygon, 'D'):
 			color.addData4f(gray, gray, gray, 1.0)
 		if polygon.A.texcoord:
-			pal = ((polygon.texture_palette + 1) * 256)
-			
-			texcoord_A = uv_to_panda2(polygon, pal, *polygon.A.texcoord.coords)
-			texcoord_B = uv_to_panda2(polygon, pal, *polygon.B.texcoord.coords)
-			texcoord_C = uv_to_panda2(polygon, pal, *polygon.C.texcoord.coords)
+			texcoord_A = uv_to_panda(polygon, *polygon.A.texcoord.coords)
+			texcoord_B = uv_to_panda(polygon, *polygon.B.texcoord.coords)
+			texcoord_C = uv_to_panda(polygon, *polygon.C.texcoord.coords)
 			texcoord.addData2f(*texcoord_A)
 			texcoord.addData2f(*texcoord_B)
 			texcoord.addData2f(*texcoord_C)
 			if hasattr(polygon, 'D'):
-				texcoord_D = uv_to_panda2(polygon, pal, *polygon.D.texcoord.coords)
+				texcoord_D = uv_to_panda(polygon, *polygon.D.texcoord.coords)
 				texcoord.addData2f(*texcoord_D)
 		primitive.addNextVertices(4)
 		primitive.closePrimitive()
@@ -265,6 +330,41 @@ class Polygon(object):
 		node = GeomNode('gnode')
 		node.addGeom(geom)
 		self.node_path = self.parent.node_path_mesh.attachNewNode(node)
+		if self.handle is not None:
+			self.node_path.setTag('polygon_i', str(self.handle))
+		if polygon.A.texcoord:
+			self.update_texture()
+
+	def update_texture(self):
+		self.palette = self.source.texture_palette
+		self.node_path.setTexture(self.parent.texture.get_strip(self.palette + 1))
+
+	def get_is_selected(self):
+		return self.parent.selection.contains(self)
+	is_selected = property(get_is_selected)
+
+	def update_vertices(self):
+		# Rewrites the positions, normals and texture coordinates in the
+		# existing geom instead of building a new node, so the node keeps
+		# its tags and state.
+		polygon = self.source
+		vdata = self.node_path.node().modifyGeom(0).modifyVertexData()
+		vertex = GeomVertexWriter(vdata, 'vertex')
+		vertex.setData3f(*coords_to_panda(*polygon.A.point.coords))
+		vertex.setData3f(*coords_to_panda(*polygon.B.point.coords))
+		vertex.setData3f(*coords_to_panda(*polygon.C.point.coords))
+		if hasattr(polygon, 'D'):
+			vertex.setData3f(*coords_to_panda(*polygon.D.point.coords))
+		else:
+			vertex.setData3f(*coords_to_panda(*polygon.C.point.coords))
+		if polygon.A.normal:
+			normal = GeomVertexWriter(vdata, 'normal')
+			for source_vertex in polygon.vertices():
+				normal.setData3f(*coords_to_panda(*source_vertex.normal.coords))
+		if polygon.A.texcoord:
+			texcoord = GeomVertexWriter(vdata, 'texcoord')
+			for source_vertex in polygon.vertices():
+				texcoord.setData2f(*uv_to_panda(polygon, *source_vertex.texcoord.coords))
 
 	def hover(self):
 		self.is_hovered = True
@@ -275,43 +375,23 @@ class Polygon(object):
 	def unhover(self):
 		self.is_hovered = False
 		if not self.is_selected:
-			self.node_path.reparentTo(self.parent.node_path_mesh)
-			self.node_path.setColor(*self.old_color)
+			self.parent.selection.show(self)
 
+	# select and unselect only draw the polygon; membership is kept by
+	# World.selection, which calls them.
 	def select(self):
-		self.unhover()
-		self.is_selected = True
-		if not self.source.A.normal:
-			self.node_path.reparentTo(self.parent.node_path_ui)
-		self.node_path.setColor(0.0, 1.0, 0.0, 1.0)
-		self.vA = Vertex(self, 'A', self.source.A.point.coords)
-		self.vB = Vertex(self, 'B', self.source.B.point.coords)
-		self.vC = Vertex(self, 'C', self.source.C.point.coords)
+		self.is_hovered = False
 		if self.source.A.normal:
-			self.nA = Vector(self, self.source.A.normal.coords, self.source.A.point.coords)
-			self.nB = Vector(self, self.source.B.normal.coords, self.source.B.point.coords)
-			self.nC = Vector(self, self.source.C.normal.coords, self.source.C.point.coords)
-		if hasattr(self.source, 'D'):
-			self.vD = Vertex(self, 'D', self.source.D.point.coords)
-			if self.source.A.normal:
-				self.nD = Vector(self, self.source.D.normal.coords, self.source.D.point.coords)
-
-	def unselect(self):
-		self.is_selected = False
-		if not self.source.A.normal:
 			self.node_path.reparentTo(self.parent.node_path_mesh)
-		self.node_path.setColor(*self.old_color)
-		del self.vA
-		del self.vB
-		del self.vC
-		if self.source.A.normal:
-			del self.nA
-			del self.nB
-			del self.nC
-		if hasattr(self.source, 'D'):
-			del self.vD
-			if self.source.A.normal:
-				del self.nD
+		else:
+			self.node_path.reparentTo(self.parent.node_path_ui)
+		self.node_path.setColor(0.0, 1.0, 0.0, 1.0)
+		self.parent.gizmos.add(self)
+
+	def unselect(self, priority=0):
+		self.node_path.reparentTo(self.parent.node_path_mesh)
+		self.node_path.setColor(*self.old_color + (priority,))
+		self.parent.gizmos.remove(self)
 
 
 class Palette(object):
@@ -405,7 +485,7 @@ class Directional_Light(object):
 		self.node_path_line = self.parent.node_path_ui.attachNewNode(node)
 		self.node_path_line.setScale(1000)
 		self.node_path_line.setPos(100, 100, 0)
-		self.show_line(self.parent.parent.lights_edit_window.IsShown())
+		self.show_line(self.parent.parent.window_shown('lights_edit_window'))
 
 	def show_line(self, show):
 		if show:
@@ -480,10 +560,10 @@ class Tile(object):
 		self.cant_cursor = None
 		self.unknown5 = None
 		self.is_hovered = False
-		self.is_selected = False
 
 	def __del__(self):
 		self.node_path.remove()
+		counters.add('nodes_destroyed')
 
 	def from_data(self, x, y, z, tile_data):
 		self.x = x
@@ -503,14 +583,8 @@ class Tile(object):
 		self.cant_cursor = tile_data.cant_cursor
 		self.unknown5 = tile_data.unknown5
 
-	def init_node_path(self):
-		if self.node_path:
-			self.node_path.remove()
-		vdata = GeomVertexData('name_me', self.format, Geom.UHStatic)
-		vertex = GeomVertexWriter(vdata, 'vertex')
-		color = GeomVertexWriter(vdata, 'color')
-		primitive = GeomTristrips(Geom.UHStatic)
-		y = self.height * 12 + self.depth * 12 + 1
+	def get_shape(self):
+		# The corner points of the tile's surface, and how far it is turned.
 		try:
 			(slope, rotation) = slope_types[self.slope_type]
 		except KeyError:
@@ -519,11 +593,16 @@ class Tile(object):
 		if self.slope_height == 0:
 			(slope, rotation) = (flat, 0)
 		scale_y = self.slope_height * 12
-		vertex.addData3f(*coords_to_panda(-14.0, -slope['sw'] * scale_y, -14.0))
-		vertex.addData3f(*coords_to_panda(-14.0, -slope['nw'] * scale_y, 14.0))
-		vertex.addData3f(*coords_to_panda(14.0, -slope['ne'] * scale_y, 14.0))
-		vertex.addData3f(*coords_to_panda(14.0, -slope['se'] * scale_y, -14.0))
-		vertex.addData3f(*coords_to_panda(-14.0, -slope['sw'] * scale_y, -14.0))
+		points = [
+			coords_to_panda(-14.0, -slope['sw'] * scale_y, -14.0),
+			coords_to_panda(-14.0, -slope['nw'] * scale_y, 14.0),
+			coords_to_panda(14.0, -slope['ne'] * scale_y, 14.0),
+			coords_to_panda(14.0, -slope['se'] * scale_y, -14.0),
+			coords_to_panda(-14.0, -slope['sw'] * scale_y, -14.0),
+		]
+		return (points, rotation)
+
+	def get_color(self):
 		tile_color = (0.5, 0.5, 1.0)
 		if self.cant_walk:
 			tile_color = (1.0, 0.5, 0.5)
@@ -531,50 +610,81 @@ class Tile(object):
 			tile_color = (0.5, 0.0, 0.0)
 		if (self.x + self.z) % 2 == 0:
 			tile_color = tuple([x * 0.8 for x in tile_color])
-		self.tile_color = tile_color
-		color.addData4f(*tile_color + (1.0,))
-		color.addData4f(*tile_color + (1.0,))
-		color.addData4f(*tile_color + (1.0,))
-		color.addData4f(*tile_color + (1.0,))
-		color.addData4f(*tile_color + (1.0,))
+		return tile_color
+
+	def place_node_path(self, rotation):
+		self.node_path.setH(rotation)
+		can_stand_height = 0
+		if not self.cant_cursor:
+			can_stand_height = 1
+		self.node_path.setPos(*coords_to_panda(self.x * 28 + 14, -((self.height + self.depth) * 12 + 1 + can_stand_height), self.z * 28 + 14))
+
+	def init_node_path(self):
+		if self.node_path:
+			self.node_path.remove()
+			counters.add('nodes_destroyed')
+		counters.add('nodes_created')
+		vdata = GeomVertexData('name_me', self.format, Geom.UHStatic)
+		vertex = GeomVertexWriter(vdata, 'vertex')
+		color = GeomVertexWriter(vdata, 'color')
+		primitive = GeomTristrips(Geom.UHStatic)
+		(points, rotation) = self.get_shape()
+		self.tile_color = self.get_color()
+		for point in points:
+			vertex.addData3f(*point)
+			color.addData4f(*self.tile_color + (1.0,))
 		primitive.addNextVertices(5)
 		primitive.closePrimitive()
 		geom = Geom(vdata)
 		geom.addPrimitive(primitive)
 		node = GeomNode('gnode')
 		node.addGeom(geom)
-		self.node_path = self.parent.node_path.attachNewNode(node)
-		self.node_path.setH(rotation)
-		can_stand_height = 0
-		if not self.cant_cursor:
-			can_stand_height = 1
-		self.node_path.setPos(*coords_to_panda(self.x * 28 + 14, -((self.height + self.depth) * 12 + 1 + can_stand_height), self.z * 28 + 14))
+		self.node_path = self.parent.level_node_paths[self.y].attachNewNode(node)
+		self.place_node_path(rotation)
 		self.node_path.setTag('terrain_xyz', '%u,%u,%u' % (self.x, self.y, self.z))
 
+	def update_node_path(self):
+		# Rewrites the existing geom and placement after the tile's
+		# settings changed, instead of making a new node.
+		vdata = self.node_path.node().modifyGeom(0).modifyVertexData()
+		vertex = GeomVertexWriter(vdata, 'vertex')
+		color = GeomVertexWriter(vdata, 'color')
+		(points, rotation) = self.get_shape()
+		self.tile_color = self.get_color()
+		for point in points:
+			vertex.setData3f(*point)
+			color.setData4f(*self.tile_color + (1.0,))
+		self.place_node_path(rotation)
+
+	def get_is_selected(self):
+		return self.parent.parent.selection.contains(self)
+	is_selected = property(get_is_selected)
+
 	def hover(self):
 		self.is_hovered = True
 		if not self.is_selected:
-			self.node_path.setColor(0.8, 0.5, 1.0, 1.0)
+			# Priority 2, like excluded tiles, to win over the highlight of
+			# an inverted level.
+			self.node_path.setColor(0.8, 0.5, 1.0, 1.0, 2)
 
 	def unhover(self):
 		self.is_hovered = False
 		if not self.is_selected:
-			self.node_path.setColor(*self.tile_color + (1.0,))
+			self.parent.parent.selection.show(self)
 
 	def select(self):
-		self.unhover()
-		self.is_selected = True
+		self.is_hovered = False
 		self.node_path.setColor(0.0, 1.0, 0.0, 1.0)
 
-	def unselect(self):
-		self.is_selected = False
-		self.node_path.setColor(*self.tile_color + (1.0,))
+	def unselect(self, priority=0):
+		self.node_path.setColor(*self.tile_color + (1.0, priority))
 
 
 class Terrain(object):
 	def __init__(self, parent):
 		self.parent = parent
 		self.node_path = None
+		self.level_node_paths = None
 		self.tiles = None
 
 	def __del__(self):
@@ -601,192 +711,263 @@ class Terrain(object):
 			self.node_path.remove()
 		node = GeomNode('gnode')
 		self.node_path = self.parent.node_path_terrain.attachNewNode(node)
+		self.level_node_paths = []
+		for y in range(len(self.tiles)):
+			self.level_node_paths.append(self.node_path.attachNewNode('level_%u' % y))
 		for level in self.tiles:
 			for row in level:
 				for tile in row:
 					tile.init_node_path()
 
 
-class Texture(object):
-	def __init__(self):
-		self.texture = None
-		self.texture2 = None
-
+class Selection(object):
+	# Selected polygons or tiles, never both. Besides its members, a
+	# selection can have whole domains inverted (the mesh, or a terrain
+	# level), so everything in them counts as selected except members.
+	# Selecting or clearing a whole domain only changes the color of its
+	# group node instead of every object in it.
+	def __init__(self, parent):
+		self.parent = parent
+		self.kind = None
+		self.members = set()
+		self.inverted = set()
+
+	def domain(self, obj):
+		if isinstance(obj, Tile):
+			return obj.y
+		return None
+
+	def group(self, domain):
+		if domain is None:
+			return self.parent.node_path_mesh
+		return self.parent.terrain.level_node_paths[domain]
+
+	def universe(self, domain):
+		if domain is None:
+			return self.parent.polygons
+		tiles = []
+		for row in self.parent.terrain.tiles[domain]:
+			tiles.extend(row)
+		return tiles
+
+	def contains(self, obj):
+		return (obj in self.members) != (self.domain(obj) in self.inverted)
+
+	def __contains__(self, obj):
+		return self.contains(obj)
+
+	def __len__(self):
+		count = len(self.members)
+		for domain in self.inverted:
+			in_domain = len([obj for obj in self.members if self.domain(obj) == domain])
+			count += len(self.universe(domain)) - 2 * in_domain
+		return count
+
+	def __iter__(self):
+		for obj in list(self.members):
+			if self.domain(obj) not in self.inverted:
+				yield obj
+		for domain in list(self.inverted):
+			for obj in self.universe(domain):
+				if obj not in self.members:
+					yield obj
+
+	def accepts(self, obj):
+		return self.kind is None or isinstance(obj, self.kind)
+
+	def show(self, obj):
+		# Redraw one object to match its membership, e.g. after its node
+		# was rebuilt.
+		if self.contains(obj):
+			if obj in self.members:
+				obj.select()
+			else:
+				obj.unselect()
+		elif self.domain(obj) in self.inverted:
+			# Excluded from an inverted domain, so it has to win over the
+			# group's highlight.
+			obj.unselect(2)
+		else:
+			obj.unselect()
 
-	def from_data(self, texture_data, palettes):
-		from pandac.PandaModules import PNMImage, VBase4D
-		from pandac.PandaModules import Texture as P3DTexture
-		
-		tex_pnm = PNMImage(17*256, 1024)
-		tex_pnm.addAlpha()
+	def toggle(self, obj):
+		if not self.accepts(obj):
+			return
+		if obj in self.members:
+			self.members.remove(obj)
+		else:
+			self.members.add(obj)
+		self.kind = type(obj)
+		self.show(obj)
+		self.update_kind()
+
+	def add(self, obj):
+		if self.accepts(obj) and not self.contains(obj):
+			self.toggle(obj)
+
+	def remove(self, obj):
+		if self.contains(obj):
+			self.toggle(obj)
+
+	def invert(self, domain):
+		if domain is None:
+			kind = Polygon
+		else:
+			kind = Tile
+		if self.kind not in [None, kind]:
+			return
+		group = self.group(domain)
+		if domain in self.inverted:
+			self.inverted.remove(domain)
+			group.clearColor()
+		else:
+			self.inverted.add(domain)
+			group.setColor(0.0, 1.0, 0.0, 1.0, 1)
+		self.kind = kind
+		for obj in [obj for obj in self.members if self.domain(obj) == domain]:
+			self.show(obj)
+		self.update_kind()
+
+	def discard(self, obj):
+		# Forgets obj without redrawing it, for objects being deleted.
+		self.members.discard(obj)
+		self.update_kind()
+
+	def clear(self):
+		for domain in self.inverted:
+			self.group(domain).clearColor()
+		members = self.members
+		self.members = set()
+		self.inverted = set()
+		self.kind = None
+		for obj in members:
+			obj.unselect()
+
+	def update_kind(self):
+		if not self.members and not self.inverted:
+			self.kind = None
 
-		
-		testpnm = PNMImage(256, 1024)
-		
-		palette = [(x, x, x, 1) for x in range(16)]
-		colors = []
-		for color in palette:
-			color_list = [c / 15.0 for c in color[:3]]
-			color_list.append(0 if color == (0, 0, 0, 0) else 1)
-			colors.append(VBase4D(*color_list))
-			
-		for y in range(1024):
-			row = texture_data.image[y]
-			for x in range(256):
-				testpnm.setXelA(x, y, colors[row[x]])
-		
-		self.texture2 = P3DTexture()
-		self.texture2.load(testpnm)
-		self.texture2.setMagfilter(P3DTexture.FTNearest)
-		self.texture2.setMinfilter(P3DTexture.FTLinear)
-		
-		
-		self.update(tex_pnm, texture_data, palettes)
 
-	def update(self, pnm, texture_data, palettes):
-		from pandac.PandaModules import PNMImage, VBase4D
-		from pandac.PandaModules import Texture as P3DTexture
-		
-		self.palettes = []
-		temp = []
-		for x in range (16):
-			temp.append((x, x, x, 1))
-			
-		self.palettes.append(temp)
-		
-		for y, palette in enumerate(palettes):
+class Texture(object):
+	def __init__(self):
+		self.texture2 = None
+		self.data = None
+		self.palettes = None
+		# Strip 0 is the gray palette, strips 1 to 16 are the color
+		# palettes. Each strip is its own 256x1024 texture and is only
+		# built when a polygon first asks for it.
+		self.strips = {}
+		# strip -> BGRA of the two texels of every texture byte
+		self.pairs = {}
+
+	def from_data(self, data, palettes):
+		self.data = data
+		self.set_palettes(palettes)
+		self.texture2 = self.get_strip(0)
+
+	def set_palettes(self, palettes):
+		self.palettes = [[(x, x, x, 1) for x in range(16)]]
+		for palette in palettes:
 			selfpalette = []
-			for x, color in enumerate(palette.colors.colors):
-				selfpalette.append((color[0],color[1],color[2],1))
+			for color in palette.colors.colors:
+				selfpalette.append((color[0], color[1], color[2], 1))
 			self.palettes.append(selfpalette)
-		
-		i = 0
-		for palette in self.palettes:
-			colors = []
-			for color in palette:
-				color_list = [c / 15.0 for c in color[:3]]
-				color_list.append(0 if color == (0, 0, 0, 0) else 1)
-				colors.append(VBase4D(*color_list))
-				
-			for y in range(1024):
-				row = texture_data.image[y]
-				for x in range(256):
-					pnm.setXelA(x + (256*i), y, colors[row[x]])	
-			i += 1
-			
-		self.texture = P3DTexture()
-		self.texture.load(pnm)
-		self.texture.setMagfilter(P3DTexture.FTNearest)
-		self.texture.setMinfilter(P3DTexture.FTLinear)	
-
-	#function that saves data into files
-	def to_data(self, texture):
-		from pandac.PandaModules import PNMImage
-		tex_pnm = PNMImage()
-		texture.texture2.store(tex_pnm)
-		image = []
-		for y in range(1024):
-			row = []
-			for x in range(256):
-				gray = tex_pnm.getXel(x, y)
-				pal_i = int(gray[0] * 15.0)
-				row.append(pal_i)
-			image.append(row)
-		return image
-
-	def export(self, file_name, texture_data):
-		from pandac.PandaModules import PNMImage, VBase4D
-		from pandac.PandaModules import Texture as P3DTexture
-
-		pnm = PNMImage(256, 1024)
-		self.texture2.store(pnm)
-		pnm.write(file_name)
 
+	def get_strip(self, strip):
+		try:
+			return self.strips[strip]
+		except KeyError:
+			pass
+		if strip < 0 or strip >= len(self.palettes):
+			print 'Unknown palette:', strip - 1
+			return self.get_strip(0)
+		from pandac.PandaModules import Texture as P3DTexture
+		texture = P3DTexture('palette_%u' % strip)
+		texture.setup2dTexture(256, 1024, P3DTexture.TUnsignedByte, P3DTexture.FRgba)
+		texture.setMagfilter(P3DTexture.FTNearest)
+		texture.setMinfilter(P3DTexture.FTLinear)
+		self.strips[strip] = texture
+		self.update_strip(strip)
+		return texture
+
+	def update_strip(self, strip):
+		# Panda wants BGRA texels with the bottom row first, two texels
+		# per byte of the 4bpp texture file.
+		colors = []
+		for color in self.palettes[strip]:
+			(r, g, b) = [chr(min(255, int(c * 255 / 15.0 + 0.5))) for c in color[:3]]
+			a = chr(0 if color == (0, 0, 0, 0) else 255)
+			colors.append(b + g + r + a)
+		pairs = [colors[i & 0xf] + colors[i >> 4] for i in range(256)]
+		self.pairs[strip] = pairs
+		rows = [self.data[y*128:(y+1)*128] for y in range(1024)]
+		rows.reverse()
+		image = ''.join(map(pairs.__getitem__, map(ord, ''.join(rows))))
+		ram_image = self.strips[strip].modifyRamImage()
+		ram_image.setSubdata(0, len(image), image)
+		counters.add('texture_uploads')
+		counters.add('texture_upload_bytes', len(image))
+
+	def update(self, palettes=None, strips=None):
+		# Rebuilds the given strips, or every strip built so far.
+		if palettes is not None:
+			self.set_palettes(palettes)
+		if strips is None:
+			strips = self.strips.keys()
+		for strip in strips:
+			if strip in self.strips:
+				self.update_strip(strip)
+
+	def get_png_colors(self, strip):
+		if strip == 0:
+			return gray_colors()
+		return fft_colors(self.palettes[strip])
+
+	def export(self, file_name, strip=0):
+		# Writes the texture as a 16 color indexed PNG, with the colors of
+		# the given strip as its palette.
+		write_indexed(file_name, self.data, 256, 1024, self.get_png_colors(strip))
 
 	def import_(self, file_name, palettes):
-		from pandac.PandaModules import PNMImage, Filename, VBase4D
-		from pandac.PandaModules import Texture as P3DTexture
-		
+		# Indexed and gray PNGs are read straight into texture data. Other
+		# images go through Panda and are read as gray.
+		try:
+			(width, height, data) = read_indexed(file_name)
+		except PNGError, e:
+			print 'Reading %s through Panda: %s' % (file_name, e)
+			(width, height, data) = self.read_pnm(file_name)
+		if (width, height) != (256, 1024):
+			print 'Texture Warning: %s is %ux%u, not 256x1024.' % (file_name, width, height)
+			return False
+		self.data = data
+		#update the strips visible on map
+		self.update(palettes)
+		return True
+
+	def put_indexes(self, x, y, width, height, indexes):
+		# Writes a width x height block of palette indexes, one per texel,
+		# at texel (x, y). x and width must be even.
+		raw = ''.join(map(chr, indexes))
+		lines = [self.data[row*TEXTURE_ROW_BYTES:(row+1)*TEXTURE_ROW_BYTES] for row in range(len(self.data) / TEXTURE_ROW_BYTES)]
+		for row in range(height):
+			line = lines[y + row]
+			packed = pack_nibbles(raw[row*width:(row+1)*width])
+			lines[y + row] = line[:x/2] + packed + line[(x+width)/2:]
+		self.data = ''.join(lines)
+
+	def read_pnm(self, file_name):
+		from pandac.PandaModules import PNMImage, Filename
 		pnm = PNMImage()
 		pnm.read(Filename.fromOsSpecific(file_name))
-		
-		tex_pnm = PNMImage(17*256, 1024)
-		tex_pnm.addAlpha()
-		
-		
+		(width, height) = (pnm.getXSize(), pnm.getYSize())
 		#convert data to same sequence as files
 		texdata = []
-		for y in range(1024):
-			row = []
-			for x in range(256):
-				gray = pnm.getXel(x, y)
-				pal_i = int(gray[0] * 15.0)
-				row.append(pal_i)
-			texdata.append(row)
-		
-		#update saving texture
-		testpnm = PNMImage(256, 1024)
-		
-		palette = [(x, x, x, 1) for x in range(16)]
-		colors = []
-		for color in palette:
-			color_list = [c / 15.0 for c in color[:3]]
-			color_list.append(0 if color == (0, 0, 0, 0) else 1)
-			colors.append(VBase4D(*color_list))
-			
-		for y in range(1024):
-			row = texdata[y]
-			for x in range(256):
-				testpnm.setXelA(x, y, colors[row[x]])
-		
-		self.texture2.load(testpnm)
-		self.texture2.setMagfilter(P3DTexture.FTNearest)
-		self.texture2.setMinfilter(P3DTexture.FTLinear)
-
-		
-		#update texture visible on map
-
-
-		self.palettes = []
-		temp = []
-		for x in range (16):
-			temp.append((x, x, x, 1))
-			
-		self.palettes.append(temp)
-		
-		for y, palette in enumerate(palettes):
-			selfpalette = []
-			for x, color in enumerate(palette.colors.colors):
-				selfpalette.append((color[0],color[1],color[2],1))
-			self.palettes.append(selfpalette)
-		
-		i = 0
-		for palette in self.palettes:
-			colors = []
-			for color in palette:
-				color_list = [c / 15.0 for c in color[:3]]
-				color_list.append(0 if color == (0, 0, 0, 0) else 1)
-				colors.append(VBase4D(*color_list))
-				
-			for y in range(1024):
-				row = texdata[y]
-				for x in range(256):
-					tex_pnm.setXelA(x + (256*i), y, colors[row[x]])	
-			i += 1
-			
-		self.texture.load(tex_pnm)
-		self.texture.setMagfilter(P3DTexture.FTNearest)
-		self.texture.setMinfilter(P3DTexture.FTLinear)	
-		
-
-	def make_blank(self):
-		from pandac.PandaModules import PNMImage
-		from pandac.PandaModules import Texture as P3DTexture
-		tex_pnm = PNMImage(2, 2)
-		tex_pnm.fill(1, 1, 1)
-		self.texture = P3DTexture()
-		self.texture.load(tex_pnm)
-
+		for y in range(height):
+			for x in range(0, width - 1, 2):
+				pix1 = int(pnm.getRed(x, y) * 15.0)
+				pix2 = int(pnm.getRed(x + 1, y) * 15.0)
+				texdata.append(chr(pix1 | (pix2 << 4)))
+		return (width, height, ''.join(texdata))
 
 class World(object):
 	def __init__(self, parent):
@@ -794,7 +975,17 @@ class World(object):
 		self.map = Map()
 		self.node_path = None
 		self.textures = []
-		self.polygons = None
+		# Polygons are stored by handle, which is their index in
+		# polygon_slots and never changes. Deleted polygons leave a None
+		# behind; the dense list in file order is only built when asked for.
+		self.polygon_slots = []
+		self.dense_polygons = None
+		# polygon -> position in dense_polygons, built along with it
+		self.dense_index = None
+		# (x, z, level) -> set of handles of the polygons on that tile
+		self.terrain_index = {}
+		# Texels used by the polygons, brought up to date when asked for
+		self.texel_usage = TexelUsage()
 		self.color_palettes = None
 		self.dir_lights = None
 		self.amb_light = None
@@ -805,18 +996,31 @@ class World(object):
 		self.gray_palettes = None
 		self.polygon_anim = None
 		self.animated_polygons = None
+		self.animator = Animator(self)
 		self.center_x = 0
 		self.center_y = 0
 		self.center_z = 0
+		self.selection = Selection(self)
+		self.journal = Journal()
+		# Scene updates waiting for the next frame, see post_change.
+		self.changes = {}
+		self.change_order = []
 		self.init_camera()
 
 	def read(self):
+		self.animator.clear()
 		self.node_path = render.attachNewNode('world')
 		self.node_path.setTransparency(TransparencyAttrib.MAlpha)
 		self.node_path_mesh = self.node_path.attachNewNode('mesh')
 		self.node_path_ui = self.node_path.attachNewNode('ui')
 		self.node_path_terrain = self.node_path_ui.attachNewNode('terrain')
 		self.axes = Axes(self)
+		self.gizmos = Gizmos(self)
+		self.selection = Selection(self)
+		# Handles and tiles start over with every map read.
+		self.journal.clear()
+		self.changes = {}
+		self.change_order = []
 		self.map.read()
 		self.get_color_palettes()
 		self.get_texture()
@@ -827,6 +1031,7 @@ class World(object):
 		self.get_background()
 		self.get_terrain()
 		self.get_gray_palettes()
+		self.get_animations()
 		self.full_light = Ambient_Light(self)
 		self.full_light.color = (255, 255, 255)
 		self.full_light.init_node_path()
@@ -914,20 +1119,90 @@ class World(object):
 
 	def get_texture(self):
 		texture = Texture()
-		texture.from_data(self.map.get_texture(), self.color_palettes)
+		texture.from_data(self.map.texture.data, self.color_palettes)
 		self.texture = texture
-		self.node_path_mesh.setTexture(self.texture.texture)
 
 	def get_polygons(self):
-		polygons = []
-		reset_polygon_id()
-		for i, poly_data in enumerate(self.map.get_polygons()):
+		self.polygon_slots = []
+		self.dense_polygons = None
+		self.terrain_index = {}
+		self.texel_usage = TexelUsage()
+		for poly_data in self.map.get_polygons():
 			polygon = Polygon(self)
 			polygon.from_data(poly_data)
-			polygon_id = next_polygon_id()
-			polygon.node_path.setTag('polygon_i', str(polygon_id))
-			polygons.append(polygon)
-		self.polygons = polygons
+			self.insert_polygon(polygon)
+
+	def get_polygon_order(self):
+		if self.dense_polygons is None:
+			self.dense_polygons = [polygon for polygon in self.polygon_slots if polygon is not None]
+			self.dense_index = None
+		return self.dense_polygons
+	polygons = property(get_polygon_order)
+
+	def get_polygon_index(self, polygon):
+		# Position of the polygon in file order.
+		polygons = self.polygons
+		if self.dense_index is None:
+			self.dense_index = dict([(p, i) for i, p in enumerate(polygons)])
+		return self.dense_index[polygon]
+
+	def get_polygon(self, handle):
+		try:
+			return self.polygon_slots[handle]
+		except IndexError:
+			return None
+
+	def insert_polygon(self, polygon, handle=None):
+		# New polygons get the next handle, so they end up last in file
+		# order. Passing a handle puts a deleted polygon back in its slot.
+		if handle is None:
+			handle = len(self.polygon_slots)
+			self.polygon_slots.append(polygon)
+		else:
+			self.polygon_slots[handle] = polygon
+		polygon.handle = handle
+		polygon.node_path.setTag('polygon_i', str(handle))
+		self.dense_polygons = None
+		self.index_polygon(polygon)
+
+	def index_polygon(self, polygon):
+		coords = polygon.source.terrain_coords
+		polygon.terrain_coords = coords
+		if coords is None or coords[:2] == (255, 127):
+			return
+		self.terrain_index.setdefault(coords, set()).add(polygon.handle)
+
+	def unindex_polygon(self, polygon):
+		handles = self.terrain_index.get(polygon.terrain_coords)
+		if handles is None:
+			return
+		handles.discard(polygon.handle)
+		if not handles:
+			del self.terrain_index[polygon.terrain_coords]
+
+	def set_polygon_terrain_coords(self, polygon, terrain_coords):
+		self.unindex_polygon(polygon)
+		polygon.source.terrain_coords = terrain_coords
+		self.index_polygon(polygon)
+
+	def polygons_for_tile(self, x, z, level):
+		handles = self.terrain_index.get((x, z, level), [])
+		return [self.polygon_slots[handle] for handle in sorted(handles)]
+
+	def tiles_for_polygons(self, polygons):
+		tiles = []
+		found = set()
+		for polygon in polygons:
+			coords = polygon.terrain_coords
+			if coords is None or coords[:2] == (255, 127) or coords in found:
+				continue
+			found.add(coords)
+			(x, z, level) = coords
+			try:
+				tiles.append(self.terrain.tiles[level][z][x])
+			except IndexError:
+				pass
+		return tiles
 
 	def get_color_palettes(self):
 		palettes = []
@@ -975,6 +1250,19 @@ class World(object):
 			palettes.append(palette)
 		self.gray_palettes = palettes
 
+	def get_animations(self):
+		self.texture_anim = []
+		self.palette_anim = []
+		for animation in self.map.get_texture_animations():
+			if animation.is_palette():
+				self.palette_anim.append(animation)
+			else:
+				self.texture_anim.append(animation)
+		# Polygon data of each mesh frame; the frames are built as polygons
+		# into animated_polygons when playback first starts.
+		self.polygon_anim = list(self.map.get_animated_meshes())
+		self.animated_polygons = None
+
 	def read_gns(self, gns_path):
 		if gns_path is None:
 			gns_path = self.parent.file_dialog()
@@ -1065,62 +1353,16 @@ class World(object):
 			polygon.source.unknown5 = '\x00' * 4
 		polygon.source.visible_angles = [0] * 16
 		polygon.init_node_path()
-		polygon_id = next_polygon_id()
-		polygon.node_path.setTag('polygon_i', str(polygon_id))
-		self.polygons.append(polygon)
+		self.insert_polygon(polygon)
+		self.journal.begin('Add polygon')
+		self.journal.record('Add polygon', self.set_polygon_states, [polygon.handle], [None], [self.polygon_state(polygon)], POLYGON_STATE_SIZE)
+		if texture and self.pack_uvs([polygon], name='Add polygon'):
+			print 'No free texture space for the new polygon; it keeps the default UVs.'
+		self.journal.end()
 
 
 	def move_all_poly(self, dim, amount, sign):
-		import fft.map
-		from copy import deepcopy
-		
-		valueX = 0
-		valueY = 0
-		valueZ = 0
-		terrainvalueX = 0
-		terrainvalueZ = 0
-		
-		texture = True
-		
-		if dim == 'X':
-			valueX = sign * amount
-			terrainvalueX = sign
-		if dim == 'Y':
-			valueY = -sign * amount
-		if dim == 'Z':
-			valueZ = sign * amount
-			terrainvalueZ = sign
-			
-			
-		for polygon in self.polygons:
-				
-			if not polygon.source.terrain_coords == (255,127,0):
-				if not polygon.source.terrain_coords is None:					
-					
-					if (terrainvalueX + polygon.source.terrain_coords[0]) < 0:
-						pass
-					elif (terrainvalueZ + polygon.source.terrain_coords[1]) < 0:
-						pass
-					else:
-						temp = list(polygon.source.terrain_coords)
-						temp[0] = terrainvalueX + polygon.source.terrain_coords[0]
-						temp[1] = terrainvalueZ + polygon.source.terrain_coords[1]
-						polygon.source.terrain_coords = tuple(temp)
-					
-			polygon.source.A.point.set_coords(polygon.source.A.point.X + valueX, polygon.source.A.point.Y + valueY, polygon.source.A.point.Z + valueZ)
-			polygon.source.B.point.set_coords(polygon.source.B.point.X + valueX, polygon.source.B.point.Y + valueY, polygon.source.B.point.Z + valueZ)
-			polygon.source.C.point.set_coords(polygon.source.C.point.X + valueX, polygon.source.C.point.Y + valueY, polygon.source.C.point.Z + valueZ)
-						
-			if hasattr(polygon.source, 'D'):
-				polygon.source.D.point.set_coords(polygon.source.D.point.X + valueX, polygon.source.D.point.Y + valueY, polygon.source.D.point.Z + valueZ)
-			
-			polygon.init_node_path()
-		
-		reset_polygon_id()
-		for polygon in self.polygons:
-			polygon_id = next_polygon_id()
-			polygon.node_path.setTag('polygon_i', str(polygon_id))
-		
+		self.move_selected_poly(dim, amount, sign, self.polygons)
 			
 	def copy_polygon_to_XOffset(self, copyingPolygon, xOffset, texture):
 		import fft.map
@@ -1170,86 +1412,251 @@ class World(object):
 				polygon.source.unknown4 = copyingPolygon.source.unknown4
 		else:
 			polygon.source.unknown5 = copyingPolygon.source.unknown5
-		polygon.source.visible_angles = copyingPolygon.source.visible_angles
+		polygon.source.visible_angles = list(copyingPolygon.source.visible_angles)
 		polygon.init_node_path()
-		polygon_id = next_polygon_id()
-		polygon.node_path.setTag('polygon_i', str(polygon_id))
-		self.polygons.append(polygon)
+		self.insert_polygon(polygon)
+		self.journal.record('Add polygon', self.set_polygon_states, [polygon.handle], [None], [self.polygon_state(polygon)], POLYGON_STATE_SIZE)
 
 	def delete_polygon(self, del_polygon):
-		index = self.polygons.index(del_polygon)
-		del self.polygons[index]
-		reset_polygon_id()
-		for polygon in self.polygons:
-			polygon_id = next_polygon_id()
-			polygon.node_path.setTag('polygon_i', str(polygon_id))
+		self.journal.record('Delete polygon', self.set_polygon_states, [del_polygon.handle], [self.polygon_state(del_polygon)], [None], POLYGON_STATE_SIZE)
+		self.selection.discard(del_polygon)
+		self.gizmos.remove(del_polygon)
+		self.unindex_polygon(del_polygon)
+		self.polygon_slots[del_polygon.handle] = None
+		self.dense_polygons = None
+		del_polygon.node_path.detachNode()
 
 	def move_selected_tile(self, amount, selected):
-		for tile in selected:
-			if (tile.height + amount) < 0 or (tile.height + amount) > 63:
-				continue
+		# Tiles that would go out of range are left where they are.
+		tiles = [tile for tile in selected if 0 <= tile.height + amount <= tile_limits['height'][1]]
+		old_states = [self.tile_state(tile) for tile in tiles]
+		for tile in tiles:
 			tile.height += amount
-			tag = tile.node_path.getTag('tile_xyz')
-			tile.init_node_path()
-			tile.node_path.setTag('tile_xyz', tag)
-			if tile.is_selected:
-				tile.select()
-			#tile.init_node_path()
-			#if tile.is_selected:
-			#	tile.select()
+		self.refresh_tiles(tiles)
+		self.record_tiles('Move tiles', tiles, old_states)
+
+	def edit_tiles(self, tiles, values, name='Edit terrain'):
+		# Sets the same values on all the tiles. values maps Tile field
+		# names to values; fields that are not in it are left unchanged.
+		# Values out of range are clamped, with one warning per field.
+		values = dict(values)
+		for field, (low, high, label) in tile_limits.items():
+			if field not in values:
+				continue
+			value = values[field]
+			if value < low:
+				values[field] = low
+				print "Terrain Warning: %s can't be less than %u." % (label, low)
+			elif value > high:
+				values[field] = high
+				print "Terrain Warning: %s can't be greater than %u." % (label, high)
+		old_states = [self.tile_state(tile) for tile in tiles]
+		items = values.items()
+		for tile in tiles:
+			for field, value in items:
+				setattr(tile, field, value)
+		self.refresh_tiles(tiles)
+		self.record_tiles(name, tiles, old_states)
+
+	def refresh_tiles(self, tiles):
+		# One pass over the changed tiles, rewriting their geoms in place.
+		for tile in tiles:
+			tile.update_node_path()
+			self.selection.show(tile)
 
 	def move_selected_poly(self, dim, amount, sign, selected):
-		import fft.map
-		from copy import deepcopy
-		
-		valueX = 0
-		valueY = 0
-		valueZ = 0
-		terrainvalueX = 0
-		terrainvalueZ = 0
-		
-		texture = True
-		
+		(dx, dy, dz) = (0, 0, 0)
 		if dim == 'X':
-			valueX = sign * amount
-			terrainvalueX = sign
+			dx = sign * amount
 		if dim == 'Y':
-			valueY = -sign * amount
+			dy = -sign * amount
 		if dim == 'Z':
-			valueZ = sign * amount
-			terrainvalueZ = sign
-			
-			
-		for polygon in selected:
-				
-			if not polygon.source.terrain_coords == (255,127,0):
-				if not polygon.source.terrain_coords is None:					
-					
-					if (terrainvalueX + polygon.source.terrain_coords[0]) < 0:
-						pass
-					elif (terrainvalueZ + polygon.source.terrain_coords[1]) < 0:
-						pass
-					else:
-						temp = list(polygon.source.terrain_coords)
-						temp[0] = terrainvalueX + polygon.source.terrain_coords[0]
-						temp[1] = terrainvalueZ + polygon.source.terrain_coords[1]
-						polygon.source.terrain_coords = tuple(temp)
-					
-			polygon.source.A.point.set_coords(polygon.source.A.point.X + valueX, polygon.source.A.point.Y + valueY, polygon.source.A.point.Z + valueZ)
-			polygon.source.B.point.set_coords(polygon.source.B.point.X + valueX, polygon.source.B.point.Y + valueY, polygon.source.B.point.Z + valueZ)
-			polygon.source.C.point.set_coords(polygon.source.C.point.X + valueX, polygon.source.C.point.Y + valueY, polygon.source.C.point.Z + valueZ)
-						
-			if hasattr(polygon.source, 'D'):
-				polygon.source.D.point.set_coords(polygon.source.D.point.X + valueX, polygon.source.D.point.Y + valueY, polygon.source.D.point.Z + valueZ)
-			
-			polygon.init_node_path()
-			if polygon.is_selected:
-				polygon.select()
-		
-		reset_polygon_id()
-		for polygon in self.polygons:
-			polygon_id = next_polygon_id()
-			polygon.node_path.setTag('polygon_i', str(polygon_id))
+			dz = sign * amount
+		self.translate_polygons(selected, dx, dy, dz, 'Move polygons')
+
+	# Transforms of many polygons at once. Each runs over the points of
+	# all the polygons in one pass, rewrites their geometry in place and
+	# is undone as one step. Pivots and offsets are in map coordinates.
+
+	def transform_polygons(self, polygons, matrix, offset=(0, 0, 0), normal_matrix=None, flip=False):
+		# Every point p becomes matrix * p + offset and every normal n
+		# becomes normal_matrix * n, normalized. flip swaps B and C, which
+		# turns mirrored polygons the right way out again.
+		((m11, m12, m13), (m21, m22, m23), (m31, m32, m33)) = matrix
+		(ox, oy, oz) = offset
+		for polygon in polygons:
+			source = polygon.source
+			for vertex in source.vertices():
+				(x, y, z) = vertex.point.coords
+				vertex.point.set_coords(
+					clamp_coord(m11 * x + m12 * y + m13 * z + ox),
+					clamp_coord(m21 * x + m22 * y + m23 * z + oy),
+					clamp_coord(m31 * x + m32 * y + m33 * z + oz))
+				if normal_matrix is not None and vertex.normal is not None:
+					vertex.normal.set_coords(*transform_normal(normal_matrix, vertex.normal.coords))
+			if flip:
+				(source.B, source.C) = (source.C, source.B)
+			polygon.update_vertices()
+			self.gizmos.update(polygon)
+
+	def rotate_polygons(self, polygons, plane, angle, pivot):
+		# Rotates in the plane of two axes ('XZ', 'XY' or 'ZY') by angle
+		# degrees; at 90 the first axis takes the value of the second and
+		# the second the negated value of the first. Quarter turns are exact.
+		from math import sin, cos, pi
+		if angle % 90 == 0:
+			(c, s) = [(1, 0), (0, 1), (-1, 0), (0, -1)][(angle // 90) % 4]
+		else:
+			c = cos(angle * pi / 180)
+			s = sin(angle * pi / 180)
+		axes = {'X': 0, 'Y': 1, 'Z': 2}
+		(a, b) = (axes[plane[0]], axes[plane[1]])
+		matrix = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+		matrix[a][a] = c
+		matrix[a][b] = s
+		matrix[b][a] = -s
+		matrix[b][b] = c
+		offset = [pivot[i] - sum([matrix[i][j] * pivot[j] for j in range(3)]) for i in range(3)]
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		self.transform_polygons(polygons, matrix, offset, matrix)
+		self.record_polygons('Rotate polygons', polygons, old_states)
+
+	def mirror_polygons(self, polygons, axis, pivot):
+		i = {'X': 0, 'Y': 1, 'Z': 2}[axis]
+		matrix = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+		matrix[i][i] = -1
+		offset = [0, 0, 0]
+		offset[i] = 2 * pivot[i]
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		self.transform_polygons(polygons, matrix, offset, matrix, True)
+		self.record_polygons('Mirror polygons', polygons, old_states)
+
+	def scale_polygons(self, polygons, scale, pivot):
+		(sx, sy, sz) = scale
+		matrix = [[sx, 0, 0], [0, sy, 0], [0, 0, sz]]
+		offset = [pivot[i] - scale[i] * pivot[i] for i in range(3)]
+		normal_matrix = None
+		if sx and sy and sz:
+			normal_matrix = [[1.0 / sx, 0, 0], [0, 1.0 / sy, 0], [0, 0, 1.0 / sz]]
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		self.transform_polygons(polygons, matrix, offset, normal_matrix, sx * sy * sz < 0)
+		self.record_polygons('Scale polygons', polygons, old_states)
+
+	def translate_polygons(self, polygons, dx, dy, dz, name='Translate polygons'):
+		# Moving by whole tiles moves the polygons' terrain coordinates
+		# along, unless that would take them off the map.
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		if dx % 28 == 0 and dz % 28 == 0 and (dx or dz):
+			for polygon in polygons:
+				coords = polygon.source.terrain_coords
+				if coords is None or coords[:2] == (255, 127):
+					continue
+				(tx, tz, level) = coords
+				if tx + dx // 28 < 0 or tz + dz // 28 < 0:
+					continue
+				self.set_polygon_terrain_coords(polygon, (tx + dx // 28, tz + dz // 28, level))
+		self.transform_polygons(polygons, [[1, 0, 0], [0, 1, 0], [0, 0, 1]], (dx, dy, dz))
+		self.record_polygons(name, polygons, old_states)
+
+	def snap_polygons(self, polygons):
+		# Moves every point to the nearest tile corner and height step.
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		for polygon in polygons:
+			for vertex in polygon.source.vertices():
+				(x, y, z) = vertex.point.coords
+				vertex.point.set_coords(
+					clamp_coord(round(x / 28.0) * 28),
+					clamp_coord(round(y / 12.0) * 12),
+					clamp_coord(round(z / 28.0) * 28))
+			polygon.update_vertices()
+			self.gizmos.update(polygon)
+		self.record_polygons('Snap polygons', polygons, old_states)
+
+	def recompute_normals(self, polygons, smooth=False):
+		# Gives the textured polygons flat normals, or with smooth the
+		# area-weighted average of the faces sharing each point. Points
+		# are shared when their coordinates are equal.
+		polygons = [polygon for polygon in polygons if polygon.source.A.normal is not None]
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		faces = []
+		for polygon in polygons:
+			source = polygon.source
+			# The cross product is twice the triangle's area long, so adding
+			# them up weights each face by its area.
+			(nx, ny, nz) = face_vector(source.A.point.coords, source.B.point.coords, source.C.point.coords)
+			if hasattr(source, 'D'):
+				(mx, my, mz) = face_vector(source.C.point.coords, source.B.point.coords, source.D.point.coords)
+				(nx, ny, nz) = (nx + mx, ny + my, nz + mz)
+			faces.append((nx, ny, nz))
+		if smooth:
+			sums = {}
+			for polygon, (nx, ny, nz) in zip(polygons, faces):
+				for vertex in polygon.source.vertices():
+					(sx, sy, sz) = sums.get(vertex.point.coords, (0, 0, 0))
+					sums[vertex.point.coords] = (sx + nx, sy + ny, sz + nz)
+		for polygon, face in zip(polygons, faces):
+			for vertex in polygon.source.vertices():
+				if smooth:
+					normal = sums[vertex.point.coords]
+				else:
+					normal = face
+				vertex.normal.set_coords(*quantize_normal(normal))
+			polygon.update_vertices()
+			self.gizmos.update(polygon)
+		self.record_polygons('Recompute normals', polygons, old_states)
+
+	def compute_visible_angles(self, polygons):
+		# Sets the camera angle bits of the given polygons' visible_angles
+		# from what can be seen of the whole map from each angle.
+		from ganesha import visibility
+		everything = self.polygons
+		points = [[vertex.point.coords for vertex in polygon.source.vertices()] for polygon in everything]
+		visible = visibility.solve(points)
+		order = dict([(polygon, i) for i, polygon in enumerate(everything)])
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		for polygon in polygons:
+			i = order[polygon]
+			angles = list(polygon.source.visible_angles)
+			for bit, seen in visible.items():
+				# A set bit hides the polygon.
+				angles[bit] = int(i not in seen)
+			polygon.source.visible_angles = angles
+		self.record_polygons('Compute visible angles', polygons, old_states)
+
+	def derive_terrain(self):
+		# Sets the height and slope of every tile that has textured floor
+		# polygons over it, on both levels, and gives those polygons the
+		# terrain coordinates of the tile they lie on. Tiles with no floor
+		# over them and the tiles' other settings are left alone.
+		from ganesha import terrain
+		polygons = [polygon for polygon in self.polygons if polygon.source.A.normal is not None]
+		points = [[vertex.point.coords for vertex in polygon.source.vertices()] for polygon in polygons]
+		tiles = self.terrain.tiles
+		(derived, polygon_coords) = terrain.derive(points, len(tiles[0][0]), len(tiles[0]), slope_types)
+		self.journal.begin('Derive terrain')
+		changed = [tiles[level][z][x] for (x, z, level) in derived.keys() if level < len(tiles)]
+		old_states = [self.tile_state(tile) for tile in changed]
+		for tile in changed:
+			(base, slope_type, slope_height) = derived[(tile.x, tile.z, tile.y)]
+			# The surface is drawn at height + depth.
+			tile.height = max(0, min(63, base - tile.depth))
+			tile.slope_type = slope_type
+			tile.slope_height = min(255, slope_height)
+		self.refresh_tiles(changed)
+		self.record_tiles('Derive terrain', changed, old_states)
+		moved = [polygons[i] for i in polygon_coords.keys()]
+		old_states = [self.polygon_state(polygon) for polygon in moved]
+		for i in polygon_coords.keys():
+			self.set_polygon_terrain_coords(polygons[i], polygon_coords[i])
+		self.record_polygons('Derive terrain', moved, old_states)
+		self.journal.end()
+
+	def polygons_center(self, polygons):
+		# Center of the bounding box of the polygons' points.
+		points = [vertex.point.coords for polygon in polygons for vertex in polygon.source.vertices()]
+		if not points:
+			return (0, 0, 0)
+		return tuple([(min([p[i] for p in points]) + max([p[i] for p in points])) // 2 for i in range(3)])
 
 	def resize_terrain(self, new_x, new_z):
 		tiles = []
@@ -1281,13 +1688,348 @@ class World(object):
 					row.append(tile)
 				level.append(row)
 			tiles.append(level)
-		self.terrain.tiles = tiles
+		old_tiles = self.terrain.tiles
+		self.set_terrain_tiles(['tiles'], [tiles])
+		self.journal.record('Resize terrain', self.set_terrain_tiles, ['tiles'], [old_tiles], [tiles], TILE_STATE_SIZE * 2 * new_x * new_z)
+
+	def set_terrain_tiles(self, keys, values):
+		if self.selection.kind is Tile:
+			self.selection.clear()
+		self.terrain.tiles = values[0]
 		self.terrain.init_node_path()
 
+	# Edits made in the windows change the map data straight away but
+	# leave the scene to a task that runs once a frame. Posting the same
+	# key again before then replaces the earlier update, so dragging a
+	# slider or typing rebuilds things at most once a frame.
+
+	def post_change(self, key, update, *args):
+		if not self.changes and not self.change_order:
+			taskMgr.add(self.apply_changes_task, 'apply_changes')
+		if key not in self.changes:
+			self.change_order.append(key)
+		self.changes[key] = (update, args)
+
+	def apply_changes_task(self, task):
+		self.apply_changes()
+		return task.done
+
+	def apply_changes(self):
+		changes = self.changes
+		change_order = self.change_order
+		self.changes = {}
+		self.change_order = []
+		for key in change_order:
+			(update, args) = changes[key]
+			update(*args)
+
+	def update_polygon(self, polygon):
+		# Polygons deleted since the change was posted are skipped.
+		if self.get_polygon(polygon.handle) is not polygon:
+			return
+		polygon.update_vertices()
+		self.gizmos.update(polygon)
+
+	def update_polygon_texture(self, polygon):
+		if self.get_polygon(polygon.handle) is not polygon:
+			return
+		polygon.update_texture()
+
+	def update_tile(self, tile):
+		try:
+			if self.terrain.tiles[tile.y][tile.z][tile.x] is not tile:
+				return
+		except IndexError:
+			return
+		self.refresh_tiles([tile])
+
+	def update_lights(self):
+		for i, light in enumerate(self.dir_lights):
+			light.init_node_path()
+			light.init_node_path_line(i)
+		self.amb_light.init_node_path()
+		self.background.init_node_path()
+
+	def import_texture(self, file_name):
+		old_data = self.texture.data
+		if self.texture.import_(file_name, self.color_palettes):
+			self.record_texture('Import texture', old_data)
+
+	def get_texel_usage(self, exclude=None):
+		# The texel usage of every textured polygon but exclude. Only the
+		# polygons whose UVs changed since the last call are filled again.
+		items = {}
+		for polygon in self.polygon_slots:
+			if polygon is None or polygon is exclude:
+				continue
+			uvs = polygon_uvs(polygon.source)
+			if uvs is not None:
+				items[polygon.handle] = uvs
+		self.texel_usage.sync(items)
+		return self.texel_usage
+
+	def free_texture_rectangles(self, page, min_width=8, min_height=8, limit=None):
+		# Areas of the texture page no polygon uses, as (u, v, width,
+		# height), biggest first.
+		return self.get_texel_usage().free_rectangles(page, min_width, min_height, limit)
+
+	def find_texture_duplicates(self, size=DEFAULT_BLOCK_SIZE):
+		# Groups of texture blocks with the same texels, and how many
+		# texels all but one copy of each take up.
+		return find_duplicates(self.texture.data, size)
+
+	def deduplicate_texture(self, size=DEFAULT_BLOCK_SIZE):
+		# Moves the UVs of the polygons that use copies of texture blocks
+		# onto the first copy, so the other copies are free to reuse.
+		items = {}
+		for polygon in self.polygons:
+			uvs = polygon_uvs(polygon.source)
+			if uvs is not None:
+				items[polygon] = uvs
+		moved = remap_blocks(items, self.texture.data, size)
+		polygons = moved.keys()
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		for polygon, (page, uvs) in moved.items():
+			polygon.source.texture_page = page
+			for vertex, uv in zip(polygon.source.vertices(), uvs):
+				vertex.texcoord.set_coords(*uv)
+			polygon.update_vertices()
+		self.record_polygons('Deduplicate texture', polygons, old_states)
+		return len(polygons)
+
+	def pack_uvs(self, polygons, sizes=None, name='Pack UVs'):
+		# Moves the UVs of the given textured polygons into texture space no
+		# other polygon uses. sizes maps polygons to the (width, height) in
+		# texels they should get; others keep the size they have. Returns
+		# the polygons that did not fit.
+		targets = {}
+		for polygon in polygons:
+			uvs = polygon_uvs(polygon.source)
+			if uvs is not None:
+				targets[polygon] = uvs
+		# The pages are searched from the texels the other polygons use,
+		# from the per texel usage rather than their UVs' bounding boxes.
+		usage = self.get_texel_usage()
+		exclude = [polygon.handle for polygon in targets]
+		used = {}
+		for page in range(PAGES):
+			used[page] = usage.used_rows(page, exclude)
+		wanted = {}
+		for polygon, (page, uvs) in targets.items():
+			if sizes is not None and polygon in sizes:
+				wanted[polygon] = sizes[polygon]
+			else:
+				wanted[polygon] = uv_rect(uvs)[2:]
+		placed = pack(wanted, used)
+		moved = placed.keys()
+		old_states = [self.polygon_state(polygon) for polygon in moved]
+		for polygon, (page, x, y) in placed.items():
+			(width, height) = wanted[polygon]
+			uvs = fit_uvs(targets[polygon][1], (x, y, width, height))
+			polygon.source.texture_page = page
+			for vertex, uv in zip(polygon.source.vertices(), uvs):
+				vertex.texcoord.set_coords(*uv)
+			polygon.update_vertices()
+		self.record_polygons(name, moved, old_states)
+		return [polygon for polygon in targets if polygon not in placed]
+
+	def merge_palettes(self, tolerance=0):
+		# Points the polygons that use a palette the same as an earlier one,
+		# within tolerance in each 5 bit channel, at the earlier one.
+		# Returns the palettes no polygon uses any more.
+		merged = merge_palettes([palette.colors.colors for palette in self.color_palettes], tolerance)
+		polygons = [polygon for polygon in self.polygons if polygon.source.A.texcoord is not None and polygon.source.texture_palette in merged]
+		old_states = [self.polygon_state(polygon) for polygon in polygons]
+		for polygon in polygons:
+			polygon.source.texture_palette = merged[polygon.source.texture_palette]
+			polygon.update_texture()
+		self.record_polygons('Merge palettes', polygons, old_states)
+		used = set([polygon.source.texture_palette for polygon in self.polygons if polygon.source.A.texcoord is not None])
+		freed = [palette for palette in merged.keys() if palette not in used]
+		freed.sort()
+		# Strips of the freed palettes are built again if they are needed.
+		for palette in freed:
+			self.texture.strips.pop(palette + 1, None)
+		return freed
+
+	def import_image(self, file_name, palette, region):
+		# Quantizes a true color PNG into the given palette and writes its
+		# indexes into region, (x, y, width, height) in texels, of the
+		# texture. The image is either the size of the region or of the
+		# whole texture, in which case only the region is used.
+		(x, y, width, height) = region
+		try:
+			(image_width, image_height, pixels) = read_rgba(file_name)
+		except PNGError, e:
+			print 'Texture Warning: Unable to read %s: %s' % (file_name, e)
+			return False
+		if (image_width, image_height) == (256, 1024) and (width, height) != (256, 1024):
+			pixels = [pixel for row in range(y, y + height) for pixel in pixels[row*256+x:row*256+x+width]]
+		elif (image_width, image_height) != (width, height):
+			print 'Texture Warning: %s is %ux%u, not %ux%u.' % (file_name, image_width, image_height, width, height)
+			return False
+		(colors, indexes) = quantize(pixels, len(self.color_palettes[palette].colors.colors))
+		self.journal.begin('Import image')
+		old_data = self.texture.data
+		self.texture.put_indexes(x, y, width, height, indexes)
+		self.texture.update()
+		self.record_texture('Import image', old_data)
+		old_states = [self.palette_state(palette)]
+		self.color_palettes[palette].colors.colors = colors
+		self.record_palettes('Import image', [palette], old_states)
+		self.journal.end()
+		return True
+
+	# Undo and redo. Each kind of edit has a *_state method that takes a
+	# small snapshot of one object, a set_*_states method that writes
+	# snapshots back, which the journal calls, and a record_* method the
+	# editing code calls with the snapshots taken before the edit.
+
+	def undo(self):
+		return self.journal.undo()
+
+	def redo(self):
+		return self.journal.redo()
+
+	def polygon_state(self, polygon):
+		source = polygon.source
+		vertices = []
+		for vertex in source.vertices():
+			normal = None
+			if vertex.normal is not None:
+				normal = vertex.normal.coords
+			texcoord = None
+			if vertex.texcoord is not None:
+				texcoord = vertex.texcoord.coords
+			vertices.append((vertex.point.coords, normal, texcoord))
+		unknowns = (source.unknown1, source.unknown2, source.unknown3, source.unknown4, source.unknown5)
+		return (tuple(vertices), source.texture_page, source.texture_palette, source.terrain_coords, tuple(source.visible_angles), unknowns)
+
+	def set_polygon_states(self, handles, states):
+		# A state of None deletes the polygon, a state for an empty slot
+		# puts the polygon back with its old handle.
+		import fft.map
+		for handle, state in zip(handles, states):
+			polygon = self.get_polygon(handle)
+			if state is None:
+				if polygon is not None:
+					self.delete_polygon(polygon)
+				continue
+			(vertices, page, palette, terrain_coords, visible_angles, unknowns) = state
+			if polygon is None:
+				polygon = Polygon(self)
+				if len(vertices) == 3:
+					polygon.source = fft.map.Triangle()
+				else:
+					polygon.source = fft.map.Quad()
+			else:
+				self.unindex_polygon(polygon)
+			source = polygon.source
+			for vertex, (point, normal, texcoord) in zip(source.vertices(), vertices):
+				vertex.point.set_coords(*point)
+				vertex.normal = None
+				if normal is not None:
+					vertex.normal = fft.map.VectorXYZ()
+					vertex.normal.set_coords(*normal)
+				vertex.texcoord = None
+				if texcoord is not None:
+					vertex.texcoord = fft.map.PointUV()
+					vertex.texcoord.set_coords(*texcoord)
+			source.texture_page = page
+			source.texture_palette = palette
+			source.terrain_coords = terrain_coords
+			source.visible_angles = list(visible_angles)
+			(source.unknown1, source.unknown2, source.unknown3, source.unknown4, source.unknown5) = unknowns
+			polygon.init_node_path()
+			if polygon.handle is None:
+				self.insert_polygon(polygon, handle)
+			else:
+				self.index_polygon(polygon)
+				self.selection.show(polygon)
+				self.gizmos.update(polygon)
+
+	def record_polygons(self, name, polygons, old_states):
+		handles = [polygon.handle for polygon in polygons]
+		new_states = [self.polygon_state(polygon) for polygon in polygons]
+		self.journal.record(name, self.set_polygon_states, handles, old_states, new_states, POLYGON_STATE_SIZE)
+
+	def tile_state(self, tile):
+		return (tile.surface_type, tile.height, tile.depth, tile.slope_height, tile.slope_type, tile.cant_walk, tile.cant_cursor, tile.unknown1, tile.unknown2, tile.unknown3, tile.unknown4, tile.unknown5)
+
+	def set_tile_states(self, coords, states):
+		tiles = []
+		for (x, y, z), state in zip(coords, states):
+			tile = self.terrain.tiles[y][z][x]
+			(tile.surface_type, tile.height, tile.depth, tile.slope_height, tile.slope_type, tile.cant_walk, tile.cant_cursor, tile.unknown1, tile.unknown2, tile.unknown3, tile.unknown4, tile.unknown5) = state
+			tiles.append(tile)
+		self.refresh_tiles(tiles)
+
+	def record_tiles(self, name, tiles, old_states):
+		coords = [(tile.x, tile.y, tile.z) for tile in tiles]
+		new_states = [self.tile_state(tile) for tile in tiles]
+		self.journal.record(name, self.set_tile_states, coords, old_states, new_states, TILE_STATE_SIZE)
+
+	def palette_state(self, palette):
+		return tuple(self.color_palettes[palette].colors.colors)
+
+	def set_palette_states(self, palettes, states):
+		for palette, state in zip(palettes, states):
+			self.color_palettes[palette].colors.colors = list(state)
+		self.texture.update(self.color_palettes, [palette + 1 for palette in palettes])
+
+	def record_palettes(self, name, palettes, old_states):
+		# Also shows the new colors, which the palette editor leaves to us.
+		new_states = [self.palette_state(palette) for palette in palettes]
+		self.texture.update(self.color_palettes, [palette + 1 for palette in palettes])
+		self.journal.record(name, self.set_palette_states, palettes, old_states, new_states, PALETTE_STATE_SIZE)
+
+	def set_texture_rows(self, rows, values):
+		data = self.texture.data
+		lines = [data[y*TEXTURE_ROW_BYTES:(y+1)*TEXTURE_ROW_BYTES] for y in range(len(data) / TEXTURE_ROW_BYTES)]
+		for y, value in zip(rows, values):
+			lines[y] = value
+		self.texture.data = ''.join(lines)
+		self.texture.update()
+
+	def record_texture(self, name, old_data):
+		# Only the rows of the texture that changed are kept.
+		new_data = self.texture.data
+		rows = []
+		old_values = []
+		new_values = []
+		for y in range(len(new_data) / TEXTURE_ROW_BYTES):
+			old_row = old_data[y*TEXTURE_ROW_BYTES:(y+1)*TEXTURE_ROW_BYTES]
+			new_row = new_data[y*TEXTURE_ROW_BYTES:(y+1)*TEXTURE_ROW_BYTES]
+			if old_row != new_row:
+				rows.append(y)
+				old_values.append(old_row)
+				new_values.append(new_row)
+		self.journal.record(name, self.set_texture_rows, rows, old_values, new_values, TEXTURE_ROW_SIZE)
+
+	def light_state(self):
+		dir_lights = []
+		for light in self.dir_lights:
+			dir_lights.append((tuple(light.color), tuple(light.direction.coords)))
+		return (tuple(dir_lights), tuple(self.amb_light.color), tuple(self.background.color1), tuple(self.background.color2))
+
+	def set_light_states(self, keys, states):
+		(dir_lights, amb_color, background_color1, background_color2) = states[0]
+		for i, (color, direction) in enumerate(dir_lights):
+			light = self.dir_lights[i]
+			light.color = color
+			light.direction.set_coords(*direction)
+		self.amb_light.color = amb_color
+		self.background.color1 = background_color1
+		self.background.color2 = background_color2
+		self.update_lights()
+
+	def record_lights(self, name, old_state):
+		# Dragging a slider edits the lights many times in a row; those
+		# edits are undone together.
+		self.journal.record(name, self.set_light_states, ['lights'], [old_state], [self.light_state()], LIGHT_STATE_SIZE, True)
+
 	def put_texture(self):
-		texture = Texture()
-		texture_data = texture.to_data(self.texture)
-		self.map.put_texture(texture_data)
+		self.map.put_texture_data(self.texture.data)
 
 	def put_polygons(self):
 		polygons = self.polygons
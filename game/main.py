@@ -5,18 +5,62 @@
 # a Final Fantasy Tactics Map Editor
 # Don Laursen, 2009
 
+from optparse import OptionParser
+
+parser = OptionParser(usage='%prog [options] [GNS file or directory...]')
+parser.add_option('--export-textures', metavar='DIR',
+        help='write the textures of the given maps with every palette '
+        'to DIR as PNGs, without opening the editor')
+parser.add_option('--free-texels', action='store_true',
+        help='list the areas of each texture page that no polygon of the '
+        'given maps uses, without opening the editor')
+parser.add_option('--startup-timing', action='store_true',
+        help='print how long each step of starting the editor takes, up '
+        'to the first frame')
+parser.add_option('--profile', metavar='FILE',
+        help='time reading, decoding, building and saving maps, and write '
+        'the times to FILE as a Chrome trace')
+parser.add_option('--profile-stats', metavar='DIR',
+        help='with --profile, also write cProfile stats of each phase to DIR')
+parser.add_option('--debug', action='store_true',
+        help='print each chunk and texture read from the map files')
+(options, args) = parser.parse_args()
+
 map_viewer = None
 try:
     import os, sys
-    from ganesha.ui import Map_Viewer
 
-    try:
-        gns_path = sys.argv[1]
-    except IndexError:
-        gns_path = None
+    if options.debug:
+        import fft
+        fft.debug = True
+
+    if options.profile:
+        from ganesha import profiler
+        editor = not (options.export_textures or options.free_texels)
+        profiler.enable(options.profile, options.profile_stats, editor)
+
+    if options.export_textures:
+        from ganesha.batch import export_textures
+        count = export_textures(args, options.export_textures)
+        print 'Exported %u textures.' % count
+    elif options.free_texels:
+        from ganesha.batch import print_free_texels
+        print_free_texels(args)
+    else:
+        import time
+        start_time = time.time()
+        from ganesha.ui import Map_Viewer
+
+        try:
+            gns_path = args[0]
+        except IndexError:
+            gns_path = None
 
-    map_viewer = Map_Viewer()
-    map_viewer.start(gns_path)
+        if options.startup_timing:
+            map_viewer = Map_Viewer(startup_time=start_time)
+        else:
+            map_viewer = Map_Viewer()
+        map_viewer.start(gns_path)
 except:
     if map_viewer is not None:
         if hasattr(map_viewer, 'showbase'):